@@ -0,0 +1,670 @@
+from __future__ import print_function
+from __future__ import absolute_import
+
+""" PLC Factory: Benchmarks """
+
+__author__     = "Krisztian Loki"
+__copyright__  = "Copyright 2021, European Spallation Source, Lund"
+__license__    = "GPLv3"
+
+
+# Python libraries
+import codecs
+import os
+import random
+import tempfile
+import time
+
+# PLC Factory modules
+from cc import CC
+from ccdb_dump import CCDB_Dump
+from ccdb_factory import CCDB_Factory
+from fixtures import bfs_backtrack, linear_similar, mistype, set_controls_list, synthetic_dump, synthetic_names, synthetic_slots, synthetic_tree
+import levenshtein
+from name_index import NameIndex
+from plcf import PLCF, PLCFException, PLCFNoWordException
+import plcf_glob
+from safe_eval import SafeEvaluator
+
+
+
+def timeit(func, *args, **kwargs):
+    """
+    Returns (result of func, elapsed seconds)
+    """
+    start = time.time()
+    result = func(*args, **kwargs)
+    return (result, time.time() - start)
+
+
+def sample_template_lines(plcf_only = True, suffix = ""):
+    """
+    Returns the lines of the sample templates (ending with 'suffix') that have a PLCF# expression (or every line)
+    """
+    directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sample_templates")
+    lines = []
+    for fname in sorted(os.listdir(directory)):
+        if not fname.endswith(suffix):
+            continue
+        with open(os.path.join(directory, fname)) as f:
+            lines.extend(line for line in f if not plcf_only or PLCF.plcf_tag in line)
+
+    return lines
+
+
+def sample_plc(props):
+    """
+    Returns a PLC with the properties used by the sample templates and 'props' other properties
+    """
+    factory = CCDB_Factory()
+    plc     = factory.addPLC("PLC")
+    for i in range(props):
+        # Some of the property names are not single words, like the ones of the PLC
+        plc.setProperty("PLCF#PLC-EPICS-COMMS: Property{}".format(i) if i % 4 == 0 else "PLCF#Property{}".format(i), i)
+    plc.setProperty("PLCF#StatusWordsLength", 10)
+    plc.setProperty("PLCF#CommandWordsLength", 5)
+    plcf_glob.root_installation_slot = plc.name()
+    plcf_glob.timestamp              = "20210101000000"
+
+    return plc
+
+
+
+class TextualPLCF(PLCF):
+    """
+    Substitutes every expression textually (_substituteAndEvaluate())
+    """
+    def _evaluateExpression(self, expression):
+        return self._substituteAndEvaluate(expression)
+
+
+
+class LinearPLCF(TextualPLCF):
+    """
+    The original property lookup of _substituteAndEvaluate(); trying every property name from the longest to the shortest
+    """
+    def _next_property(self, expression):
+        for elem in self._keys:
+            if elem in expression:
+                if self._properties.get(elem) is None:
+                    raise PLCFException("Property '{}' has no value. Fix CCDB configuration: {}".format(elem, self._device.url()))
+                try:
+                    PLCF.wordIndex(expression, elem)
+                    return elem
+                except PLCFNoWordException:
+                    pass
+
+        return None
+
+
+
+class RecordingPLCF(PLCF):
+    """
+    Records the expressions that are evaluated (after substitution)
+    """
+    expressions = []
+
+    def _evaluate(self, expression):
+        RecordingPLCF.expressions.append(expression)
+        return super(RecordingPLCF, self)._evaluate(expression)
+
+
+
+def eval_evaluate(expression, evalenv):
+    """
+    The original algorithm of PLCF._evaluate(); eval() every time
+    """
+    wasquoted = False
+    if (expression.startswith('"') and expression.endswith('"') and expression.count('"') == 2) or \
+       (expression.startswith("'") and expression.endswith("'") and expression.count("'") == 2):
+        wasquoted = expression[0]
+
+    if "ext." in expression:
+        return str(eval(expression, evalenv))
+
+    try:
+        result = eval(expression, dict())
+        if wasquoted:
+            result = wasquoted + result + wasquoted
+    except (SyntaxError, NameError):
+        result = expression
+
+    return str(result)
+
+
+
+def linear_eval_counters(lines):
+    """
+    The original PLCF.evalCounters(); every counter is looked for with wordIndex() in every line
+    """
+    counters = PLCF.initializeCounters()
+    output   = []
+    for line in lines:
+        if PLCF.plcf_tag in line:
+            if PLCF.plcf_counter_tag not in line:
+                s = 0
+                while True:
+                    (_, _, e) = PLCF.getPLCFExpression(line[s:])
+                    if e is None:
+                        break
+                    s += e + 1
+
+                for key in counters.keys():
+                    try:
+                        while True:
+                            (line, _) = PLCF.substituteWord(line, key, str(counters[key]), True)
+                    except PLCFNoWordException:
+                        pass
+
+                while True:
+                    (start, expression, end) = PLCF.getPLCFExpression(line)
+                    if expression is None:
+                        break
+                    try:
+                        result = eval(expression)
+                    except (SyntaxError, NameError):
+                        result = expression
+                    line = line[:start] + str(result) + line[end + 1:]
+            else:
+                (pos, _, _) = PLCF.getPLCFExpression(line)
+                post = line[pos:]
+                for key in counters.keys():
+                    try:
+                        (post, _) = PLCF.substituteWord(post, key, str(counters[key]))
+                    except PLCFNoWordException:
+                        pass
+                line = line[:pos] + post
+
+                (start, expression, end) = PLCF.getPLCFExpression(line)
+                counters[line.split()[1]] = eval(expression)
+                line = line[:start] + str(counters[line.split()[1]]) + line[end + 1:]
+
+            if PLCF.plcf_tag in line:
+                raise PLCFException("Leftover PLCF# expression in line: {line}".format(line = line))
+
+        output.append(line)
+
+    return output
+
+
+
+def bench_names(args):
+    rnd     = random.Random(args.seed)
+    names   = synthetic_names(args.names, args.seed)
+    queries = [ mistype(rnd.choice(names), rnd) for _ in range(args.queries) ]
+    # Mistyped System-Subsystem part; no filtering
+    queries += [ mistype(q.split(":")[0], rnd) + ":" + q.split(":")[1] for q in queries[:args.queries // 2] ]
+
+    print("{} names, {} queries".format(len(names), len(queries)))
+
+    (index, elapsed) = timeit(NameIndex, names)
+    print("Building the index:  {:8.3f} s".format(elapsed))
+
+    index_time  = 0
+    linear_time = 0
+    for q in queries:
+        (result, elapsed) = timeit(index.similar, q)
+        index_time += elapsed
+
+        if not args.no_linear:
+            (expected, elapsed) = timeit(linear_similar, names, q)
+            linear_time += elapsed
+            assert result == expected, "{}: {} != {}".format(q, result, expected)
+
+    print("Indexed search:      {:8.3f} ms/query".format(1000 * index_time / len(queries)))
+    if not args.no_linear:
+        print("Linear scan:         {:8.3f} ms/query".format(1000 * linear_time / len(queries)))
+
+
+def bench_levenshtein(args):
+    rnd     = random.Random(args.seed)
+    names   = synthetic_names(args.names, args.seed)
+    queries = [ mistype(rnd.choice(names), rnd) for _ in range(args.queries) ]
+
+    print("{} names, {} queries".format(len(names), len(queries)))
+
+    dp_time = 0
+    if not args.no_dp:
+        for q in queries:
+            (_, elapsed) = timeit(lambda: [ levenshtein._distance_dp(q, name) for name in names ])
+            dp_time += elapsed
+        print("Textbook DP:         {:8.3f} ms/query".format(1000 * dp_time / len(queries)))
+
+    for (label, func) in [ ("distance()", lambda q: [ levenshtein.distance(q, name) for name in names ]),
+                           ("distances()", lambda q: levenshtein.distances(q, names)),
+                           ("distances(max 3)", lambda q: levenshtein.distances(q, names, 3)) ]:
+        elapsed = sum(timeit(func, q)[1] for q in queries)
+        print("{:20} {:8.3f} ms/query".format(label + ":", 1000 * elapsed / len(queries)))
+
+
+
+def bench_backtrack(args):
+    (factory, root) = synthetic_tree(args.devices, args.props, args.seed)
+    devices = root.buildControlsList(include_self = True)
+    props   = [ "P{}".format(i) for i in range(args.props) ]
+
+    print("{} devices, {} properties".format(len(devices), len(props)))
+
+    def backtrack_all(func):
+        result = []
+        for device in devices:
+            for prop in props:
+                try:
+                    result.append(func(device, prop))
+                except CC.Exception:
+                    result.append(None)
+        return result
+
+    (result, elapsed) = timeit(backtrack_all, lambda device, prop: device.backtrack(prop))
+    print("Ancestor index:      {:8.3f} s".format(elapsed))
+
+    (result, elapsed) = timeit(backtrack_all, lambda device, prop: device.backtrack(prop))
+    print("Ancestor index (2nd):{:8.3f} s".format(elapsed))
+
+    if not args.no_bfs:
+        (expected, elapsed) = timeit(backtrack_all, bfs_backtrack)
+        print("BFS:                 {:8.3f} s".format(elapsed))
+        assert result == expected
+
+
+
+def bench_devices(args):
+    # Python3 only
+    import tracemalloc
+
+    slots = synthetic_slots(args.devices, args.props, args.seed)
+
+    print("{} devices, {} properties".format(len(slots), args.props))
+
+    tracemalloc.start()
+    dump = synthetic_dump(slots)
+    devices = list(dump._devices.values())
+    for device in devices:
+        device.propertiesDict()
+        device.controls()
+        device.controlledBy()
+        device.artifacts()
+    print("Memory:              {:8.0f} bytes/device".format(tracemalloc.get_traced_memory()[0] / len(devices)))
+    tracemalloc.stop()
+
+    def access():
+        for device in devices:
+            device.properties()
+            device.propertiesDict()
+            device.controls()
+            device.controlledBy()
+            device.artifacts()
+
+    (_, elapsed) = timeit(lambda: [ access() for _ in range(args.repeat) ])
+    print("Accessors:           {:8.3f} us/device".format(1000000 * elapsed / len(devices) / args.repeat))
+
+
+
+def bench_controls(args):
+    dump = synthetic_dump(synthetic_slots(args.devices, 1, args.seed))
+    root = dump.device(dump.getAllDeviceNames()[0])
+    # The first few devices control smaller subtrees
+    roots = [ root ] + [ dump.device(name) for name in dump.getAllDeviceNames()[1:args.roots] ]
+
+    print("{} devices, {} roots".format(len(dump.getAllDeviceNames()), len(roots)))
+
+    (result, elapsed) = timeit(lambda: [ r.buildControlsList() for r in roots ])
+    print("Controls graph:      {:8.3f} s".format(elapsed))
+
+    (_, elapsed) = timeit(lambda: [ [ r.buildControlsList() for r in roots ] for _ in range(args.repeat) ])
+    print("Memoized:            {:8.3f} s".format(elapsed / args.repeat))
+
+    if not args.no_set:
+        (expected, elapsed) = timeit(lambda: [ set_controls_list(r) for r in roots ])
+        print("Set traversal:       {:8.3f} s".format(elapsed))
+        assert result == expected
+
+
+
+def in_child(func, *args):
+    """
+    Runs func in a forked process (Linux only)
+
+    Returns (result of func, elapsed seconds, peak RSS increase in MiB)
+    """
+    import multiprocessing
+    import resource
+
+    def rss():
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize() / 1048576.0
+
+    def child(conn):
+        start_rss = rss()
+        (result, elapsed) = timeit(func, *args)
+        # ru_maxrss is in KiB
+        conn.send((result, elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0 - start_rss))
+        conn.close()
+
+    ctx = multiprocessing.get_context("fork")
+    (parent_conn, child_conn) = ctx.Pipe()
+    process = ctx.Process(target = child, args = (child_conn, ))
+    process.start()
+    result = parent_conn.recv()
+    process.join()
+
+    return result
+
+
+def bench_dump(args):
+    slots = synthetic_slots(args.devices, args.props, args.seed)
+    (fd, filename) = tempfile.mkstemp(suffix = CC.CCDB_ZIP_SUFFIX)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            CC.save(synthetic_dump(slots), f)
+        del slots
+        print("{} devices, {} properties: {:.1f} MiB".format(args.devices, args.props, os.path.getsize(filename) / 1048576.0))
+
+        def load(what):
+            dump = CCDB_Dump.ZipDump(filename)
+            if what == CC.DEVICE_INDEX:
+                return dump
+
+            dump._index = None
+            if what == CC.DEVICE_DICT:
+                dump._createDevices(dump._read(CC.DEVICE_DICT))
+            else:
+                with dump._open(CC.DEVICE_JSON) as f:
+                    dump._createDevicesFromJSON(codecs.getreader("utf-8")(f))
+
+            return dump
+
+        # The device with the biggest controls tree among the last 10% of devices
+        dump  = load(CC.DEVICE_INDEX)
+        names = dump.getAllDeviceNames()
+        name  = max(names[-max(len(names) // 10, 1):], key = lambda n: len(dump.device(n).buildControlsList()))
+        # release it before the children are forked (cannot 'del' it; the lambda above refers to it)
+        dump  = None
+
+        def load_subtree(what):
+            (dump, load_time) = timeit(load, what)
+            device = dump.device(name)
+            return (load_time, [ device.name() ] + [ d.name() for d in device.buildControlsList() ])
+
+        expected = None
+        for what in (CC.DEVICE_DICT, CC.DEVICE_JSON, CC.DEVICE_INDEX):
+            ((load_time, result), elapsed, peak) = in_child(load_subtree, what)
+            print("{:20} {:8.3f} s, subtree: {:8.3f} s, peak RSS: +{:6.1f} MiB".format(what + ":", load_time, elapsed - load_time, peak))
+            assert expected is None or result == expected
+            expected = result
+        print("Subtree: {} devices".format(len(expected)))
+    finally:
+        os.unlink(filename)
+
+
+
+def bench_save(args):
+    dump = synthetic_dump(synthetic_slots(args.devices, args.props, args.seed))
+    print("{} devices, {} properties".format(args.devices, args.props))
+
+    (fd, filename) = tempfile.mkstemp(suffix = CC.CCDB_ZIP_SUFFIX)
+    os.close(fd)
+    try:
+        def save(**kwargs):
+            with open(filename, "wb") as f:
+                CC.save(dump, f, **kwargs)
+
+        (_, elapsed) = timeit(save)
+        print("First save:          {:8.3f} s".format(elapsed))
+
+        (_, elapsed) = timeit(save)
+        print("Cached fragments:    {:8.3f} s".format(elapsed))
+
+        for device in dump._devices.values():
+            device._fragments = None
+        (_, elapsed) = timeit(save, libyaml = True)
+        print("libyaml:             {:8.3f} s".format(elapsed))
+
+        (_, elapsed) = timeit(save, formats = ())
+        print("Device records only: {:8.3f} s".format(elapsed))
+    finally:
+        os.unlink(filename)
+
+
+
+def bench_plcf(args):
+    lines = sample_template_lines()
+    plc   = sample_plc(args.props)
+
+    print("{} lines with PLCF# expressions, {} properties".format(len(lines), len(plc.propertiesDict())))
+
+    def process(cls):
+        result = []
+        for _ in range(args.repeat):
+            plcf = cls(plc)
+            plcf.register_template("SAMPLE")
+            result = plcf.process(lines)
+        return result
+
+    (expected, elapsed) = timeit(process, LinearPLCF)
+    print("Linear key scan:     {:8.3f} ms/line".format(1000 * elapsed / (len(lines) * args.repeat)))
+
+    (result, elapsed) = timeit(process, TextualPLCF)
+    print("Aho-Corasick:        {:8.3f} ms/line".format(1000 * elapsed / (len(lines) * args.repeat)))
+    assert result == expected
+
+    (result, elapsed) = timeit(process, PLCF)
+    print("Compiled segments:   {:8.3f} ms/line".format(1000 * elapsed / (len(lines) * args.repeat)))
+    assert result == expected
+
+
+
+def bench_counters(args):
+    plc       = sample_plc(0)
+    plcf      = PLCF(plc)
+    plcf.register_template("SAMPLE")
+    templates = plcf.process(sample_template_lines(plcf_only = False, suffix = "_EPICS-DB.txt"))
+    lines     = []
+    while len(lines) < args.lines:
+        lines.extend(templates)
+
+    print("{} lines, {} with PLCF# expressions".format(len(lines), sum(1 for line in lines if PLCF.plcf_tag in line)))
+
+    (expected, elapsed) = timeit(linear_eval_counters, lines)
+    print("Original:            {:8.3f} s".format(elapsed))
+
+    ((result, _), elapsed) = timeit(PLCF.evalCounters, lines)
+    print("evalCounters:        {:8.3f} s".format(elapsed))
+    assert result == expected
+
+    def write():
+        with open(os.devnull, "w") as f:
+            for line in PLCF.iterCounters(lines):
+                print(line.rstrip(), file = f)
+    (_, elapsed) = timeit(write)
+    print("iterCounters+write:  {:8.3f} s".format(elapsed))
+
+
+
+def bench_eval(args):
+    import plcf_ext
+    import sys
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "template_factory"))
+    from tf_ifdef import IF_DEF
+
+    plcf = RecordingPLCF(sample_plc(0))
+    plcf.register_template("SAMPLE")
+    plcf.process(sample_template_lines())
+    expressions = RecordingPLCF.expressions * args.repeat
+    evalenv     = { "ext": plcf_ext }
+
+    print("{} PLCF# expressions ({} different)".format(len(expressions), len(set(expressions))))
+
+    (expected, elapsed) = timeit(lambda: [ eval_evaluate(expression, evalenv) for expression in expressions ])
+    print("eval():              {:8.3f} us/expression".format(1000000 * elapsed / len(expressions)))
+
+    (result, elapsed) = timeit(lambda: [ plcf._evaluate(expression) for expression in expressions ])
+    print("SafeEvaluator:       {:8.3f} us/expression".format(1000000 * elapsed / len(expressions)))
+    assert result == expected
+
+    def_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "template_factory", "every.def")
+    with open(def_file) as f:
+        def_lines = sum(1 for line in f if line.strip() and not line.lstrip().startswith("#"))
+
+    print("{} interface definition lines".format(def_lines))
+
+    def parse(**keyword_params):
+        # every.def has warnings
+        (stdout, sys.stdout) = (sys.stdout, open(os.devnull, "w"))
+        try:
+            for _ in range(args.repeat):
+                IF_DEF.parse(def_file, QUIET = True, **keyword_params)
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+
+    # without an EVALUATOR every line is eval()-ed
+    (_, elapsed) = timeit(parse)
+    print("eval():              {:8.3f} us/line".format(1000000 * elapsed / (def_lines * args.repeat)))
+
+    evaluator = SafeEvaluator(true_division = True)
+    (_, elapsed) = timeit(lambda: parse(EVALUATOR = evaluator))
+    print("SafeEvaluator:       {:8.3f} us/line".format(1000000 * elapsed / (def_lines * args.repeat)))
+
+
+
+def main(argv):
+    import argparse
+
+    parser = argparse.ArgumentParser(description = "PLC Factory benchmarks")
+    parser.add_argument("--seed",
+                        help    = "random seed. Default: 0",
+                        type    = int,
+                        default = 0)
+    subparsers = parser.add_subparsers(title = "benchmarks", dest = "benchmark")
+    subparsers.required = True
+
+    names_parser = subparsers.add_parser("names", help = "Similar device name search (getSimilarDeviceNames)")
+    names_parser.add_argument("--names",
+                              help    = "number of device names. Default: 20000",
+                              type    = int,
+                              default = 20000)
+    names_parser.add_argument("--queries",
+                              help    = "number of queries. Default: 20",
+                              type    = int,
+                              default = 20)
+    names_parser.add_argument("--no-linear",
+                              help    = "do not run (and compare against) the linear scan",
+                              action  = "store_true")
+    names_parser.set_defaults(func = bench_names)
+
+    lev_parser = subparsers.add_parser("levenshtein", help = "Levenshtein distance of a name and every device name")
+    lev_parser.add_argument("--names",
+                            help    = "number of device names. Default: 20000",
+                            type    = int,
+                            default = 20000)
+    lev_parser.add_argument("--queries",
+                            help    = "number of queries. Default: 5",
+                            type    = int,
+                            default = 5)
+    lev_parser.add_argument("--no-dp",
+                            help    = "do not run the textbook implementation",
+                            action  = "store_true")
+    lev_parser.set_defaults(func = bench_levenshtein)
+
+    backtrack_parser = subparsers.add_parser("backtrack", help = "^(PROPERTY) lookups (CC._backtrack)")
+    backtrack_parser.add_argument("--devices",
+                                  help    = "number of devices. Default: 5000",
+                                  type    = int,
+                                  default = 5000)
+    backtrack_parser.add_argument("--props",
+                                  help    = "number of properties. Default: 10",
+                                  type    = int,
+                                  default = 10)
+    backtrack_parser.add_argument("--no-bfs",
+                                  help    = "do not run (and compare against) the original BFS",
+                                  action  = "store_true")
+    backtrack_parser.set_defaults(func = bench_backtrack)
+
+    devices_parser = subparsers.add_parser("devices", help = "Memory usage and accessors of devices")
+    devices_parser.add_argument("--devices",
+                                help    = "number of devices. Default: 5000",
+                                type    = int,
+                                default = 5000)
+    devices_parser.add_argument("--props",
+                                help    = "number of properties per device. Default: 30",
+                                type    = int,
+                                default = 30)
+    devices_parser.add_argument("--repeat",
+                                help    = "number of times the accessors are called. Default: 10",
+                                type    = int,
+                                default = 10)
+    devices_parser.set_defaults(func = bench_devices)
+
+    controls_parser = subparsers.add_parser("controls", help = "Transitive controls list (buildControlsList)")
+    controls_parser.add_argument("--devices",
+                                 help    = "number of devices. Default: 20000",
+                                 type    = int,
+                                 default = 20000)
+    controls_parser.add_argument("--roots",
+                                 help    = "number of root devices. Default: 10",
+                                 type    = int,
+                                 default = 10)
+    controls_parser.add_argument("--repeat",
+                                 help    = "number of times the memoized lists are requested. Default: 10",
+                                 type    = int,
+                                 default = 10)
+    controls_parser.add_argument("--no-set",
+                                 help    = "do not run (and compare against) the original traversal",
+                                 action  = "store_true")
+    controls_parser.set_defaults(func = bench_controls)
+
+    dump_parser = subparsers.add_parser("dump", help = "Loading a CCDB dump")
+    dump_parser.add_argument("--devices",
+                             help    = "number of devices. Default: 5000",
+                             type    = int,
+                             default = 5000)
+    dump_parser.add_argument("--props",
+                             help    = "number of properties per device. Default: 30",
+                             type    = int,
+                             default = 30)
+    dump_parser.set_defaults(func = bench_dump)
+
+    save_parser = subparsers.add_parser("save", help = "Saving a CCDB dump (CC.save)")
+    save_parser.add_argument("--devices",
+                             help    = "number of devices. Default: 5000",
+                             type    = int,
+                             default = 5000)
+    save_parser.add_argument("--props",
+                             help    = "number of properties per device. Default: 30",
+                             type    = int,
+                             default = 30)
+    save_parser.set_defaults(func = bench_save)
+
+    plcf_parser = subparsers.add_parser("plcf", help = "PLCF# expressions of the sample templates")
+    plcf_parser.add_argument("--props",
+                             help    = "number of properties of the device. Default: 200",
+                             type    = int,
+                             default = 200)
+    plcf_parser.add_argument("--repeat",
+                             help    = "number of times the templates are processed. Default: 10",
+                             type    = int,
+                             default = 10)
+    plcf_parser.set_defaults(func = bench_plcf)
+
+    counters_parser = subparsers.add_parser("counters", help = "Counter evaluation of an EPICS database (PLCF.evalCounters)")
+    counters_parser.add_argument("--lines",
+                                 help    = "number of lines. Default: 100000",
+                                 type    = int,
+                                 default = 100000)
+    counters_parser.set_defaults(func = bench_counters)
+
+    eval_parser = subparsers.add_parser("eval", help = "Evaluation of PLCF# expressions and interface definition lines")
+    eval_parser.add_argument("--repeat",
+                             help    = "number of times the expressions are evaluated. Default: 100",
+                             type    = int,
+                             default = 100)
+    eval_parser.set_defaults(func = bench_eval)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    import sys
+    main(sys.argv[1:])
@@ -0,0 +1,239 @@
+from __future__ import print_function
+from __future__ import absolute_import
+
+""" PLC Factory: Content addressed artifact store """
+
+__author__     = "Krisztian Loki"
+__copyright__  = "Copyright 2021, European Spallation Source, Lund"
+__license__    = "GPLv3"
+
+
+# Python libraries
+import hashlib
+import os
+from shutil import copyfileobj
+import stat
+import tempfile
+import threading
+
+# PLC Factory modules
+import helpers
+
+
+
+class BlobStore(object):
+    """
+    Stores files by the SHA-256 of their content
+
+    Identical artifacts (of different devices, runs or CCDB dumps) are stored only once. Files are handed out
+    as hard links to the stored copy where possible so they do not take up extra space either.
+    Blobs are never modified; every write goes to a temporary file that is then renamed. Blobs are read-only so that
+    editing a linked file in place fails instead of corrupting the store.
+    The least recently used blobs are evicted once the size of the store exceeds 'max_size' bytes (if it is not None).
+    """
+    BUFFER_SIZE = 1024 * 1024
+    MAX_SIZE    = 1024 * 1024 * 1024
+    # Read-only files cannot simply be removed on Windows; hand out copies there
+    HARD_LINKS  = os.name != "nt"
+
+    def __init__(self, directory = None, max_size = MAX_SIZE):
+        if directory is None:
+            directory = helpers.create_cache_dir("ccdb", "blobs")
+        else:
+            helpers.makedirs(directory)
+
+        self._directory = directory
+        self._max_size  = max_size
+        self._size      = None
+        self._lock      = threading.Lock()
+
+        self.stored  = 0
+        self.reused  = 0
+        self.evicted = 0
+
+
+    @staticmethod
+    def digest_of(f):
+        """
+        Returns the SHA-256 (in hex) of the content of binary file object 'f'
+        """
+        sha = hashlib.sha256()
+        for data in iter(lambda: f.read(BlobStore.BUFFER_SIZE), b""):
+            sha.update(data)
+
+        return sha.hexdigest()
+
+
+    def path(self, digest):
+        return os.path.join(self._directory, digest[:2], digest)
+
+
+    def has(self, digest):
+        return os.path.exists(self.path(digest))
+
+
+    def _touch(self, digest):
+        """
+        Marks blob 'digest' as recently used
+        """
+        try:
+            os.utime(self.path(digest), None)
+        except OSError:
+            pass
+
+
+    def open(self, digest):
+        """
+        Returns the blob 'digest' as a binary file object
+        """
+        f = open(self.path(digest), "rb")
+        self._touch(digest)
+
+        return f
+
+
+    def digests(self):
+        """
+        Yields the digest of every stored blob
+        """
+        for (dirpath, dirnames, filenames) in os.walk(self._directory):
+            for fname in filenames:
+                # Skip unfinished writes
+                if not fname.startswith("."):
+                    yield fname
+
+
+    def remove(self, digest):
+        """
+        Removes blob 'digest'; files linked to it are not affected
+        """
+        try:
+            if not self.HARD_LINKS:
+                os.chmod(self.path(digest), stat.S_IWRITE)
+            os.unlink(self.path(digest))
+        except OSError:
+            if self.has(digest):
+                raise
+
+
+    def _tempfile(self, directory):
+        helpers.makedirs(directory)
+        return tempfile.mkstemp(dir = directory, prefix = ".", suffix = ".part")
+
+
+    def put(self, f):
+        """
+        Stores the content of binary file object 'f'. Returns its digest
+        """
+        (fd, tmp) = self._tempfile(self._directory)
+        try:
+            sha = hashlib.sha256()
+            with os.fdopen(fd, "wb") as w:
+                for data in iter(lambda: f.read(BlobStore.BUFFER_SIZE), b""):
+                    sha.update(data)
+                    w.write(data)
+
+            digest = sha.hexdigest()
+            if self.has(digest):
+                os.unlink(tmp)
+                self._touch(digest)
+                with self._lock:
+                    self.reused += 1
+            else:
+                size = os.path.getsize(tmp)
+                os.chmod(tmp, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+                helpers.makedirs(os.path.dirname(self.path(digest)))
+                helpers.replace_file(tmp, self.path(digest))
+                with self._lock:
+                    self.stored += 1
+                    if self._size is not None:
+                        self._size += size
+                    self._evict(digest)
+        except:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+        return digest
+
+
+    def _evict(self, keep):
+        """
+        Removes the least recently used blobs (except 'keep') until the store is within its size limit
+
+        Must be called with self._lock held
+        """
+        if self._max_size is None or (self._size is not None and self._size <= self._max_size):
+            return
+
+        blobs = []
+        for digest in self.digests():
+            try:
+                st = os.stat(self.path(digest))
+            except OSError:
+                continue
+            blobs.append((st.st_mtime, st.st_size, digest))
+
+        self._size = sum(b[1] for b in blobs)
+        if self._size <= self._max_size:
+            return
+
+        # Evict down to 90% to not rescan the store on every new blob
+        target = self._max_size * 9 // 10
+        for (_, size, digest) in sorted(blobs):
+            if self._size <= target:
+                break
+            if digest == keep:
+                continue
+            try:
+                self.remove(digest)
+            except OSError:
+                continue
+            self._size   -= size
+            self.evicted += 1
+
+
+    def put_file(self, filename):
+        """
+        Stores 'filename' and replaces it with a link to the stored copy. Returns the digest
+        """
+        with open(filename, "rb") as f:
+            digest = self.put(f)
+
+        self.link(digest, filename)
+
+        return digest
+
+
+    def link(self, digest, filename):
+        """
+        Creates 'filename' with the content of blob 'digest'; as a (read-only) hard link if possible, as a copy otherwise
+        """
+        (fd, tmp) = self._tempfile(os.path.dirname(filename) or ".")
+        os.close(fd)
+        try:
+            try:
+                if not self.HARD_LINKS:
+                    raise OSError("Hard links are not used")
+                os.unlink(tmp)
+                os.link(self.path(digest), tmp)
+                self._touch(digest)
+            except (AttributeError, OSError):
+                # No hard links (different file system, Python2 on Windows, ...)
+                with self.open(digest) as r:
+                    with open(tmp, "wb") as w:
+                        copyfileobj(r, w, BlobStore.BUFFER_SIZE)
+            helpers.replace_file(tmp, filename)
+        except:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+        return filename
+
+
+    def stats(self):
+        """
+        Returns a one-line summary of the store usage
+        """
+        return "Artifact store: {} stored, {} already present, {} evicted".format(self.stored, self.reused, self.evicted)
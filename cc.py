@@ -22,9 +22,13 @@ sudo yum install python-requests
 
 ++++++++++++++++++++++++++++++++++++
 """)
-from collections import OrderedDict
+from collections import deque, OrderedDict
+import hashlib
+import os
 from os import path as os_path
 from shutil import copy2
+import tempfile
+import threading
 
 
 # disable printing of unsigned SSH connection warnings to console
@@ -33,8 +37,11 @@ from shutil import copy2
 
 
 # PLC Factory modules
+from blob_store import BlobStore
+from ccdb_transport import TransportPolicy
+from controls_graph import ControlsGraph
 import helpers
-import levenshtein
+from name_index import NameIndex
 import plcf_git as git
 
 
@@ -47,9 +54,26 @@ class CC(object):
     DEVICE_DICT     = "device.dict"
     DEVICE_JSON     = "device.json"
     DEVICE_YAML     = "device.yaml"
+    # The list of device names; the slot of the n-th device is in DEVICE_RECORD.format(n)
+    DEVICE_INDEX    = "device.index"
+    DEVICE_RECORD   = "devices/{}.json"
+    # The SHA-256 of every artifact; artifacts with the same content are saved only once
+    ARTIFACT_JSON   = "artifacts.json"
+    # The formats of the whole model CC.save() writes by default (besides the device records)
+    DUMP_FORMATS    = ("dict", "json", "yaml")
     GIT_CACHE       = "data-model"
+    DOWNLOAD_JOBS   = 8
     paths_cached    = dict()
     sessions_cached = dict()
+    sessions_lock   = threading.Lock()
+    # An ccdb_cache.HTTPCache instance used by get()
+    http_cache      = None
+    # The timeout/retry/connection policy of get()
+    transport       = TransportPolicy()
+    # A blob_store.BlobStore instance where downloaded artifacts are moved to
+    blob_store      = None
+    # The YAML Dumper classes; key: use libyaml
+    _yaml_dumpers   = dict()
 
 
     class Exception(Exception):
@@ -99,6 +123,9 @@ class CC(object):
 
 
     class BasicAuth(requests.auth.AuthBase):
+        # Make sure that only one (download) thread asks for the password
+        _lock = threading.Lock()
+
         def __init__(self, username = None):
             super(CC.BasicAuth, self).__init__()
 
@@ -121,7 +148,9 @@ class CC(object):
 
         def __call__(self, r):
             if not self.password:
-                self.password = getpass.getpass("Password of {} for {}: ".format(self.username, r.url.split('?')[0]))
+                with CC.BasicAuth._lock:
+                    if not self.password:
+                        self.password = getpass.getpass("Password of {} for {}: ".format(self.username, r.url.split('?')[0]))
             r.headers['Authorization'] = requests.auth._basic_auth_str(self.username, self.password)
             return r
 
@@ -409,11 +438,12 @@ class CC(object):
             save_as = self.saveas()
 
             # check if filename has already been downloaded
-            if not os_path.exists(save_as):
+            if not self._device.ccdb.has_artifact(save_as):
                 try:
                     self._download()
                 except CC.DownloadException as e:
                     raise CC.ArtifactException(e, deviceName = self._device.name(), filename = self.saveas_filename())
+                self._device.ccdb._storeArtifact(save_as)
 
             self.registerDownloadedArtifact(save_as)
 
@@ -432,6 +462,7 @@ class CC(object):
             self._url            = artifact.saveas_url()
             self._saved_as       = artifact.saveas()
             self._perdevtype     = artifact.is_perdevtype()
+            self._ccdb           = artifact._device.ccdb
 
 
         # Not really sure that _perdevtype is needed; Artifact.download() uses saveas() ie _saved_as only
@@ -443,10 +474,25 @@ class CC(object):
             return hash((self._saved_as, self._perdevtype))
 
 
-        def saved_as(self):
+        def saved_as(self, extract = True):
+            """
+            Returns the filename of the artifact
+
+            If 'extract' is False the file might not exist (yet); use open() to read the artifact
+            """
+            if extract:
+                return self._ccdb.extract_artifact(self._saved_as)
+
             return self._saved_as
 
 
+        def open(self):
+            """
+            Returns a file object that reads the artifact as text
+            """
+            return helpers.text_reader(self._ccdb.open_artifact(self._saved_as))
+
+
         def filename(self):
             return self._filename
 
@@ -473,13 +519,12 @@ class CC(object):
 
 
     class DeviceType(object):
-        ccdb = None
+        __slots__ = ("ccdb", )
 
         def __init__(self, ccdb):
             super(CC.DeviceType, self).__init__()
 
-            if ccdb is not None:
-                self.ccdb = ccdb
+            self.ccdb = ccdb
 
 
         def __str__(self):
@@ -496,20 +541,52 @@ class CC(object):
 
 
     class Device(object):
-        ccdb = None
+        # Large controls trees have a lot of devices; do not have a __dict__ per device
+        __slots__ = ("ccdb", "_inControlledTree", "_propDicts", "_fragments")
 
         def __init__(self, ccdb):
             super(CC.Device, self).__init__()
 
+            self.ccdb              = ccdb
             self._inControlledTree = False
-            if ccdb is not None:
-                self.ccdb = ccdb
+            # cache of CC._propertiesDict(); key: prefix, value: property dictionary
+            self._propDicts        = None
+            # cache of the serializations of the device; key: format, value: serialized string
+            self._fragments        = None
 
 
         def __str__(self):
             return self.name()
 
 
+        def _invalidate(self):
+            """
+            Drops the cached views of the device; has to be called if the underlying data is modified
+            """
+            self._propDicts = None
+            self._fragments = None
+            if self.ccdb is not None:
+                self.ccdb._controlsChanged()
+
+
+        def _fragment(self, fmt, serialize):
+            """
+            Returns the serialization of the device in format 'fmt'; serialize() is called only if it is not yet cached
+            """
+            if self._fragments is None:
+                self._fragments = dict()
+            else:
+                try:
+                    return self._fragments[fmt]
+                except KeyError:
+                    pass
+
+            fragment = serialize()
+            self._fragments[fmt] = fragment
+
+            return fragment
+
+
         def to_yaml(self):
             """
             Returns the Python object that should be serialized into YAML
@@ -648,9 +725,9 @@ class CC(object):
             return (dev_defs, devtype_defs)
 
 
-        def downloadArtifact(self, extension, device_tag = None, filetype = '', custom_filter = None, filter_args = ()):
+        def findArtifact(self, extension, device_tag = None, filetype = '', custom_filter = None, filter_args = ()):
             """
-            Returns a DownloadedArtifact or None
+            Returns the Artifact that downloadArtifact() would download or None
             """
             if custom_filter is None:
                 def filter_device_tags(artifact):
@@ -677,25 +754,32 @@ class CC(object):
             # Separate device and device type artifacts
             (dev_defs, devtype_defs) = self.__splitDefs(defs)
 
-            def __checkArtifactList(defs):
+            # device artifacts have higher priority than device type artifacts
+            for defs in (dev_defs, devtype_defs):
                 if not defs:
-                    return None
+                    continue
 
                 if len(defs) > 1:
                     raise CC.ArtifactException("More than one {filetype} Artifacts were found for {device}: {defs}".format(filetype = filetype, device = self.name(), defs = defs), self.name())
 
-                print("Downloading {filetype} file {filename} from CCDB".format(filetype = filetype,
-                                                                                filename = defs[0].filename()))
+                return defs[0]
 
-                defs[0].reset_saveas()
-                return defs[0].download()
+            return None
 
-            # device artifacts have higher priority than device type artifacts
-            art = __checkArtifactList(dev_defs)
-            if art is not None:
-                return art
 
-            return __checkArtifactList(devtype_defs)
+        def downloadArtifact(self, extension, device_tag = None, filetype = '', custom_filter = None, filter_args = ()):
+            """
+            Returns a DownloadedArtifact or None
+            """
+            artifact = self.findArtifact(extension, device_tag, filetype, custom_filter, filter_args)
+            if artifact is None:
+                return None
+
+            print("Downloading {filetype} file {filename} from CCDB".format(filetype = filetype,
+                                                                            filename = artifact.filename()))
+
+            artifact.reset_saveas()
+            return artifact.download()
 
 
         def downloadExternalLink(self, base, extension, device_tag = None, filetype = 'External Link', git_tag = None):
@@ -735,31 +819,12 @@ class CC(object):
         # returns a stable list of controlled devices
         # Returns: []
         def buildControlsList(self, include_self = False, verbose = False):
+            changed = not self.isInControlledTree()
             self.putInControlledTree()
 
-            # find devices this device _directly_ controls
-            pool = self.controls()
-
             # find all devices that are directly or indirectly controlled by 'device'
-            controlled_devices = set(pool)
-            while pool:
-                dev = pool.pop()
-
-                cdevs = dev.controls()
-                for cdev in cdevs:
-                    if cdev not in controlled_devices:
-                        controlled_devices.add(cdev)
-                        pool.append(cdev)
-
-            # group them by device type
-            pool = list(controlled_devices)
-            controlled_devices = dict()
-            for dev in pool:
-                device_type = dev.deviceType()
-                try:
-                    controlled_devices[device_type].append(dev)
-                except KeyError:
-                    controlled_devices[device_type] = [ dev ]
+            # sorted by device type and name
+            controlled_devices = self.ccdb._controlsGraph.controlled(self)
 
             if verbose:
                 if verbose is True:
@@ -769,25 +834,26 @@ class CC(object):
                 else:
                     verbose(self, 'root')
 
-            # sort items into a list
-            def sortkey(device):
-                return device.name()
             pool = list()
-            for device_type in sorted(controlled_devices):
-                if verbose:
+            device_type = None
+            for dev in controlled_devices:
+                if verbose and dev.deviceType() != device_type:
+                    device_type = dev.deviceType()
                     if verbose is True:
                         print("\t- " + device_type)
                     else:
-                        verbose(controlled_devices[device_type][0].type(), 'device_type')
+                        verbose(dev.type(), 'device_type')
 
-                for dev in sorted(controlled_devices[device_type], key=sortkey):
-                    pool.append(dev)
+                pool.append(dev)
+                if not dev.isInControlledTree():
                     dev.putInControlledTree()
-                    if verbose:
-                        if verbose is True:
-                            print("\t\t-- " + dev.name())
-                        else:
-                            verbose(dev, 'device')
+                    changed = True
+
+                if verbose:
+                    if verbose is True:
+                        print("\t\t-- " + dev.name())
+                    else:
+                        verbose(dev, 'device')
 
             if verbose is True:
                 print("\n")
@@ -795,6 +861,10 @@ class CC(object):
             if include_self:
                 pool.insert(0, self)
 
+            if changed:
+                # The controlled tree has changed
+                self.ccdb._clearAncestors()
+
             return pool
 
 
@@ -803,10 +873,11 @@ class CC(object):
 
 
 
-    def __init__(self, clear_templates = True):
+    def __init__(self, clear_templates = True, download_jobs = None):
         super(CC, self).__init__()
 
         self._clear_templates = clear_templates
+        self._download_jobs   = download_jobs if download_jobs is not None else CC.DOWNLOAD_JOBS
         self.__clear()
 
 
@@ -863,6 +934,76 @@ class CC(object):
                                default  = True,
                                action   = 'store_false')
 
+        ccdb_args.add_argument(
+                               '--download-jobs',
+                               dest     = "download_jobs",
+                               help     = 'the maximum number of artifacts to download in parallel. Default: {}'.format(CC.DOWNLOAD_JOBS),
+                               metavar  = 'N',
+                               type     = int,
+                               default  = CC.DOWNLOAD_JOBS)
+
+        ccdb_args.add_argument(
+                               '--ccdb-async',
+                               dest     = "ccdb_async",
+                               help     = 'use the asyncio based CCDB client (Python3 only)',
+                               default  = False,
+                               action   = 'store_true')
+
+        ccdb_args.add_argument(
+                               '--ccdb-mirror',
+                               dest     = "ccdb_mirror",
+                               help     = 'read the devices and artifacts from a local mirror of CCDB (see ccdb.py mirror); whatever is not in the mirror is downloaded from CCDB. Not used with CCDB dumps',
+                               metavar  = 'directory-of-mirror',
+                               nargs    = '?',
+                               const    = True,
+                               default  = None)
+
+        ccdb_args.add_argument(
+                               '--no-http-cache',
+                               dest     = "http_cache",
+                               help     = 'do not use (and update) the persistent cache of CCDB responses',
+                               default  = True,
+                               action   = 'store_false')
+
+        ccdb_args.add_argument(
+                               '--no-artifact-store',
+                               dest     = "artifact_store",
+                               help     = 'do not keep the downloaded artifacts in the content addressed store shared between runs',
+                               default  = True,
+                               action   = 'store_false')
+
+        ccdb_args.add_argument(
+                               '--http-timeout',
+                               dest     = "http_timeout",
+                               help     = 'the timeout (in seconds) of reading an HTTP response. Default: {}'.format(TransportPolicy.TIMEOUT[1]),
+                               metavar  = 'SECONDS',
+                               type     = float,
+                               default  = TransportPolicy.TIMEOUT[1])
+
+        ccdb_args.add_argument(
+                               '--http-retries',
+                               dest     = "http_retries",
+                               help     = 'the number of times a failed (5xx or connection error) HTTP request is retried. Default: {}'.format(TransportPolicy.RETRIES),
+                               metavar  = 'N',
+                               type     = int,
+                               default  = TransportPolicy.RETRIES)
+
+        ccdb_args.add_argument(
+                               '--http-max-connections',
+                               dest     = "http_max_connections",
+                               help     = 'the maximum number of concurrent HTTP requests to the same host. Default: {}'.format(TransportPolicy.MAX_CONNECTIONS),
+                               metavar  = 'N',
+                               type     = int,
+                               default  = TransportPolicy.MAX_CONNECTIONS)
+
+        ccdb_args.add_argument(
+                               '--http-latency-log',
+                               dest     = "http_latency_log",
+                               help     = 'save the latency histograms of the HTTP requests to this JSON file',
+                               metavar  = 'FILE',
+                               type     = str,
+                               default  = None)
+
         return parser
 
 
@@ -939,20 +1080,42 @@ class CC(object):
     def get(url, auth = None, **keyword_params):
         netloc = CC.urlsplit(url).netloc
 
-        try:
-            (session, auth) = CC.sessions_cached[netloc]
-        except KeyError:
-            session = requests.session()
-            if auth is None:
-                auth    = CC.BasicAuth()
-            CC.sessions_cached[netloc] = (session, auth)
+        # The sessions are shared between the download threads
+        with CC.sessions_lock:
+            try:
+                (session, auth) = CC.sessions_cached[netloc]
+            except KeyError:
+                session = CC.transport.configure(requests.session())
+                if auth is None:
+                    auth    = CC.BasicAuth()
+                CC.sessions_cached[netloc] = (session, auth)
 
-        # Try without authentication first; don't want to bother users with asking for their password when not really needed
-        result = session.get(url, auth = auth if auth.isvalid() else None, **keyword_params)
-        if result.status_code == 401:
-            result = session.get(url, auth = auth, **keyword_params)
+        def send():
+            # Try without authentication first; don't want to bother users with asking for their password when not really needed
+            result = CC.transport.get(session, url, auth = auth if auth.isvalid() else None, **keyword_params)
+            if result.status_code == 401:
+                result = CC.transport.get(session, url, auth = auth, **keyword_params)
 
-        return result
+            return result
+
+        http_cache = CC.http_cache
+        if http_cache is None:
+            return send()
+
+        headers = keyword_params.get("headers")
+        keyword_params["headers"] = http_cache.request_headers(url, headers)
+
+        result = send()
+        cached = http_cache.response(url, headers, result)
+        if cached is not None:
+            return cached
+
+        # Not modified but the cached response is gone; ask for the whole response (once)
+        keyword_params["headers"] = headers
+        result = send()
+        cached = http_cache.response(url, headers, result)
+
+        return cached if cached is not None else result
 
 
     @staticmethod
@@ -962,10 +1125,24 @@ class CC(object):
         if result.status_code != 200:
             raise CC.DownloadException(url = url, code = result.status_code)
 
-        # 'w' overwrites the file if it exists
-        with open(save_as, 'wb') as f:
-            for line in result:
-                f.write(line)
+        return CC.save_response(result, save_as)
+
+
+    @staticmethod
+    def save_response(result, save_as):
+        """
+        Saves the body of the 'result' response as 'save_as'
+        """
+        # Download into a temporary file first so that an interrupted download is never mistaken for a complete one
+        (fd, tmp_save_as) = tempfile.mkstemp(dir = os_path.dirname(save_as) or ".", prefix = ".", suffix = ".part")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for line in result:
+                    f.write(line)
+            helpers.replace_file(tmp_save_as, save_as)
+        except:
+            os.unlink(tmp_save_as)
+            raise
 
         return save_as
 
@@ -974,16 +1151,26 @@ class CC(object):
         # all devices; key, Device pairs
         self._devices = OrderedDict()
 
-        # cache for device, property dictionary
-        self._propDict = dict()
+        # search order of ^() expressions
+        # key: device name, value: tuple of devices
+        self._ancestorOrder = dict()
+
+        # nearest ancestors of ^() expressions
+        # key: property, value: dict of device name, device that defines property (or None)
+        self._nearestAncestor = dict()
 
-        # cache for ^() expressions
-        # key: (device, expression), value: property
-        self._backtrackCache = dict()
+        # the controls relation; with the memoized result of buildControlsList()
+        self._controlsGraph = ControlsGraph()
 
         # cache of downloaded artifacts
         self._downloadedArtifacts = set()
 
+        # SHA-256 of the artifacts moved to the artifact store
+        self._artifactDigests = dict()
+
+        # index of device names to look for similar names
+        self._nameIndex = None
+
         if self._clear_templates:
             # clear templates downloaded in a previous run
             helpers.rmdirs(CC.TEMPLATE_DIR)
@@ -1004,6 +1191,111 @@ class CC(object):
         return None
 
 
+    def _parallel_map(self, func, items):
+        """
+        Returns the list of func(item) for every item in items using at most 'download_jobs' threads
+        """
+        items = list(items)
+        if self._download_jobs <= 1 or len(items) <= 1:
+            return list(map(func, items))
+
+        from multiprocessing.pool import ThreadPool
+
+        pool = ThreadPool(min(self._download_jobs, len(items)))
+        try:
+            return pool.map(func, items)
+        finally:
+            pool.close()
+            pool.join()
+
+
+    def prefetchArtifacts(self, artifacts):
+        """
+        Downloads the file artifacts in parallel, so that a later Artifact.download() finds them on disk
+
+        Download errors are ignored here; Artifact.download() will report them.
+        Returns the number of downloaded artifacts
+        """
+        # Per device type artifacts are shared by every device of that type; download them only once
+        todo = OrderedDict()
+        for artifact in artifacts:
+            if artifact is None or not artifact.is_file():
+                continue
+
+            save_as = artifact.saveas()
+            if save_as not in todo and not self.has_artifact(save_as):
+                todo[save_as] = artifact
+
+        if not todo:
+            return 0
+
+        print("Prefetching {} artifacts...".format(len(todo)))
+
+        def prefetch(artifact):
+            try:
+                artifact._download()
+                self._storeArtifact(artifact.saveas())
+                return True
+            except Exception:
+                return False
+
+        return sum(self._parallel_map(prefetch, todo.values()))
+
+
+    def _storeArtifact(self, save_as):
+        """
+        Moves the just downloaded artifact 'save_as' to the artifact store (if there is one)
+        """
+        if CC.blob_store is not None:
+            self._artifactDigests[save_as] = CC.blob_store.put_file(save_as)
+
+
+    def _artifactDigest(self, save_as):
+        try:
+            return self._artifactDigests[save_as]
+        except KeyError:
+            with open(save_as, "rb") as f:
+                digest = BlobStore.digest_of(f)
+            self._artifactDigests[save_as] = digest
+
+            return digest
+
+
+    def downloadedArtifacts(self):
+        """
+        Returns the (filenames of the) downloaded artifacts; they are saved in the CCDB dump
+        """
+        return set(self._downloadedArtifacts)
+
+
+    def registerDownloadedArtifacts(self, filenames):
+        """
+        Registers artifacts downloaded by another process that uses (a copy of) this CCDB
+        """
+        self._downloadedArtifacts.update(filenames)
+
+
+    def has_artifact(self, save_as):
+        """
+        Returns True if the artifact 'save_as' is available without downloading it
+        """
+        return os_path.exists(save_as)
+
+
+    def open_artifact(self, save_as):
+        """
+        Returns the (already downloaded) artifact 'save_as' as a binary file object
+        """
+        return open(save_as, "rb")
+
+
+    def extract_artifact(self, save_as):
+        """
+        Makes sure that the (already downloaded) artifact 'save_as' exists as a file. Returns 'save_as'
+        """
+        return save_as
+
+
     def _get_device(self, devicename, single_device_only):
         """
         Should return a CC.Device
@@ -1025,6 +1317,13 @@ class CC(object):
             return device
 
 
+    def _devices_by_name(self, deviceNames, cachedOnly = False):
+        """
+        Returns the list of devices in 'deviceNames'. Unknown devices are skipped if 'cachedOnly' is True
+        """
+        return [ d for d in map(lambda dn: self.device(dn, cachedOnly), deviceNames) if d is not None ]
+
+
     # Returns: the device name
     # CCDB returns a dictionary of {nameId, Id, name} in controls/controlledBy/etc list
     def deviceName(self, deviceName):
@@ -1040,20 +1339,28 @@ class CC(object):
         if prefixToIgnore == "":
             return device.properties()
 
-        deviceName = device.name()
-
-        if (deviceName, prefixToIgnore) in self._propDict:
-            return self._propDict[deviceName, prefixToIgnore]
-
-        result = {}
-        for (name, value) in device.properties().items():
-            # remove prefix if it exists
-            if name.startswith(prefixToIgnore):
-                name = name[len(prefixToIgnore):]
+        if device._propDicts is None:
+            device._propDicts = dict()
+        else:
+            try:
+                return device._propDicts[prefixToIgnore]
+            except KeyError:
+                pass
+
+        properties = device.properties()
+        if not any(map(lambda name: name.startswith(prefixToIgnore), properties)):
+            # nothing to remove, no need for a copy
+            result = properties
+        else:
+            result = {}
+            for (name, value) in properties.items():
+                # remove prefix if it exists
+                if name.startswith(prefixToIgnore):
+                    name = helpers.intern(name[len(prefixToIgnore):])
 
-            result[name] = value
+                result[name] = value
 
-        self._propDict[deviceName, prefixToIgnore] = result
+        device._propDicts[prefixToIgnore] = result
 
         return result
 
@@ -1063,6 +1370,13 @@ class CC(object):
         raise NotImplementedError
 
 
+    def _all_devices(self):
+        """
+        Returns the ordered dictionary of every (known) device
+        """
+        return self._devices
+
+
     # Returns: []
     def getSimilarDeviceNames(self, deviceName, X = 10):
         """
@@ -1072,24 +1386,17 @@ class CC(object):
              - filtered; boolean if the list is filtered to the same System-Subsystem as deviceName
              - topX; a list of device names
         """
-        allDevices = self.getAllDeviceNames()
-
-        # keep only device
-        slot = deviceName.split(":")
-        candidates = None
-        if len(slot) > 1:
-            slot = slot[0].lower()
-            candidates = list(filter(lambda x: x.lower().startswith(slot), allDevices))
-            filtered = True
+        return self._name_index().similar(deviceName, X)
 
-        if not candidates:
-            candidates = allDevices
-            filtered = False
 
-        # compute Levenshtein distances
-        candidates = list(map(lambda f: f[1], sorted(map(lambda x: (levenshtein.distance(deviceName, x), x), candidates))[:X]))
+    def _name_index(self):
+        """
+        Returns the NameIndex of all the device names
+        """
+        if self._nameIndex is None:
+            self._nameIndex = NameIndex(self.getAllDeviceNames())
 
-        return (filtered, candidates)
+        return self._nameIndex
 
 
     def toFactory(self, filename, directory = ".", git_tag = None, script = None, root = None):
@@ -1165,7 +1472,7 @@ class CC(object):
 
         # Define device type external links
         plc = None
-        for devname in sorted(self._devices.keys()):
+        for devname in sorted(self._all_devices().keys()):
             dev      = self.device(devname)
             devType  = dev.deviceType()
             exLinks  = sorted(dev.externalLinks(), key = lambda x: x.name())
@@ -1276,37 +1583,113 @@ factory.save("{filename}")""".format(factory_options = 'git_tag = "{}"'.format(g
         return "1.0"
 
 
-    def to_yaml(self, root=None, show_controls=True):
+    @staticmethod
+    def _yaml_dumper(libyaml = False):
         """
-        Returns the string representation of the serialization of the devices into YAML.
+        Returns the YAML Dumper class to serialize devices with; the C implementation is used if 'libyaml' is True and PyYAML was built with it
         """
-        import yaml
-        import datetime
+        try:
+            return CC._yaml_dumpers[libyaml]
+        except KeyError:
+            pass
 
-        ymodel = OrderedDict()
-        if self.url():
-            ymodel["url"] = self.url()
-        ymodel["utc-timestamp"] = "{:%Y%m%d%H%M%S}".format(datetime.datetime.utcnow())
-        ymodel["version"] = self.yaml_version()
+        import yaml
 
-        ydevs = OrderedDict()
-        if root:
-            ydevs[root.name()] = root.to_yaml()
-            if show_controls:
-                for d in root.buildControlsList():
-                    ydevs[d.name()] = d.to_yaml()
-        else:
-            for (k, v) in self._devices.items():
-                ydevs[k] = v.to_yaml()
-        ymodel["devices"] = ydevs
+        base = getattr(yaml, "CDumper", yaml.Dumper) if libyaml else yaml.Dumper
 
         # Dump identical values verbatim and do not use anchor-alias notation
-        class NoAliasDumper(yaml.Dumper):
+        class NoAliasDumper(base):
             def ignore_aliases(self, data):
                 return True
 
-        yaml.add_representer(OrderedDict, lambda dumper, data: dumper.represent_mapping("tag:yaml.org,2002:map", data.items()))
-        return yaml.dump(ymodel, sort_keys = False, Dumper = NoAliasDumper)
+        NoAliasDumper.add_representer(OrderedDict, lambda dumper, data: dumper.represent_mapping("tag:yaml.org,2002:map", data.items()))
+        CC._yaml_dumpers[libyaml] = NoAliasDumper
+
+        return NoAliasDumper
+
+
+    def _serialized_devices(self, root, show_controls):
+        """
+        Returns the (name, device) pairs to serialize
+        """
+        if root:
+            devices = [ (root.name(), root) ]
+            if show_controls:
+                devices.extend((d.name(), d) for d in root.buildControlsList())
+            return devices
+
+        return self._all_devices().items()
+
+
+    @staticmethod
+    def _special_json(cls):
+        return cls.to_json()
+
+
+    def _model_header(self, version):
+        import datetime
+
+        model = OrderedDict()
+        if self.url():
+            model["url"] = self.url()
+        model["utc-timestamp"] = "{:%Y%m%d%H%M%S}".format(datetime.datetime.utcnow())
+        model["version"] = version
+
+        return model
+
+
+    def _yaml_devices(self, devices, libyaml = False):
+        """
+        Returns the YAML serialization of the "devices" key of to_yaml()
+
+        The serialization of every device is cached on the device (until it is modified) so it is generated only once
+        """
+        import yaml
+
+        if not devices:
+            return "devices: {}\n"
+
+        dumper = CC._yaml_dumper(libyaml)
+        prefix = "devices:\n"
+
+        def serialize(name, device):
+            # Dump the device as the only one in "devices" so that the indentation (and line wrapping) is the same as in the whole document
+            fragment = yaml.dump(OrderedDict([ ("devices", OrderedDict([ (name, device.to_yaml()) ])) ]), sort_keys = False, Dumper = dumper)
+            assert fragment.startswith(prefix)
+            return fragment[len(prefix):]
+
+        return prefix + "".join(device._fragment(("yaml", name, libyaml), lambda: serialize(name, device)) for (name, device) in devices)
+
+
+    def to_yaml(self, root=None, show_controls=True, libyaml=False):
+        """
+        Returns the string representation of the serialization of the devices into YAML.
+        """
+        import yaml
+
+        header = yaml.dump(self._model_header(self.yaml_version()), sort_keys = False, Dumper = CC._yaml_dumper(libyaml))
+
+        return header + self._yaml_devices(list(self._serialized_devices(root, show_controls)), libyaml)
+
+
+    def _json_devices(self, devices):
+        """
+        Returns the JSON serialization of the "devices" object of to_json() (nested at the second level)
+
+        The serialization of every device is cached on the device (until it is modified) so it is generated only once
+        """
+        import json
+
+        if not devices:
+            return "{}"
+
+        def serialize(device):
+            return json.dumps(device.to_json(), indent = 4, default = CC._special_json).replace("\n", "\n        ")
+
+        # the same as json.dumps(indent = 4) uses; it is ", " in Python2
+        separator = json.JSONEncoder(indent = 4).item_separator
+
+        return "{\n" + (separator + "\n").join("        {}: {}".format(json.dumps(name), device._fragment("json", lambda: serialize(device))) for (name, device) in devices) + "\n    }"
 
 
     def to_json(self, root=None, show_controls=True):
@@ -1314,30 +1697,68 @@ factory.save("{filename}")""".format(factory_options = 'git_tag = "{}"'.format(g
         Returns the string representation of the serialization of the devices into JSON.
         """
         import json
-        import datetime
 
-        def special_json(cls):
-            return cls.to_json()
+        jmodel = self._model_header(self.json_version())
+        jmodel["devices"] = dict()
+        header = json.dumps(jmodel, indent=4)
+        # "devices" is the last key; replace its empty value
+        assert header.endswith("{}\n}")
+
+        return header[:-len("{}\n}")] + self._json_devices(list(self._serialized_devices(root, show_controls))) + "\n}"
+
+
+    def _dict_devices(self, devices):
+        """
+        Returns the Python literal of the {name: slot} dictionary of the devices
+        """
+        return "{" + ", ".join("{!r}: {}".format(name, device._fragment("dict", lambda: repr(device))) for (name, device) in devices) + "}"
+
+
+    @staticmethod
+    def _record(device):
+        """
+        Returns the device record (as saved in DEVICE_RECORD) and its SHA-256
+        """
+        import json
+
+        def serialize():
+            record = json.dumps(device.to_json())
+            return (record, hashlib.sha256(record.encode("utf-8")).hexdigest())
+
+        return device._fragment("record", serialize)
 
-        jmodel = OrderedDict()
-        if self.url():
-            jmodel["url"] = self.url()
-        jmodel["utc-timestamp"] = "{:%Y%m%d%H%M%S}".format(datetime.datetime.utcnow())
-        jmodel["version"] = self.json_version()
-        if root:
-            jdevs = OrderedDict()
-            jmodel["devices"] = jdevs
-            jdevs[root.name()] = root
-            if show_controls:
-                for d in root.buildControlsList():
-                    jdevs[d.name()] = d
-        else:
-            jmodel["devices"] = self._devices
 
-        return json.dumps(jmodel, indent=4, default=special_json)
+    @staticmethod
+    def _read_base(base):
+        """
+        Returns the device record digests (a dict keyed by device name) and the set of artifact digests of dump 'base'
+
+        Returns None if 'base' cannot be used as the base of a delta dump
+        """
+        import json
+        import zipfile
+        try:
+            with zipfile.ZipFile(base, "r") as z:
+                index     = json.loads(z.read(os_path.join("ccdb", CC.DEVICE_INDEX)).decode("utf-8"))
+                artifacts = json.loads(z.read(os_path.join("ccdb", CC.ARTIFACT_JSON)).decode("utf-8"))
+            return (dict(zip(index["devices"], index["digests"])), set(artifacts["artifacts"].values()))
+        except (IOError, OSError, KeyError, ValueError, zipfile.BadZipfile):
+            return None
+
+
+    def save(self, filename, directory = ".", base = None, formats = None, libyaml = False, dedupe_artifacts = False):
+        """
+        Saves the devices and the downloaded artifacts as a CCDB dump
+
+        If 'base' is the filename of a previous dump then only the devices and artifacts that are not in 'base' are saved
+        and the dump refers to 'base' for the rest (a delta dump)
 
+        Artifacts with the same content are saved only once in delta dumps or if 'dedupe_artifacts' is True; otherwise every
+        artifact is (also) saved as itself so that readers not knowing about CC.ARTIFACT_JSON can use the dump
 
-    def save(self, filename, directory = "."):
+        'formats' is the list of whole model serializations (see DUMP_FORMATS) to save in a full dump; the device records
+        are always saved (but versions before the device records need CC.DEVICE_DICT or CC.DEVICE_JSON). If 'libyaml' is True then the YAML serialization uses the C implementation of PyYAML if available
+        """
         import zipfile
         if isinstance(filename, str):
             filename = self._save_filename(directory, filename)
@@ -1346,24 +1767,71 @@ factory.save("{filename}")""".format(factory_options = 'git_tag = "{}"'.format(g
             dumpfile = zipfile.ZipFile(filename, "w", zipfile.ZIP_DEFLATED)
             filename = filename.name
 
-        # ast.literal_eval cannot parse OrderedDict so convert self._devices to simple dict()
-        dumpfile.writestr(os_path.join("ccdb", CC.DEVICE_DICT), str(dict(self._devices)))
-        dumpfile.writestr(os_path.join("ccdb", CC.DEVICE_JSON), self.to_json())
-        try:
-            dumpfile.writestr(os_path.join("ccdb", CC.DEVICE_YAML), self.to_yaml())
-        except Exception:
-            # Not a showstopper yet:
-            #  - 'yaml' might not be installed
-            #  - to_yaml() might not be correct
-            pass
-        for template in self._downloadedArtifacts:
+        import json
+        if base is not None:
+            base_digests = CC._read_base(base)
+            if base_digests is None:
+                print("Cannot use {} as the base of a delta dump; saving a full dump".format(base))
+                base = None
+            else:
+                (base_records, base_artifacts) = base_digests
+        if base is None:
+            base_records   = dict()
+            base_artifacts = set()
+
+        if formats is None:
+            formats = CC.DUMP_FORMATS
+
+        devices = self._all_devices()
+        items   = list(devices.items())
+        if base is None:
+            # ast.literal_eval cannot parse OrderedDict so the devices are written as a simple dict()
+            if "dict" in formats:
+                dumpfile.writestr(os_path.join("ccdb", CC.DEVICE_DICT), self._dict_devices(items))
+            if "json" in formats:
+                dumpfile.writestr(os_path.join("ccdb", CC.DEVICE_JSON), self.to_json())
+        # One record per device so that the dump can be loaded on demand
+        digests = []
+        for (i, (deviceName, device)) in enumerate(items):
+            (record, digest) = CC._record(device)
+            digests.append(digest)
+            if base_records.get(deviceName) != digest:
+                dumpfile.writestr(os_path.join("ccdb", CC.DEVICE_RECORD.format(i)), record)
+        index = { "version": 1, "devices": list(devices.keys()), "digests": digests }
+        if base is not None:
+            # relative to the dump so that the two can be moved together
+            index["base"] = os_path.relpath(os_path.abspath(base), os_path.dirname(os_path.abspath(filename)))
+        dumpfile.writestr(os_path.join("ccdb", CC.DEVICE_INDEX), json.dumps(index))
+        if base is None and "yaml" in formats:
+            try:
+                dumpfile.writestr(os_path.join("ccdb", CC.DEVICE_YAML), self.to_yaml(libyaml = libyaml))
+            except Exception:
+                # Not a showstopper yet:
+                #  - 'yaml' might not be installed
+                #  - to_yaml() might not be correct
+                pass
+        if base is not None:
+            dedupe_artifacts = True
+        artifacts = OrderedDict()
+        saved     = dict()
+        for template in sorted(self._downloadedArtifacts):
+            digest = self._artifactDigest(template)
+            artifacts[template] = digest
+            if digest in base_artifacts:
+                continue
+            if digest not in saved:
+                saved[digest] = template
+            elif dedupe_artifacts:
+                continue
             dumpfile.write(template, os_path.join("ccdb", template))
+        dumpfile.writestr(os_path.join("ccdb", CC.ARTIFACT_JSON), json.dumps({ "version": 1, "artifacts": artifacts, "saved_as": saved }))
+        dumpfile.close()
 
         return filename
 
 
     @staticmethod
-    def open(name = None, **kwargs):
+    def open(name = None, ccdb_async = False, ccdb_mirror = None, **kwargs):
         if name is not None:
             if os_path.exists(name):
                 return CC.load(name)
@@ -1371,22 +1839,52 @@ factory.save("{filename}")""".format(factory_options = 'git_tag = "{}"'.format(g
                 raise CC.Exception("Cannot find " + name)
 
         from ccdb import CCDB
-        return CCDB(name, **kwargs)
+        ccdb_class = CCDB
+        if ccdb_async:
+            from ccdb_async import AsyncCCDB
+            ccdb_class = AsyncCCDB
+
+        if ccdb_mirror:
+            from ccdb_mirror import MirroredCCDB
+            return MirroredCCDB.variant_of(ccdb_class)(name, mirror = ccdb_mirror, **kwargs)
+
+        return ccdb_class(name, **kwargs)
 
 
     @staticmethod
     def open_from_args(args):
+        kwargs = dict(clear_templates = args.clear_ccdb_cache,
+                      download_jobs   = args.download_jobs,
+                      http_cache      = args.http_cache)
+
+        CC.transport = TransportPolicy(timeout         = (TransportPolicy.TIMEOUT[0], args.http_timeout),
+                                       retries         = args.http_retries,
+                                       max_connections = args.http_max_connections,
+                                       pool_size       = max(args.download_jobs, args.http_max_connections),
+                                       latency_log     = args.http_latency_log)
+
+        if args.artifact_store and CC.blob_store is None:
+            CC.blob_store = BlobStore()
+
         if args.ccdb_test:
-            from ccdb import CCDB_TEST
-            return CCDB_TEST(clear_templates = args.clear_ccdb_cache)
+            from ccdb import CCDB_TEST as ccdb_class
         elif args.ccdb_devel:
-            from ccdb import CCDB_DEVEL
-            return CCDB_DEVEL(clear_templates = args.clear_ccdb_cache)
+            from ccdb import CCDB_DEVEL as ccdb_class
         elif args.ccdb_cslab:
-            from ccdb import CCDB_CSLAB
-            return CCDB_CSLAB(clear_templates = args.clear_ccdb_cache)
+            from ccdb import CCDB_CSLAB as ccdb_class
         else:
-            return CC.open(args.ccdb, clear_templates = args.clear_ccdb_cache)
+            return CC.open(args.ccdb, ccdb_async = args.ccdb_async, ccdb_mirror = args.ccdb_mirror, **kwargs)
+
+        if args.ccdb_async:
+            from ccdb_async import AsyncCCDB
+            ccdb_class = AsyncCCDB.variant_of(ccdb_class)
+
+        if args.ccdb_mirror:
+            from ccdb_mirror import MirroredCCDB
+            ccdb_class = MirroredCCDB.variant_of(ccdb_class)
+            kwargs["mirror"] = args.ccdb_mirror
+
+        return ccdb_class(**kwargs)
 
 
     @staticmethod
@@ -1396,64 +1894,124 @@ factory.save("{filename}")""".format(factory_options = 'git_tag = "{}"'.format(g
         return CCDB_Dump.load(filename)
 
 
-    def _backtrack(self, device, prop, ex_to_raise = None):
-        assert isinstance(prop, str)
+    def _controlsChanged(self):
+        """
+        Drops everything that is derived from the controls relation
+        """
+        self._controlsGraph = ControlsGraph()
+        self._clearAncestors()
+
+
+    def _clearAncestors(self):
+        self._ancestorOrder   = dict()
+        self._nearestAncestor = dict()
+
 
+    def _ancestors(self, device):
         """
-        ex_to_raise: Exception to raise if property is not found
+        Returns the devices to look for a property in when backtracking from 'device', in order:
+         - the devices 'device' is controlled by (in the controlled tree), in a BFS manner
+         - or 'device' itself if it is not controlled by anything
         """
         deviceName = device.name()
+        try:
+            return self._ancestorOrder[deviceName]
+        except KeyError:
+            pass
 
-        # starting by one device, looking for property X, find a device
-        # in a higher level of the hierarchy that has that property
-
-        if (deviceName, prop) in self._backtrackCache:
-            return self._backtrackCache[deviceName, prop]
+        parents = device.controlledBy(True)
+        if not parents:
+            order = (device, )
+        else:
+            order     = []
+            processed = set()
+            leftToProcess = deque(reversed(parents))
+            while leftToProcess:
+                elem = leftToProcess.popleft()
+                if elem in processed:
+                    continue
 
-        if ex_to_raise is None:
-            ex_to_raise = CC.Exception
+                processed.add(elem)
+                order.append(elem)
+                leftToProcess.extend(reversed(elem.controlledBy(True)))
 
-        # starting point: all devices 'device' is controlled by
-        leftToProcess = device.controlledBy(True)
-        # if not controlled by anything, search device itself. Mandatory for artifacts attached to the root device itself
-        if not leftToProcess:
-            leftToProcess = [ device ]
+            order = tuple(order)
 
-        # keep track of number of iterations
-        count = 0
+        self._ancestorOrder[deviceName] = order
 
-        # process tree in BFS manner
-        processed = []
-        while True:
+        return order
 
-            if count > 200:
-                raise CC.Exception("Something went wrong; too many iterations in backtracking while searching for property " + prop)
 
-            if len(leftToProcess) == 0:
-                raise ex_to_raise("No such backtrack property: {}".format(prop))
+    def _nearestAncestorOf(self, device, prop):
+        """
+        Returns the first device of _ancestors(device) that has property 'prop', or None
 
-            elem = leftToProcess.pop()
+        Walks up the single-parent chain starting at 'device' and records the result for every device on it;
+        the nearest ancestor of a device with only one parent is either the parent or the nearest ancestor of the parent.
+        Only devices with multiple parents need the full search order
+        """
+        try:
+            table = self._nearestAncestor[prop]
+        except KeyError:
+            table = dict()
+            self._nearestAncestor[prop] = table
 
-            if elem in processed:
+        chain   = []
+        visited = set()
+        dev     = device
+        while True:
+            deviceName = dev.name()
+            try:
+                found = table[deviceName]
+                break
+            except KeyError:
+                pass
+
+            if deviceName in visited:
+                # A loop; every device on it has already been checked
+                found = None
+                break
+
+            chain.append(deviceName)
+            visited.add(deviceName)
+
+            parents = dev.controlledBy(True)
+            if len(parents) == 1:
+                dev = parents[0]
+                if prop in dev.propertiesDict():
+                    found = dev
+                    break
                 continue
 
-            processed.append(elem)
+            for found in self._ancestors(dev):
+                if prop in found.propertiesDict():
+                    break
+            else:
+                found = None
+            break
 
-            # get properties of device
-            propDict = elem.propertiesDict()
+        for deviceName in chain:
+            table[deviceName] = found
 
-            if prop in propDict:
-                val = propDict.get(prop)
-                self._backtrackCache[deviceName, prop] = val
+        return found
 
-                return val
 
-            # desired property not found in device x
-            else:
-                c = elem.controlledBy(True)
-                if c is not None:
-                    leftToProcess = c + leftToProcess
-                    count        += 1
+    def _backtrack(self, device, prop, ex_to_raise = None):
+        assert isinstance(prop, str)
+
+        """
+        ex_to_raise: Exception to raise if property is not found
+        """
+        # starting by one device, looking for property X, find a device
+        # in a higher level of the hierarchy that has that property
+        found = self._nearestAncestorOf(device, prop)
+        if found is None:
+            if ex_to_raise is None:
+                ex_to_raise = CC.Exception
+
+            raise ex_to_raise("No such backtrack property: {}".format(prop))
+
+        return found.propertiesDict().get(prop)
 
 
     def computeHash(self, hashobj):
@@ -1549,6 +2107,43 @@ factory.save("{filename}")""".format(factory_options = 'git_tag = "{}"'.format(g
         return parser
 
 
+    @staticmethod
+    def dump_args(parser):
+        """
+        Adds the options of CC.save() to 'parser'
+        """
+        def dump_formats(argument):
+            formats = tuple(fmt for fmt in argument.split(",") if fmt)
+            unknown = [ fmt for fmt in formats if fmt not in CC.DUMP_FORMATS ]
+            if unknown:
+                import argparse
+                raise argparse.ArgumentTypeError("unknown format(s): {}; choose from {}".format(", ".join(unknown), ",".join(CC.DUMP_FORMATS)))
+            return formats
+
+        parser.add_argument(
+                            "--dump-formats",
+                            dest    = "dump_formats",
+                            help    = "comma separated list of the whole model serializations to save in the CCDB dump (the per device records are always saved). Default: " + ",".join(CC.DUMP_FORMATS),
+                            type    = dump_formats,
+                            default = CC.DUMP_FORMATS)
+
+        parser.add_argument(
+                            "--dump-libyaml",
+                            dest    = "dump_libyaml",
+                            help    = "use the C implementation of the YAML serializer (if available) for the CCDB dump; faster, but the output might be formatted slightly differently",
+                            default = False,
+                            action  = "store_true")
+
+        parser.add_argument(
+                            "--dump-dedupe-artifacts",
+                            dest    = "dump_dedupe_artifacts",
+                            help    = "save artifacts with the same content only once in the CCDB dump; the dump is smaller, but versions before artifacts.json cannot read every artifact from it. Delta dumps always do this",
+                            default = False,
+                            action  = "store_true")
+
+        return parser
+
+
     @staticmethod
     def tool_device_args(parser, device_is_required=True):
         parser.add_argument(
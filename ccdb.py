@@ -15,6 +15,8 @@ from ast import literal_eval as ast_literal_eval
 
 # PLC Factory modules
 from cc import CC
+import helpers
+from name_index import NameIndex
 
 
 
@@ -86,6 +88,8 @@ class CCDB(CC):
 
 
     class DeviceType(CC.DeviceType):
+        __slots__ = ("_name", )
+
         def __init__(self, name, ccdb = None):
             super(CCDB.DeviceType, self).__init__(ccdb)
             self._name = name
@@ -109,12 +113,70 @@ class CCDB(CC):
 
 
     class Device(CC.Device):
-        def __init__(self, slot, ccdb = None):
+        __slots__ = ("_slot_data", "_name", "_devtypeprops", "_props", "_arts", "_ctrls", "_ctrldBy")
+
+        # Keys of the slot that are lists of device names
+        DEVICE_LISTS = ("controls", "controlledBy", "children", "parents", "powers", "poweredBy")
+        # Keys of a property that are repeated across devices
+        PROPERTY_KEYS = ("name", "dataType", "kind", "unit")
+
+        def __init__(self, slot, ccdb = None, name = None):
+            """
+            If 'slot' is None then this is a placeholder for device 'name'; it is downloaded on first access
+            """
             super(CCDB.Device, self).__init__(ccdb)
-            self._slot  = slot
+            self._slot_data    = None
+            self._name         = helpers.intern(name)
+            self._devtypeprops = None
+            self._props        = None
+            self._arts         = None
+            self._ctrls        = None
+            self._ctrldBy      = None
+            if slot is not None:
+                self._set_slot(slot)
+
+
+        def _invalidate(self):
+            super(CCDB.Device, self)._invalidate()
             self._devtypeprops = None
-            self._props = None
-            self._arts  = None
+            self._props        = None
+            self._arts         = None
+            self._ctrls        = None
+            self._ctrldBy      = None
+
+
+        @property
+        def _slot(self):
+            if self._slot_data is None:
+                self.ccdb._hydrate(self)
+
+            return self._slot_data
+
+
+        def _set_slot(self, slot):
+            self._slot_data = CCDB.Device._intern_slot(slot)
+
+
+        @staticmethod
+        def _intern_slot(slot):
+            """
+            Interns (in place) the strings of 'slot' that are repeated across devices: names, device types, property names and types
+            """
+            intern = helpers.intern
+            for key in ("name", "deviceType", "slotType"):
+                if key in slot:
+                    slot[key] = intern(slot[key])
+
+            for key in CCDB.Device.DEVICE_LISTS:
+                names = slot.get(key)
+                if names:
+                    slot[key] = list(map(intern, names))
+
+            props = slot.get("properties")
+            if props:
+                slot["properties"] = [ dict((intern(k), intern(v) if k in CCDB.Device.PROPERTY_KEYS else v) for (k, v) in prop.items()) for prop in props ]
+
+            return slot
 
 
         def __repr__(self):
@@ -148,7 +210,10 @@ class CCDB(CC):
 
 
         def name(self):
-            return self._slot["name"]
+            if self._slot_data is None:
+                return self._name
+
+            return self._slot_data["name"]
 
 
         def type(self):
@@ -156,11 +221,23 @@ class CCDB(CC):
 
 
         def _controls(self):
-            return map(lambda dn: self.ccdb.device(dn), self._ensure(self._slot.get("controls", []), list))
+            if self._ctrls is None:
+                self._ctrls = self.ccdb._devices_by_name(self._ensure(self._slot.get("controls", []), list))
+
+            return self._ctrls
 
 
         def _controlledBy(self, filter_by_controlled_tree):
-            return filter(lambda nn: nn is not None, map(lambda dn: self.ccdb.device(dn, filter_by_controlled_tree), self._ensure(self._slot.get("controlledBy", []), list)))
+            if self._ctrldBy is not None:
+                return self._ctrldBy
+
+            names   = self._ensure(self._slot.get("controlledBy", []), list)
+            devices = self.ccdb._devices_by_name(names, filter_by_controlled_tree)
+            # Unknown devices are skipped if filtering by the controlled tree; the list is complete only if every device is known
+            if len(devices) == len(names):
+                self._ctrldBy = devices
+
+            return devices
 
 
         def _properties(self):
@@ -237,14 +314,20 @@ class CCDB(CC):
 
 
 
+    JSON_HEADERS = { 'Accept': 'application/json' }
+
     @staticmethod
     def default_url():
         return "https://ccdb.esss.lu.se"
 
 
-    def __init__(self, url = None, verify_ssl_cert = True, **kwargs):
+    def __init__(self, url = None, verify_ssl_cert = True, http_cache = False, **kwargs):
         CC.__init__(self, **kwargs)
-        CCDB.Device.ccdb = self
+
+        # The persistent HTTP cache is opt-in; open_from_args() turns it on unless --no-http-cache is used
+        if http_cache and CC.http_cache is None:
+            from ccdb_cache import HTTPCache
+            CC.http_cache = HTTPCache()
 
         if url is None:
             self._base_url = CCDB.default_url()
@@ -255,6 +338,14 @@ class CCDB(CC):
 
         self._verify_ssl_cert = verify_ssl_cert
 
+        # placeholder devices that are not yet downloaded
+        self._pending = OrderedDict()
+
+
+    def clear(self):
+        super(CCDB, self).clear()
+        self._pending = OrderedDict()
+
 
     def url(self):
         return self._base_url
@@ -264,18 +355,22 @@ class CCDB(CC):
         return self._rest_url
 
 
-    def download_from_ccdb(self, artifact_or_url, save_as):
+    def _download_url(self, artifact_or_url):
         if isinstance(artifact_or_url, CCDB.Artifact):
-            url = artifact_or_url.saveas_url()
-        else:
-            url = self.urljoin(self._rest_url, artifact_or_url)
-        return CC.download(url, save_as, verify_ssl_cert = self._verify_ssl_cert)
+            return artifact_or_url.saveas_url()
+
+        return self.urljoin(self._rest_url, artifact_or_url)
+
+
+    def download_from_ccdb(self, artifact_or_url, save_as):
+        return CC.download(self._download_url(artifact_or_url), save_as, verify_ssl_cert = self._verify_ssl_cert)
 
 
     def getAllDeviceNames(self):
-        url = self.urljoin(self._rest_url, "slotNames")
+        return self._parse_device_names(self._get(self.urljoin(self._rest_url, "slotNames")))
+
 
-        result  = self._get(url)
+    def _parse_device_names(self, result):
         tmpList = filter(lambda x: x["slotType"] == "SLOT", json.loads(result.text)["names"])
 
         # get all devices in CCDB
@@ -287,6 +382,14 @@ class CCDB(CC):
         return allDevices
 
 
+    def _name_index(self):
+        # Downloading and indexing every name takes time; keep the index between runs
+        if self._nameIndex is None:
+            self._nameIndex = NameIndex.load(self._rest_url, self.getAllDeviceNames)
+
+        return self._nameIndex
+
+
     def deviceName(self, deviceName):
         """
             Handles the case when a dictionary from a controls/controlledBy/etc list is used as 'deviceName'
@@ -297,30 +400,47 @@ class CCDB(CC):
             return deviceName
 
 
-    def _get_device(self, deviceName, single_device_only):
-        deviceName = self.deviceName(deviceName)
+    def _slot_url(self, deviceName):
+        return self.urljoin(self._rest_url, "slots", deviceName)
 
-        if deviceName not in self._devices:
-            url = self.urljoin(self._rest_url, "slots", deviceName)
 
-            result = self._get(url)
+    def _controls_url(self, deviceName):
+        return self.urljoin(self._rest_url, "slots", deviceName, "controls/?transitive=True")
 
-            if result.status_code != 200:
-                raise CC.DownloadException(url = url, code = result.status_code)
 
-            # Old versions of CCDB returned the installation slot entry itself and not a dictionary
-            tmpDict = json.loads(result.text)
-            try:
-                device = self.tostring(tmpDict["installationSlots"])
-                if not device:
-                    raise CC.NoSuchDeviceException(deviceName)
+    def _get_slot(self, deviceName):
+        """
+        Downloads and returns the installation slot entry of 'deviceName'
+        """
+        url = self._slot_url(deviceName)
 
-                if len(device) > 1:
-                    raise CC.Exception("More than one device found with the same name: {}".format(deviceName))
+        return self._parse_slot(deviceName, url, self._get(url))
 
-                device = device[0]
-            except KeyError:
-                device = self.tostring(tmpDict)
+
+    def _parse_slot(self, deviceName, url, result):
+        if result.status_code != 200:
+            raise CC.DownloadException(url = url, code = result.status_code)
+
+        # Old versions of CCDB returned the installation slot entry itself and not a dictionary
+        tmpDict = json.loads(result.text)
+        try:
+            device = self.tostring(tmpDict["installationSlots"])
+            if not device:
+                raise CC.NoSuchDeviceException(deviceName)
+
+            if len(device) > 1:
+                raise CC.Exception("More than one device found with the same name: {}".format(deviceName))
+
+            return device[0]
+        except KeyError:
+            return self.tostring(tmpDict)
+
+
+    def _get_device(self, deviceName, single_device_only):
+        deviceName = self.deviceName(deviceName)
+
+        if deviceName not in self._devices:
+            device = self._get_slot(deviceName)
 
             # compute here so that we can add device to _devices to maintain order of devices
             need_controls = not single_device_only and not self._devices
@@ -331,19 +451,92 @@ class CCDB(CC):
             if need_controls:
                 # If this is the first device, assume this is the root device, so
                 # Greedily request transitive controls information
-                url = self.urljoin(self._rest_url, "slots", deviceName, "controls/?transitive=True")
-
-                result = self._get(url)
-                if result.status_code == 200:
-                    slots = self.tostring(json.loads(result.text)["installationSlots"])
-                    for slot in slots:
-                        self._devices[slot["name"]] = self.Device(slot, ccdb = self)
+                self._add_controls(self._get(self._controls_url(deviceName)))
 
         return self._devices[deviceName]
 
 
+    def _add_controls(self, result):
+        if result.status_code == 200:
+            slots = self.tostring(json.loads(result.text)["installationSlots"])
+            for slot in slots:
+                self._add_slot(slot)
+
+
+    def _add_slot(self, slot):
+        """
+        Creates a device from 'slot' or fills in its placeholder
+        """
+        try:
+            device = self._pending.pop(slot["name"])
+            device._set_slot(slot)
+        except KeyError:
+            self._devices[slot["name"]] = self.Device(slot, ccdb = self)
+
+
+    def _devices_by_name(self, deviceNames, cachedOnly = False):
+        """
+        Unknown devices are not downloaded one-by-one; a placeholder is returned instead.
+        The placeholders are downloaded together when any of them is first used
+        """
+        if cachedOnly:
+            return super(CCDB, self)._devices_by_name(deviceNames, cachedOnly)
+
+        devices = []
+        for deviceName in map(self.deviceName, deviceNames):
+            try:
+                devices.append(self._devices[deviceName])
+            except KeyError:
+                device = self.Device(None, ccdb = self, name = deviceName)
+                self._devices[deviceName] = device
+                self._pending[deviceName] = device
+                devices.append(device)
+
+        return devices
+
+
+    def _hydrate(self, device):
+        """
+        Downloads every pending placeholder device (including 'device')
+        """
+        pending = list(self._pending.values())
+        if device not in pending:
+            pending.append(device)
+        self._pending = OrderedDict()
+
+        ex = None
+        for (dev, (slot, e)) in zip(pending, self._get_slots(pending)):
+            if e is None:
+                dev._set_slot(slot)
+                continue
+
+            # Only report the error for the device that is really used
+            if dev is device:
+                ex = e
+            else:
+                self._pending[dev.name()] = dev
+
+        if ex is not None:
+            raise ex
+
+
+    def _get_slots(self, devices):
+        """
+        Downloads the installation slot entries of 'devices' in parallel
+
+        Returns a list of (slot, None) or (None, exception) tuples
+        """
+        def get_slot(device):
+            try:
+                return (self._get_slot(device.name()), None)
+            except Exception as e:
+                return (None, e)
+
+        return self._parallel_map(get_slot, devices)
+
+
     def _get(self, url):
-        return CC.get(url, headers = { 'Accept': 'application/json' }, verify = self._verify_ssl_cert)
+        return CC.get(url, headers = CCDB.JSON_HEADERS, verify = self._verify_ssl_cert)
 
 
 
@@ -394,7 +587,7 @@ def main(argv):
     subparsers = parser.add_subparsers(title="commands", dest="command")
 
     def save(ccdb, args):
-        ccdb.save(args.save_as)
+        ccdb.save(args.save_as, base = args.base, formats = args.dump_formats, libyaml = args.dump_libyaml, dedupe_artifacts = args.dump_dedupe_artifacts)
 
     save_parser = subparsers.add_parser("save", help="Save a CCDB dump")
     save_parser.set_defaults(func=save)
@@ -404,6 +597,43 @@ def main(argv):
                         help = "save as .zip file",
                         required = True,
                         type = str)
+    save_parser.add_argument(
+                        "--base",
+                        help = "save only the changes since this CCDB dump",
+                        type = str)
+    CC.dump_args(save_parser)
+
+    def mirror(ccdb, args):
+        import time
+        from ccdb_dump import CCDB_Dump
+        from ccdb_mirror import CCDBMirror, MirroredCCDB
+
+        if isinstance(ccdb, (CCDB_Dump.Dump, MirroredCCDB)):
+            raise CC.Exception("Only a CCDB server can be mirrored")
+
+        mirror = CCDBMirror(args.mirror, ccdb.url())
+        while True:
+            (slots, artifacts, errors) = mirror.sync(ccdb, args.device)
+            print("Synced {} from {}: {} changed devices, {} changed artifacts, {} errors".format(mirror.directory(), ccdb.url(), slots, artifacts, errors))
+            if args.interval is None:
+                return
+
+            time.sleep(args.interval)
+            # Download everything again
+            ccdb.clear()
+
+    mirror_parser = subparsers.add_parser("mirror", help="Create or update a local mirror of CCDB")
+    mirror_parser.set_defaults(func=mirror)
+    CC.tool_device_args(mirror_parser, device_is_required=False)
+    mirror_parser.add_argument(
+                        "--mirror",
+                        help = "the directory of the mirror. Default: a per CCDB server directory under ~/.cache/ccdb/mirror",
+                        type = str)
+    mirror_parser.add_argument(
+                        "--interval",
+                        help = "keep running and sync again after this many seconds",
+                        metavar = "SECONDS",
+                        type = float)
 
     def show(ccdb, args):
         ccdb.tool_show(args)
@@ -427,7 +657,8 @@ def main(argv):
         single_device_only = args.no_controls_tree
     except AttributeError:
         single_device_only = False
-    ccdb.device(args.device, single_device_only = single_device_only)
+    if args.device is not None:
+        ccdb.device(args.device, single_device_only = single_device_only)
     args.func(ccdb, args)
 
 
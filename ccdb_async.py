@@ -0,0 +1,287 @@
+from __future__ import print_function
+from __future__ import absolute_import
+
+""" PLC Factory: asyncio based CCDB client (Python3 only) """
+
+__author__     = "Krisztian Loki"
+__copyright__  = "Copyright 2021, European Spallation Source, Lund"
+__license__    = "GPLv3"
+
+
+# Python libraries
+import asyncio
+import atexit
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import time
+
+import requests
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+# PLC Factory modules
+from cc import CC
+from ccdb import CCDB
+
+
+
+class AsyncCCDB(CCDB):
+    """
+    CCDB client that runs the requests on an asyncio event loop
+
+    If aiohttp is available it is used with a keep-alive connection pool of 'download_jobs' connections,
+    otherwise the requests are run on a thread pool using requests.
+    The coroutines (adevice(), agetAllDeviceNames(), adownload(), adownloadArtifacts()) can be used from asyncio code;
+    the usual synchronous CC interface runs them on a private event loop
+    """
+    _variants = dict()
+
+    def __init__(self, *args, **kwargs):
+        super(AsyncCCDB, self).__init__(*args, **kwargs)
+
+        self._loop     = asyncio.new_event_loop()
+        self._session  = None
+        self._executor = None
+
+        atexit.register(self.close)
+
+
+    @staticmethod
+    def variant_of(ccdb_class):
+        """
+        Returns the asynchronous variant of 'ccdb_class' (one of the CCDB subclasses)
+        """
+        try:
+            return AsyncCCDB._variants[ccdb_class]
+        except KeyError:
+            variant = type("Async" + ccdb_class.__name__, (AsyncCCDB, ccdb_class), dict())
+            AsyncCCDB._variants[ccdb_class] = variant
+            return variant
+
+
+    def close(self):
+        if self._loop.is_closed():
+            return
+
+        if self._session is not None:
+            self._loop.run_until_complete(self._session.close())
+            self._session = None
+
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+        self._loop.close()
+
+
+    def _run(self, coro):
+        return self._loop.run_until_complete(coro)
+
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers = max(self._download_jobs, 1))
+
+        return self._executor
+
+
+    def _get_session(self):
+        # Has to be created from a coroutine
+        if self._session is None:
+            self._session = aiohttp.ClientSession(connector = aiohttp.TCPConnector(limit          = max(self._download_jobs, 1),
+                                                                                   limit_per_host = max(CC.transport.max_connections, 1)))
+
+        return self._session
+
+
+    async def _aget_with_requests(self, url, headers):
+        return await asyncio.get_event_loop().run_in_executor(self._get_executor(), partial(CC.get, url, headers = headers, verify = self._verify_ssl_cert))
+
+
+    async def _aget(self, url, headers = None):
+        """
+        Returns a requests.Response of 'url'
+        """
+        if aiohttp is None:
+            return await self._aget_with_requests(url, headers)
+
+        http_cache = CC.http_cache
+        req_headers = http_cache.request_headers(url, headers) if http_cache is not None else headers
+
+        # Apply the same timeout/retry policy as CC.get()
+        transport = CC.transport
+        timeout   = transport.timeout if isinstance(transport.timeout, tuple) else (transport.timeout, transport.timeout)
+        timeout   = aiohttp.ClientTimeout(sock_connect = timeout[0], sock_read = timeout[1])
+        attempt   = 0
+        while True:
+            start = time.time()
+            try:
+                async with self._get_session().get(url, headers = req_headers, timeout = timeout, ssl = None if self._verify_ssl_cert else False) as r:
+                    result = requests.models.Response()
+                    result.status_code       = r.status
+                    result.url               = str(r.url)
+                    result.headers           = requests.structures.CaseInsensitiveDict(r.headers)
+                    result.encoding          = r.charset
+                    result._content          = await r.read()
+                    result._content_consumed = True
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                transport.record(url, time.time() - start)
+                if attempt >= transport.retries:
+                    raise
+            else:
+                transport.record(url, time.time() - start)
+                if not transport.should_retry(result.status_code) or attempt >= transport.retries:
+                    break
+
+            await asyncio.sleep(transport.retry_delay(attempt))
+            attempt += 1
+
+        if result.status_code == 401:
+            # Let requests ask for the credentials
+            return await self._aget_with_requests(url, headers)
+
+        if http_cache is not None:
+            cached = http_cache.response(url, headers, result)
+            if cached is None:
+                # Not modified but the cached response is gone; CC.get() asks for the whole response
+                return await self._aget_with_requests(url, headers)
+            result = cached
+
+        return result
+
+
+    def _get(self, url):
+        return self._run(self._aget(url, CCDB.JSON_HEADERS))
+
+
+    async def adevice(self, deviceName, cachedOnly = False, single_device_only = False):
+        """
+        The coroutine version of device()
+        """
+        deviceName = self.deviceName(deviceName)
+        try:
+            device = self._devices[deviceName]
+        except KeyError:
+            if cachedOnly:
+                return None
+
+            return await self._aget_device(deviceName, single_device_only)
+
+        if deviceName in self._pending:
+            await self._ahydrate(device)
+
+        return device
+
+
+    async def _aget_slot(self, deviceName):
+        url = self._slot_url(deviceName)
+
+        return self._parse_slot(deviceName, url, await self._aget(url, CCDB.JSON_HEADERS))
+
+
+    async def _aget_device(self, deviceName, single_device_only):
+        device = await self._aget_slot(deviceName)
+
+        # compute here so that we can add device to _devices to maintain order of devices
+        need_controls = not single_device_only and not self._devices
+
+        self._devices[deviceName] = self.Device(device, ccdb = self)
+
+        if need_controls:
+            self._add_controls(await self._aget(self._controls_url(deviceName), CCDB.JSON_HEADERS))
+
+        return self._devices[deviceName]
+
+
+    async def _ahydrate(self, device):
+        # The same as CCDB._hydrate() but the slots are downloaded by the coroutine
+        pending = list(self._pending.values())
+        self._pending = OrderedDict()
+
+        ex = None
+        for (dev, (slot, e)) in zip(pending, await self._aget_slots(pending)):
+            if e is None:
+                dev._set_slot(slot)
+            elif dev is device:
+                ex = e
+            else:
+                self._pending[dev.name()] = dev
+
+        if ex is not None:
+            raise ex
+
+
+    async def _aget_slots(self, devices):
+        async def get_slot(device):
+            try:
+                return (await self._aget_slot(device.name()), None)
+            except Exception as e:
+                return (None, e)
+
+        return await asyncio.gather(*[ get_slot(device) for device in devices ])
+
+
+    def _get_slots(self, devices):
+        return self._run(self._aget_slots(devices))
+
+
+    async def agetAllDeviceNames(self):
+        """
+        The coroutine version of getAllDeviceNames()
+        """
+        return self._parse_device_names(await self._aget(self.urljoin(self._rest_url, "slotNames"), CCDB.JSON_HEADERS))
+
+
+    def getAllDeviceNames(self):
+        return self._run(self.agetAllDeviceNames())
+
+
+    async def adownload(self, artifact_or_url, save_as):
+        """
+        The coroutine version of download_from_ccdb()
+        """
+        url    = self._download_url(artifact_or_url)
+        result = await self._aget(url)
+
+        if result.status_code != 200:
+            raise CC.DownloadException(url = url, code = result.status_code)
+
+        return CC.save_response(result, save_as)
+
+
+    def download_from_ccdb(self, artifact_or_url, save_as):
+        return self._run(self.adownload(artifact_or_url, save_as))
+
+
+    async def adownloadArtifacts(self, artifacts):
+        """
+        Downloads the (CCDB) file artifacts concurrently. Returns the number of downloaded artifacts
+
+        Errors are ignored; Artifact.download() will report them
+        """
+        todo = OrderedDict()
+        for artifact in artifacts:
+            if not isinstance(artifact, CCDB.Artifact) or not artifact.is_file():
+                continue
+
+            save_as = artifact.saveas()
+            if save_as not in todo and not self.has_artifact(save_as):
+                todo[save_as] = artifact
+
+        async def download(save_as, artifact):
+            try:
+                await self.adownload(artifact, save_as)
+                self._storeArtifact(save_as)
+                return True
+            except Exception:
+                return False
+
+        return sum(await asyncio.gather(*[ download(save_as, artifact) for (save_as, artifact) in todo.items() ]))
+
+
+    def prefetchArtifacts(self, artifacts):
+        return self._run(self.adownloadArtifacts(artifacts))
@@ -0,0 +1,217 @@
+from __future__ import print_function
+from __future__ import absolute_import
+
+""" PLC Factory: Persistent HTTP cache for CCDB """
+
+__author__     = "Krisztian Loki"
+__copyright__  = "Copyright 2021, European Spallation Source, Lund"
+__license__    = "GPLv3"
+
+
+# Python libraries
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+import requests
+
+# PLC Factory modules
+import helpers
+
+
+
+class HTTPCache(object):
+    """
+    On-disk cache of HTTP responses
+
+    Responses are stored together with their validators (ETag, Last-Modified); subsequent requests of the same URL
+    are sent as conditional GETs and a '304 Not Modified' reply is answered from the cache.
+    The least recently used entries are evicted once the size of the cache exceeds 'max_size' bytes.
+    """
+    MAX_SIZE    = 512 * 1024 * 1024
+    META_SUFFIX = ".meta"
+    BODY_SUFFIX = ".body"
+
+    def __init__(self, directory = None, max_size = MAX_SIZE):
+        if directory is None:
+            directory = helpers.create_cache_dir("ccdb", "http-cache")
+        else:
+            helpers.makedirs(directory)
+
+        self._directory = directory
+        self._max_size  = max_size
+        self._size      = None
+        self._lock      = threading.Lock()
+
+        self.revalidated = 0
+        self.downloaded  = 0
+        self.uncacheable = 0
+        self.evicted     = 0
+        self.bytes_saved = 0
+
+
+    @staticmethod
+    def _key(url, headers):
+        # The same URL can be requested in different formats (JSON vs. file download)
+        accept = headers.get("Accept", "") if headers else ""
+        return hashlib.sha1("\n".join([ url, accept ]).encode("utf-8")).hexdigest()
+
+
+    def _path(self, key, suffix):
+        return os.path.join(self._directory, key + suffix)
+
+
+    def _read_meta(self, key):
+        try:
+            with open(self._path(key, self.META_SUFFIX)) as m:
+                return json.load(m)
+        except (IOError, OSError, ValueError):
+            return None
+
+
+    def _write(self, key, suffix, data, mode):
+        (fd, tmp) = tempfile.mkstemp(dir = self._directory, prefix = ".", suffix = ".part")
+        try:
+            with os.fdopen(fd, mode) as f:
+                f.write(data)
+            helpers.replace_file(tmp, self._path(key, suffix))
+        except:
+            os.unlink(tmp)
+            raise
+
+
+    def request_headers(self, url, headers = None):
+        """
+        Returns 'headers' extended with the validators of the cached response of 'url' (if any)
+        """
+        key  = self._key(url, headers)
+        meta = self._read_meta(key)
+        if meta is None or not os.path.exists(self._path(key, self.BODY_SUFFIX)):
+            return headers
+
+        headers = dict(headers) if headers else dict()
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+        return headers
+
+
+    def response(self, url, headers, result):
+        """
+        Returns the response to use instead of 'result':
+         - a response built from the cache if 'result' is '304 Not Modified'
+         - None if 'result' is '304 Not Modified' but the cached response is gone (evicted by another process, for example);
+           the request has to be sent again without the validators
+         - 'result' itself otherwise (after storing it in the cache if it has validators)
+        """
+        key = self._key(url, headers)
+
+        if result.status_code == 304:
+            meta = self._read_meta(key)
+            body = self._path(key, self.BODY_SUFFIX)
+            try:
+                with open(body, "rb") as b:
+                    content = b.read()
+                # Mark as recently used
+                os.utime(body, None)
+            except (IOError, OSError):
+                return None
+
+            cached = requests.models.Response()
+            cached.status_code       = 200
+            cached.url               = result.url
+            cached.request           = result.request
+            cached.encoding          = meta.get("encoding") if meta else None
+            cached.headers           = requests.structures.CaseInsensitiveDict(meta.get("headers", {}) if meta else {})
+            cached._content          = content
+            cached._content_consumed = True
+
+            with self._lock:
+                self.revalidated += 1
+                self.bytes_saved += len(content)
+
+            return cached
+
+        if result.status_code != 200:
+            return result
+
+        etag          = result.headers.get("ETag")
+        last_modified = result.headers.get("Last-Modified")
+        if not etag and not last_modified:
+            with self._lock:
+                self.uncacheable += 1
+            return result
+
+        content = result.content
+        meta    = { "url"           : url,
+                    "etag"          : etag,
+                    "last_modified" : last_modified,
+                    "encoding"      : result.encoding,
+                    "size"          : len(content),
+                    "headers"       : dict(result.headers) }
+
+        try:
+            self._write(key, self.BODY_SUFFIX, content, "wb")
+            self._write(key, self.META_SUFFIX, json.dumps(meta), "w")
+        except (IOError, OSError):
+            return result
+
+        with self._lock:
+            self.downloaded += 1
+            if self._size is not None:
+                self._size += len(content)
+            self._evict()
+
+        return result
+
+
+    def _evict(self):
+        """
+        Removes the least recently used entries until the cache is within its size limit
+
+        Must be called with self._lock held
+        """
+        if self._size is not None and self._size <= self._max_size:
+            return
+
+        entries = []
+        for f in os.listdir(self._directory):
+            if not f.endswith(self.BODY_SUFFIX):
+                continue
+            try:
+                st = os.stat(os.path.join(self._directory, f))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, f[:-len(self.BODY_SUFFIX)]))
+
+        self._size = sum(e[1] for e in entries)
+        if self._size <= self._max_size:
+            return
+
+        # Evict down to 90% to not rescan the directory on every new entry
+        target = self._max_size * 9 // 10
+        for (_, size, key) in sorted(entries):
+            if self._size <= target:
+                break
+            for suffix in (self.META_SUFFIX, self.BODY_SUFFIX):
+                try:
+                    os.unlink(self._path(key, suffix))
+                except OSError:
+                    pass
+            self._size  -= size
+            self.evicted += 1
+
+
+    def stats(self):
+        """
+        Returns a one-line summary of the cache usage
+        """
+        return "HTTP cache: {} revalidated ({:.1f} MiB not downloaded), {} downloaded, {} not cacheable, {} evicted".format(self.revalidated,
+                                                                                                                            self.bytes_saved / (1024.0 * 1024.0),
+                                                                                                                            self.downloaded,
+                                                                                                                            self.uncacheable,
+                                                                                                                            self.evicted)
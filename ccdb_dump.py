@@ -10,14 +10,26 @@ __license__    = "GPLv3"
 
 # Python libraries
 import ast
+import codecs
+from collections import OrderedDict
+import hashlib
+import json
 from os import path as os_path
+from os import walk as os_walk
+from shutil import copyfileobj
 
 # PLC Factory modules
+from blob_store import BlobStore
 from cc import CC
 from ccdb import CCDB
+import helpers
+from json_stream import JSONStream
 
 
 class CCDB_Dump(object):
+    # Buffer size used when an artifact has to be extracted to a file
+    COPY_BUFFER_SIZE = 1024 * 1024
+
     @staticmethod
     def load(filename):
         if os_path.isdir(filename):
@@ -28,6 +40,25 @@ class CCDB_Dump(object):
             raise CC.Exception("No CCDB dump found at " + filename)
 
 
+    @staticmethod
+    def full_dump_of(filename):
+        """
+        Returns the filename of the full dump that (zip) dump 'filename' is a delta of, 'filename' itself if it is a full dump
+        or None if there is no such dump
+        """
+        import zipfile
+        try:
+            with zipfile.ZipFile(filename, "r") as z:
+                index = json.loads(z.read(os_path.join("ccdb", CC.DEVICE_INDEX)).decode("utf-8"))
+        except (IOError, OSError, KeyError, ValueError, zipfile.BadZipfile):
+            return None
+
+        if "base" not in index:
+            return filename
+
+        return CCDB_Dump.full_dump_of(os_path.normpath(os_path.join(os_path.dirname(os_path.abspath(filename)), index["base"])))
+
+
 
     class Dump(CCDB):
         class Artifact(CCDB.Artifact):
@@ -43,11 +74,15 @@ class CCDB_Dump(object):
 
 
         class DeviceType(CCDB.DeviceType):
+            __slots__ = ()
+
             def url(self):
                 return None
 
 
         class Device(CCDB.Device):
+            __slots__ = ()
+
             def url(self):
                 return None
 
@@ -61,17 +96,32 @@ class CCDB_Dump(object):
 
 
         def __init__(self):
-            super(CCDB_Dump.Dump, self).__init__()
-            CCDB.Device.ccdb = self
+            # Dumps never download anything
+            super(CCDB_Dump.Dump, self).__init__(http_cache = False)
+
+            # device name, record number pairs if the dump has an index
+            self._index = None
+
+            # device name, SHA-256 of device record pairs if the index has them
+            self._digests = dict()
+
+            # artifact, SHA-256 pairs and SHA-256, artifact the content is saved as pairs (if the dump has CC.ARTIFACT_JSON)
+            self._artifacts    = dict()
+            self._blobs        = dict()
+            self._has_manifest = False
+
+            # the dump this one is a delta of
+            self._base     = None
+            self._basepath = None
 
 
         # do not dump
-        def save(self, filename, dir = None):
+        def save(self, filename, dir = None, base = None, formats = None, libyaml = False, dedupe_artifacts = False):
             return None
 
 
-        def dump(self, filename, dir = None):
-            return self.save(filename, dir)
+        def dump(self, filename, dir = None, base = None, formats = None, libyaml = False, dedupe_artifacts = False):
+            return self.save(filename, dir, base, formats, libyaml, dedupe_artifacts)
 
 
         # do not clear
@@ -84,15 +134,242 @@ class CCDB_Dump(object):
             raise CC.DownloadException(url = url, code = "Inconsistent CCDB dump: this artifact was not downloaded from CCDB")
 
 
-        # prevent downloading possibly new revisions of def files
+        # prevent downloading possibly new revisions of def files; extract artifact and save as save_as
         def download(self, url, save_as):
-            raise CC.DownloadException(url = url, code = "Inconsistent CCDB dump: this artifact was not downloaded")
+            try:
+                with self._open_source(save_as) as r:
+                    store = CC.blob_store
+                    if store is not None:
+                        # populate the artifact store; the next extraction of the same content is a link
+                        digest = store.put(r)
+                        store.link(digest, save_as)
+                        self._artifacts[self._dump_path(save_as)] = digest
+                    else:
+                        helpers.makedirs(os_path.dirname(save_as) or ".")
+                        with open(save_as, "wb") as w:
+                            copyfileobj(r, w, CCDB_Dump.COPY_BUFFER_SIZE)
+            except KeyError:
+                raise CC.DownloadException(url = url, code = "Inconsistent CCDB dump: this artifact was not downloaded")
+            except (IOError, OSError) as e:
+                raise CC.DownloadException(url = url, code = repr(e))
+
+            return save_as
+
+
+        def _dump_path(self, save_as):
+            """
+            Returns the name of artifact 'save_as' in the dump
+            """
+            return save_as
+
+
+        def _artifact_source(self, save_as):
+            """
+            Returns the name of the file in the dump that has the content of artifact 'save_as'
+            """
+            path = self._dump_path(save_as)
+            try:
+                return self._blobs[self._artifacts[path]]
+            except KeyError:
+                return path
+
+
+        def _open_source(self, save_as):
+            """
+            Returns the file that has the content of artifact 'save_as' as a binary file object; from the base dump if needed
+            """
+            return self._open_layered(self._artifact_source(save_as))
+
+
+        def _open_layered(self, filename):
+            try:
+                return self._open(filename)
+            except KeyError:
+                if self._base is None:
+                    raise
+
+                return self._base._open_layered(filename)
+
+
+        def _stored_artifact(self, save_as):
+            """
+            Returns the digest of artifact 'save_as' if it is in the artifact store, None otherwise
+            """
+            digest = self._artifacts.get(self._dump_path(save_as))
+            if digest is not None and CC.blob_store is not None and CC.blob_store.has(digest):
+                return digest
+
+            return None
+
+
+        # artifacts are read from the dump; there is no need to extract them
+        def has_artifact(self, save_as):
+            if os_path.exists(save_as) or self._stored_artifact(save_as) is not None:
+                return True
+
+            try:
+                self._open_source(save_as).close()
+                return True
+            except KeyError:
+                return False
+
+
+        def open_artifact(self, save_as):
+            if os_path.exists(save_as):
+                return open(save_as, "rb")
+
+            digest = self._stored_artifact(save_as)
+            if digest is not None:
+                try:
+                    return CC.blob_store.open(digest)
+                except (IOError, OSError):
+                    # evicted in the meantime
+                    pass
+
+            return self._open_source(save_as)
+
+
+        def extract_artifact(self, save_as):
+            if not os_path.exists(save_as):
+                digest = self._stored_artifact(save_as)
+                if digest is not None:
+                    try:
+                        return CC.blob_store.link(digest, save_as)
+                    except (IOError, OSError):
+                        # evicted in the meantime
+                        pass
+                self.download(None, save_as)
+
+            return save_as
+
+
+        # artifacts are extracted from the dump on demand; there is nothing to prefetch
+        def prefetchArtifacts(self, artifacts):
+            return 0
 
 
         def getAllDeviceNames(self):
+            if self._index is not None:
+                return list(self._index.keys())
+
             return list(self._devices.keys())
 
 
+        def _all_devices(self):
+            if self._index is not None and len(self._devices) != len(self._index):
+                for deviceName in self._index:
+                    self.device(deviceName)
+                # keep the order of the dump
+                self._devices = OrderedDict((deviceName, self._devices[deviceName]) for deviceName in self._index)
+
+            return self._devices
+
+
+        def _open(self, filename):
+            """
+            Returns 'filename' of the dump as a binary file object. Raises KeyError if it does not exist
+            """
+            raise NotImplementedError
+
+
+        def _read(self, filename):
+            """
+            Returns the contents of 'filename' of the dump as a string. Raises KeyError if it does not exist
+            """
+            with self._open(filename) as f:
+                return f.read().decode("utf-8")
+
+
+        def _load(self):
+            """
+            Loads the devices of the dump:
+             - on demand if the dump has an index
+             - otherwise every device from CC.DEVICE_JSON
+             - or from CC.DEVICE_DICT if it is an old dump
+            """
+            self._loadArtifacts()
+
+            try:
+                self._createIndex(self._read(CC.DEVICE_INDEX))
+                return
+            except KeyError:
+                pass
+
+            try:
+                with self._open(CC.DEVICE_JSON) as f:
+                    self._createDevicesFromJSON(codecs.getreader("utf-8")(f))
+                return
+            except KeyError:
+                pass
+
+            try:
+                devicedict = self._read(CC.DEVICE_DICT)
+            except KeyError:
+                raise CC.Exception("Required file '{}' does not exist!".format(CC.DEVICE_DICT))
+
+            self._createDevices(devicedict)
+
+
+        def _loadArtifacts(self):
+            try:
+                manifest = json.loads(self._read(CC.ARTIFACT_JSON))
+            except KeyError:
+                # Every artifact is saved as itself
+                return
+            except ValueError as e:
+                raise CC.Exception("Invalid {}: {}".format(CC.ARTIFACT_JSON, e))
+
+            self._artifacts    = manifest["artifacts"]
+            self._blobs        = manifest["saved_as"]
+            self._has_manifest = True
+
+
+        def _createIndex(self, index):
+            try:
+                index = json.loads(index)
+                names = CC.tostring(index["devices"])
+                self._index = OrderedDict((name, i) for (i, name) in enumerate(names))
+                self._digests = dict(zip(names, index.get("digests", [])))
+            except Exception as e:
+                raise CC.Exception(e)
+
+            if "base" in index:
+                self._loadBase(os_path.normpath(os_path.join(self._dirname(), index["base"])))
+
+
+        def _dirname(self):
+            """
+            Returns the directory that the base of a delta dump is relative to
+            """
+            raise NotImplementedError
+
+
+        def _loadBase(self, basepath):
+            """
+            Loads the dump this one is a delta of; the devices and artifacts not in this dump are taken from there
+            """
+            try:
+                self._base = CCDB_Dump.load(basepath)
+            except CC.Exception as e:
+                raise CC.Exception("Cannot load the base of delta CCDB dump: {}".format(e))
+            self._basepath = basepath
+
+            blobs = dict(self._base._blobs)
+            blobs.update(self._blobs)
+            self._blobs = blobs
+
+
+        def _createDevicesFromJSON(self, f):
+            """
+            Creates the devices as they are decoded from the 'devices' object of (the file object of) a CC.DEVICE_JSON
+            """
+            try:
+                for (key, value) in JSONStream(f).items("devices"):
+                    self._devices[CC.tostring(key)] = self.Device(CC.tostring(value), ccdb = self)
+            except (KeyError, ValueError) as e:
+                raise CC.Exception("Invalid {}: {}".format(CC.DEVICE_JSON, e))
+
+
         def _createDevices(self, devicedict):
             try:
                 deviceDict = ast.literal_eval(devicedict)
@@ -104,7 +381,69 @@ class CCDB_Dump(object):
 
 
         def _get_device(self, deviceName, single_device_only):
-            raise CC.Exception("Inconsistent CCDB dump: No such device: {}".format(deviceName))
+            deviceName = self.deviceName(deviceName)
+            try:
+                record = CC.DEVICE_RECORD.format(self._index[deviceName])
+            except (KeyError, TypeError):
+                raise CC.Exception("Inconsistent CCDB dump: No such device: {}".format(deviceName))
+
+            try:
+                slot = CC.tostring(json.loads(self._read(record)))
+            except KeyError:
+                if self._base is None:
+                    raise CC.Exception("Inconsistent CCDB dump: Required file '{}' does not exist!".format(record))
+
+                # not changed since the base dump
+                slot = self._base.device(deviceName).to_json()
+
+            device = self.Device(slot, ccdb = self)
+            self._devices[deviceName] = device
+
+            return device
+
+
+        def deviceDigest(self, deviceName):
+            """
+            Returns the SHA-256 of the record of device 'deviceName'; equal digests mean equal devices
+            """
+            try:
+                return self._digests[deviceName]
+            except KeyError:
+                return hashlib.sha256(json.dumps(self.device(deviceName).to_json()).encode("utf-8")).hexdigest()
+
+
+        def artifactDigests(self):
+            """
+            Returns the SHA-256 of the saved artifacts (keyed by the artifact filename)
+
+            Dumps without CC.ARTIFACT_JSON have every artifact saved as itself; their digests are computed from the content
+            """
+            if self._has_manifest:
+                return self._artifacts
+
+            digests = dict()
+            for member in self._artifact_members():
+                with self._open(member) as f:
+                    digests[member] = BlobStore.digest_of(f)
+
+            return digests
+
+
+        def _artifact_members(self):
+            """
+            Yields the (names of the) files of the dump under CC.TEMPLATE_DIR
+            """
+            raise NotImplementedError
+
+
+        # the index is cheap to build; do not persist it
+        def _name_index(self):
+            return CC._name_index(self)
+
+
+        # every device is already loaded; no need for placeholders
+        def _devices_by_name(self, deviceNames, cachedOnly = False):
+            return CC._devices_by_name(self, deviceNames, cachedOnly)
 
 
 
@@ -117,16 +456,7 @@ class CCDB_Dump(object):
             else:
                 self._rootpath = directory
 
-            try:
-                with open(os_path.join(self._rootpath, CC.DEVICE_DICT)) as dd:
-                    devicedict = dd.readline()
-            except IOError as e:
-                if e.errno == 2:
-                    raise CC.Exception("Required file '{}' does not exist!".format(CC.DEVICE_DICT))
-                else:
-                    raise
-
-            self._createDevices(devicedict)
+            self._load()
 
             # Create our own TEMPLATE_DIR
             self.TEMPLATE_DIR = os_path.join(self._rootpath, CC.TEMPLATE_DIR)
@@ -136,6 +466,48 @@ class CCDB_Dump(object):
             return "CCDB Directory at " + self._rootpath
 
 
+        def _dirname(self):
+            # the dump was extracted next to the zip file
+            extracted = os_path.abspath(self._rootpath)
+            if os_path.basename(extracted) == "ccdb":
+                extracted = os_path.dirname(extracted)
+
+            return os_path.dirname(extracted)
+
+
+        def _dump_path(self, save_as):
+            # our TEMPLATE_DIR is inside the dump
+            return os_path.relpath(save_as, self._rootpath)
+
+
+        # artifacts with the same content are saved only once; use the saved one instead of creating a copy
+        def extract_artifact(self, save_as):
+            if os_path.exists(save_as):
+                return save_as
+
+            source = os_path.join(self._rootpath, self._artifact_source(save_as))
+            if os_path.exists(source):
+                return source
+
+            # not changed since the base dump
+            return super(CCDB_Dump.DirDump, self).extract_artifact(save_as)
+
+
+        def _artifact_members(self):
+            for (dirpath, dirnames, filenames) in os_walk(os_path.join(self._rootpath, CC.TEMPLATE_DIR)):
+                for fname in filenames:
+                    yield os_path.relpath(os_path.join(dirpath, fname), self._rootpath)
+
+
+        def _open(self, filename):
+            try:
+                return open(os_path.join(self._rootpath, filename), "rb")
+            except IOError as e:
+                if e.errno == 2:
+                    raise KeyError(filename)
+                raise
+
+
 
     class ZipDump(Dump):
         def __init__(self, filename):
@@ -146,53 +518,65 @@ class CCDB_Dump(object):
             self._rootpath = "ccdb"
             self._zipfilename = filename
 
-            try:
-                self._createDevices(self._zipfile.read(os_path.join(self._rootpath, CC.DEVICE_DICT)).decode())
-            except KeyError:
-                raise CC.Exception("Required file '{}' does not exist!".format(CC.DEVICE_DICT))
+            self._load()
 
 
         def url(self):
             return "CCDB Zip file at " + self._zipfilename
 
 
-        # extract artifact and save as save_as
-        def download_from_ccdb(self, url, save_as):
-            return self.download(url, save_as)
+        def _dirname(self):
+            return os_path.dirname(os_path.abspath(self._zipfilename))
 
 
-        # extract artifact and save as save_as
-        def download(self, url, save_as):
-            try:
-                with self._zipfile.open(os_path.join(self._rootpath, save_as)) as r:
-                    with open(save_as, "w") as w:
-                        try:
-                            "".decode()
-                            # Python2
-                            w.writelines(map(lambda x: x.decode('utf-8').encode('utf-8'), r))
-                        except AttributeError:
-                            # Python3
-                            w.writelines(map(lambda x: x.decode(), r))
-            except KeyError as e:
-                raise CC.DownloadException(url = url, code = e.args[0])
-            except Exception as e:
-                raise CC.DownloadException(url = url, code = repr(e))
+        def _open(self, filename):
+            return self._zipfile.open(os_path.join(self._rootpath, filename))
 
-            return save_as
+
+        def _artifact_members(self):
+            prefix = "/".join([ self._rootpath, CC.TEMPLATE_DIR, "" ])
+            for name in self._zipfile.namelist():
+                if name.startswith(prefix) and not name.endswith("/"):
+                    yield os_path.normpath(name[len(self._rootpath) + 1:])
+
+
+        # extract artifact and save as save_as
+        def download_from_ccdb(self, url, save_as):
+            return self.download(url, save_as)
 
 
         # return zipfile
-        def save(self, filename, directory = "."):
+        # the dump is copied as is; 'formats', 'libyaml' and 'dedupe_artifacts' are ignored
+        def save(self, filename, directory = ".", base = None, formats = None, libyaml = False, dedupe_artifacts = False):
             if isinstance(filename, str):
                 filename = self._save_filename(directory, filename)
                 if not filename == self._zipfilename:
-                    from shutil import copy
-                    copy(self._zipfilename, filename)
+                    if self._base is None:
+                        from shutil import copy
+                        copy(self._zipfilename, filename)
+                    else:
+                        self._copy_delta(filename)
                 return filename
 
             return None
 
 
+        def _copy_delta(self, filename):
+            """
+            Copies this delta dump as 'filename'; the reference to the base dump has to be relative to the copy
+            """
+            import zipfile
+            index_member = os_path.join(self._rootpath, CC.DEVICE_INDEX)
+            with zipfile.ZipFile(filename, "w", zipfile.ZIP_DEFLATED) as dst:
+                for info in self._zipfile.infolist():
+                    if info.filename == index_member:
+                        index = json.loads(self._zipfile.read(info).decode("utf-8"))
+                        index["base"] = os_path.relpath(self._basepath, os_path.dirname(os_path.abspath(filename)))
+                        dst.writestr(info, json.dumps(index))
+                    else:
+                        dst.writestr(info, self._zipfile.read(info))
+
+
 
 
 def validate_names(ccdb, args):
@@ -228,6 +612,151 @@ def validate_names(ccdb, args):
         print("All names are valid")
 
 
+def _changes(old, new):
+    """
+    Returns the added, removed and changed items of dicts 'old' and 'new'
+    """
+    changes = OrderedDict()
+    added   = OrderedDict((k, v) for (k, v) in new.items() if k not in old)
+    removed = OrderedDict((k, v) for (k, v) in old.items() if k not in new)
+    changed = OrderedDict((k, [ old[k], v ]) for (k, v) in new.items() if k in old and old[k] != v)
+    for (key, value) in (("added", added), ("removed", removed), ("changed", changed)):
+        if value:
+            changes[key] = value
+
+    return changes
+
+
+def _list_changes(old, new):
+    """
+    Returns the added and removed elements of lists 'old' and 'new'
+    """
+    changes = OrderedDict()
+    added   = [ e for e in new if e not in old ]
+    removed = [ e for e in old if e not in new ]
+    for (key, value) in (("added", added), ("removed", removed)):
+        if value:
+            changes[key] = value
+
+    return changes
+
+
+def _device_changes(old_dump, old, new_dump, new):
+    """
+    Returns the differences of the type, description, properties, artifacts and controls relation of devices 'old' and 'new'
+    """
+    def names(dump, slot, key):
+        return [ dump.deviceName(name) for name in slot.get(key) or [] ]
+
+    def artifacts(slot):
+        return OrderedDict((a["name"], a) for a in slot.get("artifacts") or [])
+
+    old_slot = old.to_json()
+    new_slot = new.to_json()
+    changes  = OrderedDict()
+    for (key, old_value, new_value) in (("deviceType",  old.deviceType(),  new.deviceType()),
+                                        ("description", old.description(), new.description())):
+        if old_value != new_value:
+            changes[key] = [ old_value, new_value ]
+
+    for (key, change) in (("properties",   _changes(old.properties(), new.properties())),
+                          ("artifacts",    _changes(artifacts(old_slot), artifacts(new_slot))),
+                          ("controls",     _list_changes(names(old_dump, old_slot, "controls"), names(new_dump, new_slot, "controls"))),
+                          ("controlledBy", _list_changes(names(old_dump, old_slot, "controlledBy"), names(new_dump, new_slot, "controlledBy")))):
+        if change:
+            changes[key] = change
+
+    return changes
+
+
+def _artifact_owners(dump, filenames):
+    """
+    Returns the names of the devices of 'dump' that have (device or device type) artifacts saved as one of 'filenames'
+    """
+    unique_ids = set()
+    for filename in filenames:
+        parts = os_path.normpath(filename).split(os_path.sep)
+        if len(parts) > 2:
+            unique_ids.add(parts[1])
+    if not unique_ids:
+        return set()
+
+    owners = set()
+    for deviceName in dump.getAllDeviceNames():
+        # per device artifacts are saved in the directory of the device; per device type ones in that of the device type
+        if helpers.sanitize_path(deviceName) in unique_ids or helpers.sanitize_path(dump.device(deviceName).deviceType()) in unique_ids:
+            owners.add(deviceName)
+
+    return owners
+
+
+def _controlling(dump, deviceNames):
+    """
+    Returns the devices of 'dump' that directly or indirectly control any of 'deviceNames', including 'deviceNames'
+    """
+    known = set(dump.getAllDeviceNames())
+    seen  = set(d for d in deviceNames if d in known)
+    pool  = list(seen)
+    while pool:
+        for parent in dump.device(pool.pop()).to_json().get("controlledBy") or []:
+            parent = dump.deviceName(parent)
+            if parent in known and parent not in seen:
+                seen.add(parent)
+                pool.append(parent)
+
+    return seen
+
+
+def diff_dumps(old, new):
+    """
+    Returns the change set between dumps 'old' and 'new'
+
+    Devices with the same record digest are not compared. 'affected' lists the devices of 'new' whose controls tree has
+    a changed device or artifact; ie the devices that need to be regenerated
+    """
+    old_names = old.getAllDeviceNames()
+    new_names = new.getAllDeviceNames()
+    old_set   = set(old_names)
+    new_set   = set(new_names)
+
+    added     = [ d for d in new_names if d not in old_set ]
+    removed   = [ d for d in old_names if d not in new_set ]
+    changed   = OrderedDict()
+    unchanged = 0
+    for deviceName in new_names:
+        if deviceName not in old_set:
+            continue
+
+        if old.deviceDigest(deviceName) == new.deviceDigest(deviceName):
+            unchanged += 1
+            continue
+
+        changes = _device_changes(old, old.device(deviceName), new, new.device(deviceName))
+        if changes:
+            changed[deviceName] = changes
+        else:
+            unchanged += 1
+
+    artifacts = _changes(old.artifactDigests(), new.artifactDigests())
+    new_files = list(artifacts.get("added", {}).keys()) + list(artifacts.get("changed", {}).keys())
+    old_files = list(artifacts.get("removed", {}).keys()) + list(artifacts.get("changed", {}).keys())
+
+    affected = _controlling(new, added + list(changed.keys()) + list(_artifact_owners(new, new_files)))
+    affected.update(_controlling(old, removed + list(_artifact_owners(old, old_files))) & new_set)
+
+    changeset = OrderedDict()
+    changeset["old"]       = old.url()
+    changeset["new"]       = new.url()
+    changeset["added"]     = added
+    changeset["removed"]   = removed
+    changeset["changed"]   = changed
+    changeset["unchanged"] = unchanged
+    changeset["artifacts"] = artifacts
+    changeset["affected"]  = sorted(affected)
+
+    return changeset
+
+
 def main(argv):
     import argparse
 
@@ -249,6 +778,25 @@ def main(argv):
     tree_parser = CC.tool_controls_tree_subparser(subparsers)
     tree_parser.set_defaults(func=controls_tree)
 
+    def diff(ccdb, args):
+        changeset = json.dumps(diff_dumps(CCDB_Dump.load(args.old_ccdb_dump_file), ccdb), indent = 4)
+        if args.output is None:
+            print(changeset)
+        else:
+            with open(args.output, "w") as f:
+                print(changeset, file = f)
+
+    diff_parser = subparsers.add_parser("diff", help="Print the changes since an older CCDB dump as JSON")
+    diff_parser.add_argument("old_ccdb_dump_file",
+                             help = "the older CCDB dump",
+                             type = str
+                             )
+    diff_parser.add_argument("--output",
+                             help = "save the changes to this file",
+                             type = str
+                             )
+    diff_parser.set_defaults(func=diff)
+
     parser.add_argument("ccdb_dump_file",
                         help = "CCDB dump",
                         type = str
@@ -159,6 +159,8 @@ class CCDB_Factory(CC):
 
 
     class Device(CCDB.Device):
+        __slots__ = ()
+
         # Leave everything (that is not a string) as None here
         # Change the value after an instance has been created
         default_device_dict = {"slotType"     : "SLOT",
@@ -216,6 +218,9 @@ class CCDB_Factory(CC):
                 except TypeError:
                     # Handle 'controlledBy' is None case
                     device._slot["controlledBy"] = [ self.name() ]
+                device._invalidate()
+
+            self._invalidate()
 
             return self
 
@@ -225,6 +230,7 @@ class CCDB_Factory(CC):
                 self._slot["properties"] = []
 
             str_value = str(value) if value is not None else None
+            self._invalidate()
             for prop in self._slot["properties"]:
                 if prop["name"] == key:
                     prop["value"] = str_value
@@ -259,6 +265,7 @@ class CCDB_Factory(CC):
         def __addArtifact(self, artifactDict):
             if not CCDB_Factory.checkArtifact(self._slot["artifacts"], artifactDict):
                 return
+            self._invalidate()
             try:
                 self._slot["artifacts"].append(artifactDict)
             except AttributeError:
@@ -303,7 +310,6 @@ class CCDB_Factory(CC):
 
     def __init__(self, git_tag = None):
         super(CCDB_Factory, self).__init__()
-        CCDB_Factory.Device.ccdb = self
         self._git_tag    = git_tag
         self._artifacts  = dict()
         self._properties = dict()
@@ -329,6 +335,7 @@ class CCDB_Factory(CC):
                                    {'dataType': 'Integer', 'value': '10', 'kind': 'SLOT', 'name': 'PLCF#PLC-DIAG:Max-Modules-In-IO-Device', 'unit': None},
                                    {'dataType': 'String', 'value': 'Pulse_200ms', 'kind': 'SLOT', 'name': 'PLCF#PLC-EPICS-COMMS: PLCPulse', 'unit': None},
                                   ]
+        plc._invalidate()
         return plc
 
 
@@ -347,6 +354,7 @@ class CCDB_Factory(CC):
                                    {'dataType': 'Integer', 'value': '1', 'kind': 'SLOT', 'name': 'PLCF#PLC-DIAG:Max-IO-Devices', 'unit': None},
                                    {'dataType': 'Integer', 'value': '10', 'kind': 'SLOT', 'name': 'PLCF#PLC-DIAG:Max-Local-Modules', 'unit': None},
                                    {'dataType': 'Integer', 'value': '10', 'kind': 'SLOT', 'name': 'PLCF#PLC-DIAG:Max-Modules-In-IO-Device', 'unit': None}]
+        plc._invalidate()
         return plc
 
 
@@ -385,11 +393,13 @@ class CCDB_Factory(CC):
                 # No properties for this deviceType
                 pass
 
+            device._invalidate()
+
         return device
 
 
     def _get_device(self, deviceName, single_device_only):
-        device = CCDB_Factory.Device(deviceName)
+        device = CCDB_Factory.Device(deviceName, ccdb = self)
         self._devices[deviceName] = device
         return device
 
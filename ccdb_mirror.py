@@ -0,0 +1,362 @@
+from __future__ import print_function
+from __future__ import absolute_import
+
+""" PLC Factory: Local mirror of CCDB """
+
+__author__     = "Krisztian Loki"
+__copyright__  = "Copyright 2021, European Spallation Source, Lund"
+__license__    = "GPLv3"
+
+
+# Python libraries
+from collections import OrderedDict
+import datetime
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+# PLC Factory modules
+from blob_store import BlobStore
+from cc import CC
+from ccdb import CCDB
+import helpers
+
+
+
+class CCDBMirror(object):
+    """
+    A local copy of (a part of) CCDB
+
+    The installation slots and the file artifacts are stored in a BlobStore; the index (INDEX) maps device names and
+    artifact download URLs (relative to the REST API) to blobs. sync() downloads the controls tree of a device (or every
+    device) and updates only the slots and artifacts that changed. The index is replaced atomically and blobs are never
+    modified, so the mirror can be synced (from cron or with 'ccdb.py mirror --interval') while PLCFactory is reading it
+    """
+    INDEX   = "mirror.json"
+    VERSION = 1
+
+    def __init__(self, directory = None, url = None):
+        if directory is None:
+            directory = CCDBMirror.default_directory(url)
+        else:
+            helpers.makedirs(directory)
+
+        self._directory = directory
+        # the index refers to the blobs; nothing can be evicted
+        self._blobs     = BlobStore(os.path.join(directory, "blobs"), max_size = None)
+        self._index     = self._load_index()
+        self._lock      = threading.Lock()
+
+        if url is not None and self._index["url"] is not None and self._index["url"] != url:
+            raise CC.Exception("{} is a mirror of {}, not {}".format(directory, self._index["url"], url))
+
+        self.hits   = 0
+        self.misses = 0
+
+
+    @staticmethod
+    def default_directory(url = None):
+        return helpers.create_cache_dir("ccdb", os.path.join("mirror", helpers.url_to_path(url if url is not None else CCDB.default_url())))
+
+
+    def directory(self):
+        return self._directory
+
+
+    def _load_index(self):
+        try:
+            with open(os.path.join(self._directory, CCDBMirror.INDEX)) as f:
+                index = json.load(f)
+            if index.get("version") == CCDBMirror.VERSION:
+                return index
+        except (IOError, OSError, ValueError):
+            pass
+
+        return { "version": CCDBMirror.VERSION, "url": None, "synced": None, "names": None, "slots": dict(), "artifacts": dict() }
+
+
+    def _save_index(self):
+        (fd, tmp) = tempfile.mkstemp(dir = self._directory, prefix = ".", suffix = ".part")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(self._index, f)
+            helpers.replace_file(tmp, os.path.join(self._directory, CCDBMirror.INDEX))
+        except:
+            os.unlink(tmp)
+            raise
+
+
+    def synced(self):
+        """
+        Returns the (UTC) timestamp of the last sync or None if the mirror was never synced
+        """
+        return self._index["synced"]
+
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+
+    def slot(self, deviceName):
+        """
+        Returns the installation slot entry of 'deviceName' or None if it is not mirrored
+        """
+        try:
+            digest = self._index["slots"][deviceName]
+            with self._blobs.open(digest) as f:
+                slot = CC.tostring(json.loads(f.read().decode("utf-8")))
+        except (KeyError, IOError, OSError):
+            self._count(False)
+            return None
+
+        self._count(True)
+
+        return slot
+
+
+    def names(self):
+        """
+        Returns the name of every device or None if the mirror was never fully synced
+        """
+        return self._index["names"]
+
+
+    @staticmethod
+    def _artifact_key(ccdb, url):
+        """
+        Artifacts are indexed by their URL relative to the REST API of CCDB
+        """
+        rest_url = ccdb.rest_url()
+        if url.startswith(rest_url):
+            return url[len(rest_url):].lstrip("/")
+
+        return url
+
+
+    def extract_artifact(self, ccdb, url, save_as):
+        """
+        Creates 'save_as' from the mirrored copy of the artifact at 'url' of 'ccdb'. Returns None if the artifact is not mirrored
+        """
+        try:
+            save_as = self._blobs.link(self._index["artifacts"][CCDBMirror._artifact_key(ccdb, url)], save_as)
+        except (KeyError, IOError, OSError):
+            self._count(False)
+            return None
+
+        self._count(True)
+
+        return save_as
+
+
+    def sync(self, ccdb, deviceName = None):
+        """
+        Updates the mirror from 'ccdb'; the controls tree of 'deviceName' or every device if 'deviceName' is None
+
+        Slots and artifacts that cannot be downloaded keep their previous version.
+        Returns the number of changed slots, changed artifacts and errors
+        """
+        if deviceName is not None:
+            root    = ccdb.device(deviceName)
+            devices = [ root ] + root.buildControlsList()
+            names   = None
+        else:
+            names   = list(ccdb.getAllDeviceNames())
+            # Placeholders; downloaded in parallel when the first one is used
+            devices = ccdb._devices_by_name(names)
+
+        slots     = self._index["slots"]
+        artifacts = OrderedDict()
+        changed   = 0
+        errors    = 0
+        for device in devices:
+            try:
+                record = json.dumps(device.to_json(), sort_keys = True).encode("utf-8")
+                for artifact in device.artifacts():
+                    if artifact.is_file():
+                        artifacts.setdefault(CCDBMirror._artifact_key(ccdb, artifact.saveas_url()), artifact)
+            except CC.Exception as e:
+                print("Cannot mirror {}: {}".format(device.name(), e))
+                errors += 1
+                continue
+
+            digest = hashlib.sha256(record).hexdigest()
+            if slots.get(device.name()) == digest:
+                continue
+
+            if not self._blobs.has(digest):
+                self._blobs.put(io.BytesIO(record))
+            slots[device.name()] = digest
+            changed += 1
+
+        (changed_artifacts, artifact_errors) = self._sync_artifacts(ccdb, artifacts, full = names is not None)
+
+        if names is not None:
+            # Devices that were removed from CCDB
+            known = set(names)
+            for name in [ name for name in slots if name not in known ]:
+                del slots[name]
+                changed += 1
+            self._index["names"] = names
+
+        self._index["url"]    = ccdb.url()
+        self._index["synced"] = "{:%Y%m%d%H%M%S}".format(datetime.datetime.utcnow())
+        self._save_index()
+        self._prune()
+
+        return (changed, changed_artifacts, errors + artifact_errors)
+
+
+    def _sync_artifacts(self, ccdb, artifacts, full):
+        """
+        Downloads the file artifacts in 'artifacts' (a dictionary of index key, artifact pairs) in parallel
+
+        The HTTP cache of CC.get() (if enabled) turns the download of an unchanged artifact into a conditional request
+        """
+        tmpdir = tempfile.mkdtemp(dir = self._directory, prefix = ".sync")
+
+        def download(item):
+            (i, (key, artifact)) = item
+            try:
+                with open(ccdb.download_from_ccdb(artifact, os.path.join(tmpdir, str(i))), "rb") as f:
+                    return (key, self._blobs.put(f))
+            except Exception as e:
+                print("Cannot mirror {}: {}".format(artifact.saveas_url(), e))
+                return (key, None)
+
+        try:
+            results = ccdb._parallel_map(download, enumerate(artifacts.items()))
+        finally:
+            shutil.rmtree(tmpdir)
+
+        index   = self._index["artifacts"]
+        changed = 0
+        errors  = 0
+        for (key, digest) in results:
+            if digest is None:
+                errors += 1
+            elif index.get(key) != digest:
+                index[key] = digest
+                changed += 1
+
+        if full:
+            for key in [ key for key in index if key not in artifacts ]:
+                del index[key]
+                changed += 1
+
+        return (changed, errors)
+
+
+    def _prune(self):
+        """
+        Removes the blobs that are no longer referenced by the index
+        """
+        used = set(self._index["slots"].values())
+        used.update(self._index["artifacts"].values())
+        for digest in list(self._blobs.digests()):
+            if digest not in used:
+                self._blobs.remove(digest)
+
+
+    def stats(self):
+        """
+        Returns a one-line summary of the mirror usage
+        """
+        return "CCDB mirror: {} found, {} downloaded from CCDB".format(self.hits, self.misses)
+
+
+
+
+class MirroredCCDB(CCDB):
+    """
+    CCDB client that reads the devices and artifacts from a CCDBMirror
+
+    Whatever is not in the mirror is downloaded from the CCDB server the mirror was synced from
+    """
+    _variants = dict()
+
+    def __init__(self, *args, **kwargs):
+        mirror = kwargs.pop("mirror", None)
+        super(MirroredCCDB, self).__init__(*args, **kwargs)
+
+        if not isinstance(mirror, CCDBMirror):
+            mirror = CCDBMirror(mirror if mirror is not True else None, self.url())
+        self._mirror = mirror
+
+        if mirror.synced() is None:
+            print("CCDB mirror at {} is empty; every device is downloaded from {}".format(mirror.directory(), self.url()))
+        else:
+            print("Using CCDB mirror at {} (synced at {} UTC)".format(mirror.directory(), mirror.synced()))
+
+
+    @staticmethod
+    def variant_of(ccdb_class):
+        """
+        Returns the mirrored variant of 'ccdb_class' (one of the CCDB subclasses)
+        """
+        try:
+            return MirroredCCDB._variants[ccdb_class]
+        except KeyError:
+            variant = type("Mirrored" + ccdb_class.__name__, (MirroredCCDB, ccdb_class), dict())
+            MirroredCCDB._variants[ccdb_class] = variant
+            return variant
+
+
+    def mirror(self):
+        return self._mirror
+
+
+    def getAllDeviceNames(self):
+        names = self._mirror.names()
+        if names is None:
+            return super(MirroredCCDB, self).getAllDeviceNames()
+
+        return list(names)
+
+
+    def _get_device(self, deviceName, single_device_only):
+        deviceName = self.deviceName(deviceName)
+        if deviceName not in self._devices:
+            slot = self._mirror.slot(deviceName)
+            if slot is not None:
+                # The controls tree is read from the mirror one by one; no need to download it in one go
+                self._devices[deviceName] = self.Device(slot, ccdb = self)
+
+        return super(MirroredCCDB, self)._get_device(deviceName, single_device_only)
+
+
+    def _get_slots(self, devices):
+        slots  = [ self._mirror.slot(device.name()) for device in devices ]
+        misses = [ device for (device, slot) in zip(devices, slots) if slot is None ]
+        if not misses:
+            return [ (slot, None) for slot in slots ]
+
+        downloaded = iter(super(MirroredCCDB, self)._get_slots(misses))
+
+        return [ (slot, None) if slot is not None else next(downloaded) for slot in slots ]
+
+
+    def download_from_ccdb(self, artifact_or_url, save_as):
+        if self._mirror.extract_artifact(self, self._download_url(artifact_or_url), save_as) is not None:
+            return save_as
+
+        return super(MirroredCCDB, self).download_from_ccdb(artifact_or_url, save_as)
+
+
+    def prefetchArtifacts(self, artifacts):
+        artifacts = list(artifacts)
+        extracted = 0
+        for artifact in artifacts:
+            if isinstance(artifact, CCDB.Artifact) and artifact.is_file() and not self.has_artifact(artifact.saveas()):
+                if self._mirror.extract_artifact(self, artifact.saveas_url(), artifact.saveas()) is not None:
+                    extracted += 1
+
+        # Only the artifacts that are not in the mirror are downloaded
+        return extracted + super(MirroredCCDB, self).prefetchArtifacts(artifacts)
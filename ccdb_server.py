@@ -0,0 +1,215 @@
+from __future__ import print_function
+from __future__ import absolute_import
+
+""" PLC Factory: Serves a CCDB dump over (a subset of) the CCDB REST API """
+
+__author__     = "Krisztian Loki"
+__copyright__  = "Copyright 2021, European Spallation Source, Lund"
+__license__    = "GPLv3"
+
+
+# Python libraries
+import hashlib
+import json
+import threading
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import unquote as urlunquote, urlsplit
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urllib import unquote as urlunquote
+    from urlparse import urlsplit
+
+# PLC Factory modules
+from cc import CC
+from ccdb_dump import CCDB_Dump
+
+
+
+class CCDBServer(ThreadingMixIn, HTTPServer):
+    """
+    A local stand-in for CCDB that serves a CCDB dump; to run tests and benchmarks offline
+
+    The following endpoints are implemented:
+     - rest/slotNames
+     - rest/slots/<name>
+     - rest/slots/<name>/controls/?transitive=True
+     - rest/slots/<name>/download/<filename>
+     - rest/deviceTypes/<type>/download/<filename>
+
+    Responses carry an ETag and conditional requests are answered with '304 Not Modified'
+    """
+    daemon_threads = True
+
+    def __init__(self, dump, host = "127.0.0.1", port = 0):
+        if not isinstance(dump, CC):
+            dump = CCDB_Dump.load(dump)
+
+        HTTPServer.__init__(self, (host, port), CCDBRequestHandler)
+
+        self.dump     = dump
+        # The dump is not thread safe
+        self.lock     = threading.Lock()
+        self.requests = 0
+        self._thread  = None
+
+
+    def url(self):
+        return "http://{}:{}".format(*self.server_address[:2])
+
+
+    def start(self):
+        """
+        Serves requests from a background thread
+        """
+        self._thread = threading.Thread(target = self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+        return self
+
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+    def __enter__(self):
+        return self.start()
+
+
+    def __exit__(self, type, value, traceback):
+        self.stop()
+
+
+    def slot_names(self):
+        return { "names": [ { "name": name, "slotType": "SLOT" } for name in self.dump.getAllDeviceNames() ] }
+
+
+    def slot(self, name):
+        return self.dump.device(name).to_json()
+
+
+    def transitive_controls(self, name):
+        devices = self.dump.device(name).buildControlsList()
+
+        return { "installationSlots": [ device.to_json() for device in devices ] }
+
+
+    def artifact(self, name, filename, perdevtype):
+        """
+        Returns the content of the artifact 'filename' of device (or device type) 'name'
+        """
+        if perdevtype:
+            devices = filter(lambda d: d.deviceType() == name, map(self.dump.device, self.dump.getAllDeviceNames()))
+        else:
+            devices = [ self.dump.device(name) ]
+
+        for device in devices:
+            for artifact in device.artifacts():
+                if artifact.is_file() and artifact.filename() == filename and artifact.is_perdevtype() == perdevtype:
+                    return self._read_artifact(artifact)
+
+        raise KeyError(filename)
+
+
+    def _read_artifact(self, artifact):
+        # Do not extract; clients in the same process would use the very same templates directory
+        with self.dump.open_artifact(artifact.saveas()) as f:
+            return f.read()
+
+
+
+class CCDBRequestHandler(BaseHTTPRequestHandler):
+    # Keep-alive
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+
+    def _route(self, path, query):
+        parts = list(map(urlunquote, filter(None, path.split("/"))))
+        if not parts or parts[0] != "rest":
+            raise KeyError(path)
+        parts = parts[1:]
+
+        if parts == [ "slotNames" ]:
+            return json.dumps(self.server.slot_names()).encode()
+
+        if len(parts) == 2 and parts[0] == "slots":
+            return json.dumps(self.server.slot(parts[1])).encode()
+
+        if len(parts) == 3 and parts[0] == "slots" and parts[2] == "controls":
+            if "transitive=true" not in query.lower():
+                raise KeyError(path)
+            return json.dumps(self.server.transitive_controls(parts[1])).encode()
+
+        if len(parts) == 4 and parts[0] in ("slots", "deviceTypes") and parts[2] == "download":
+            return self.server.artifact(parts[1], parts[3], parts[0] == "deviceTypes")
+
+        raise KeyError(path)
+
+
+    def _send(self, code, body = b"", headers = None):
+        self.send_response(code)
+        for (k, v) in (headers or dict()).items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+
+    def do_GET(self):
+        split = urlsplit(self.path)
+
+        try:
+            with self.server.lock:
+                self.server.requests += 1
+                body = self._route(split.path, split.query)
+        except (KeyError, CC.Exception):
+            return self._send(404)
+
+        etag = '"{}"'.format(hashlib.sha1(body).hexdigest())
+        if self.headers.get("If-None-Match") == etag:
+            return self._send(304, headers = { "ETag": etag })
+
+        self._send(200, body, { "ETag": etag, "Content-Type": "application/json" if body.startswith(b"{") else "application/octet-stream" })
+
+
+
+
+def main(argv):
+    import argparse
+
+    parser = argparse.ArgumentParser(description = "Serves a CCDB dump over the CCDB REST API")
+
+    parser.add_argument("ccdb_dump_file",
+                        help = "CCDB dump",
+                        type = str)
+
+    parser.add_argument("--port",
+                        help = "the port to listen on. Default: 8080",
+                        type = int,
+                        default = 8080)
+
+    args = parser.parse_args(argv)
+
+    server = CCDBServer(args.ccdb_dump_file, port = args.port)
+    print("Serving {} at {}".format(server.dump.url(), server.url()))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    import sys
+    main(sys.argv[1:])
@@ -0,0 +1,209 @@
+from __future__ import print_function
+from __future__ import absolute_import
+
+""" PLC Factory: HTTP transport policy (timeouts, retries, connection limits) """
+
+__author__     = "Krisztian Loki"
+__copyright__  = "Copyright 2021, European Spallation Source, Lund"
+__license__    = "GPLv3"
+
+
+# Python libraries
+import atexit
+import json
+import random
+import threading
+import time
+
+try:
+    from urllib.parse import urlsplit, urlunsplit
+except ImportError:
+    from urlparse import urlsplit, urlunsplit
+
+import requests
+
+# PLC Factory modules
+import helpers
+
+
+
+class TransportPolicy(object):
+    """
+    Decides how HTTP GET requests are sent:
+     - every request has a (connect, read) timeout
+     - requests failing with a 5xx status code or a connection error are retried with exponential backoff and (full) jitter
+     - the number of concurrent requests to the same host is limited
+     - the connection pool of a session is big enough for the parallel downloads
+
+    If 'latency_log' is set the latencies are collected per endpoint (see endpoint()) and saved as a JSON file of histograms
+    """
+    TIMEOUT         = (10, 120)
+    RETRIES         = 3
+    BACKOFF         = 0.5
+    MAX_CONNECTIONS = 8
+    RETRY_STATUS    = (500, 502, 503, 504)
+    # Upper bounds (in seconds) of the latency histogram buckets
+    BUCKETS         = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    def __init__(self, timeout = TIMEOUT, retries = RETRIES, backoff = BACKOFF, max_connections = MAX_CONNECTIONS, pool_size = None, latency_log = None):
+        self.timeout         = timeout
+        self.retries         = retries
+        self.backoff         = backoff
+        self.max_connections = max_connections
+        self.pool_size       = pool_size if pool_size is not None else max_connections
+        self.latency_log     = latency_log
+
+        self._lock       = threading.Lock()
+        self._semaphores = dict()
+        self._latencies  = dict()
+        self._sleep      = time.sleep
+
+        if latency_log is not None:
+            atexit.register(self.save_latencies)
+
+
+    def configure(self, session):
+        """
+        Sizes the connection pool of 'session'
+        """
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize = max(self.pool_size, 1))
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+
+        return session
+
+
+    def semaphore(self, url):
+        """
+        Returns the semaphore limiting the concurrent connections to the host of 'url'
+        """
+        host = helpers.url_to_host(url)
+        with self._lock:
+            try:
+                return self._semaphores[host]
+            except KeyError:
+                sem = threading.BoundedSemaphore(max(self.max_connections, 1))
+                self._semaphores[host] = sem
+                return sem
+
+
+    def retry_delay(self, attempt):
+        """
+        Returns the number of seconds to wait before retry number 'attempt' (starting from 0)
+        """
+        return random.uniform(0, self.backoff * (2 ** attempt))
+
+
+    def should_retry(self, status_code):
+        return status_code in self.RETRY_STATUS
+
+
+    def get(self, session, url, **keyword_params):
+        """
+        Sends a GET request with 'session' according to the policy
+        """
+        keyword_params.setdefault("timeout", self.timeout)
+
+        attempt = 0
+        while True:
+            start = time.time()
+            try:
+                with self.semaphore(url):
+                    result = session.get(url, **keyword_params)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                self.record(url, time.time() - start)
+                if attempt >= self.retries:
+                    raise
+            else:
+                self.record(url, time.time() - start)
+                if not self.should_retry(result.status_code) or attempt >= self.retries:
+                    return result
+
+            self._sleep(self.retry_delay(attempt))
+            attempt += 1
+
+
+    @staticmethod
+    def endpoint(url):
+        """
+        Returns the endpoint of 'url'; the URL without the query, the slot and device type names and the artifact filenames
+
+        https://ccdb.esss.lu.se/rest/slots/Sys-Sub:Dev-01/download/dev.def ==> https://ccdb.esss.lu.se/rest/slots/*/download/*
+        URLs outside of a REST API (external links of artifacts) are reduced to their host
+        """
+        comps    = urlsplit(url)
+        netloc   = helpers.url_to_host(url)
+        segments = comps.path.split("/")
+        try:
+            rest = segments.index("rest")
+        except ValueError:
+            return urlunsplit((comps.scheme, netloc, "/*", "", ""))
+
+        path     = segments[:rest + 1]
+        segments = iter(segments[rest + 1:])
+        for segment in segments:
+            path.append(segment)
+            if segment in ("slots", "deviceTypes"):
+                if next(segments, None) is not None:
+                    path.append("*")
+            elif segment == "download":
+                path.append("*")
+                break
+
+        return urlunsplit((comps.scheme, netloc, "/".join(path), "", ""))
+
+
+    def record(self, url, seconds):
+        """
+        Adds a request of 'url' that took 'seconds' to the latency histograms (of the endpoint of 'url')
+
+        Nothing is recorded if the latencies are not saved
+        """
+        if self.latency_log is None:
+            return
+
+        url = self.endpoint(url)
+        with self._lock:
+            try:
+                lat = self._latencies[url]
+            except KeyError:
+                lat = { "count": 0, "total": 0.0, "min": seconds, "max": seconds, "buckets": [ 0 ] * (len(self.BUCKETS) + 1) }
+                self._latencies[url] = lat
+
+            lat["count"] += 1
+            lat["total"] += seconds
+            lat["min"]    = min(lat["min"], seconds)
+            lat["max"]    = max(lat["max"], seconds)
+            for (i, bound) in enumerate(self.BUCKETS):
+                if seconds <= bound:
+                    break
+            else:
+                i = len(self.BUCKETS)
+            lat["buckets"][i] += 1
+
+
+    def latencies(self):
+        """
+        Returns the latency histograms; the slowest endpoints (by total time) first
+        """
+        labels = [ "<={}".format(bound) for bound in self.BUCKETS ] + [ ">{}".format(self.BUCKETS[-1]) ]
+        with self._lock:
+            lats = sorted(self._latencies.items(), key = lambda kv: kv[1]["total"], reverse = True)
+
+            return [ { "url"       : url,
+                       "count"     : lat["count"],
+                       "total"     : lat["total"],
+                       "mean"      : lat["total"] / lat["count"],
+                       "min"       : lat["min"],
+                       "max"       : lat["max"],
+                       "histogram" : dict((label, n) for (label, n) in zip(labels, lat["buckets"]) if n) } for (url, lat) in lats ]
+
+
+    def save_latencies(self, filename = None):
+        if filename is None:
+            filename = self.latency_log
+        if filename is None:
+            return
+
+        with open(filename, "w") as f:
+            json.dump({ "buckets": list(self.BUCKETS), "urls": self.latencies() }, f, indent = 2)
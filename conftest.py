@@ -0,0 +1,4 @@
+import sys
+
+# Python 2 cannot even parse the asyncio tests
+collect_ignore = [ "test_ccdb_async.py" ] if sys.version_info.major < 3 else []
@@ -0,0 +1,104 @@
+from __future__ import print_function
+from __future__ import absolute_import
+
+""" PLC Factory: Integer indexed controls graph """
+
+__author__     = "Krisztian Loki"
+__copyright__  = "Copyright 2021, European Spallation Source, Lund"
+__license__    = "GPLv3"
+
+
+# Python libraries
+from array import array
+
+
+
+class ControlsGraph(object):
+    """
+    The 'controls' relation of the devices of a CC instance
+
+    Every device gets an integer id when it is first seen. The controlled devices of a device are stored as a
+    contiguous block of ids in one array (CSR style); _start[id] and _end[id] delimit the block of device 'id'.
+    The block is filled from Device.controls() on first use, so lazily downloaded devices are downloaded in the
+    same order as before.
+
+    The sorted transitive closure is memoized per root; the graph has to be dropped if the controls relation changes
+    """
+    def __init__(self):
+        self._devices  = []
+        self._ids      = dict()
+        self._start    = array('i')
+        self._end      = array('i')
+        self._targets  = array('i')
+        self._keys     = []
+        self._closures = dict()
+
+
+    def __len__(self):
+        return len(self._devices)
+
+
+    def _id(self, device):
+        name = device.name()
+        try:
+            return self._ids[name]
+        except KeyError:
+            i = len(self._devices)
+            self._ids[name] = i
+            self._devices.append(device)
+            self._start.append(-1)
+            self._end.append(-1)
+            self._keys.append(None)
+
+            return i
+
+
+    def _fill(self, i):
+        """
+        Stores the ids of the devices device 'i' controls
+        """
+        targets = [ self._id(device) for device in self._devices[i].controls() ]
+        self._start[i] = len(self._targets)
+        self._targets.extend(targets)
+        self._end[i] = len(self._targets)
+
+
+    def _key(self, i):
+        key = self._keys[i]
+        if key is None:
+            device = self._devices[i]
+            key = (device.deviceType(), device.name())
+            self._keys[i] = key
+
+        return key
+
+
+    def controlled(self, device):
+        """
+        Returns the tuple of devices 'device' directly or indirectly controls; sorted by device type and name
+        """
+        root = self._id(device)
+        try:
+            return self._closures[root]
+        except KeyError:
+            pass
+
+        start   = self._start
+        end     = self._end
+        targets = self._targets
+        seen    = set()
+        pool    = [ root ]
+        while pool:
+            i = pool.pop()
+            if start[i] < 0:
+                self._fill(i)
+
+            for t in targets[start[i]:end[i]]:
+                if t not in seen:
+                    seen.add(t)
+                    pool.append(t)
+
+        closure = tuple(map(self._devices.__getitem__, sorted(seen, key = self._key)))
+        self._closures[root] = closure
+
+        return closure
@@ -0,0 +1,187 @@
+from __future__ import print_function
+from __future__ import absolute_import
+
+""" PLC Factory: Synthetic CCDB data and reference implementations shared by the tests and the benchmarks """
+
+__author__     = "Krisztian Loki"
+__copyright__  = "Copyright 2021, European Spallation Source, Lund"
+__license__    = "GPLv3"
+
+
+# Python libraries
+import json
+import random
+
+# PLC Factory modules
+from cc import CC
+from ccdb_dump import CCDB_Dump
+from ccdb_factory import CCDB_Factory
+import levenshtein
+
+
+
+def synthetic_names(count, seed = 0):
+    """
+    Returns 'count' unique ESS-like device names: Sys-Subsys:Dis-Dev-Idx
+    """
+    rnd = random.Random(seed)
+    systems     = [ "LEBT", "MEBT", "DTL", "SPK", "MBL", "HBL", "A2T", "DMPL", "ISrc", "RFQ", "Tgt", "CrS" ]
+    disciplines = [ "Vac", "EMR", "PBI", "RFS", "Cryo", "WtrC", "Ctrl", "PSS", "Mag", "TS" ]
+    devices     = [ "VGP", "VGC", "VVS", "VPI", "PLC", "IOC", "TT", "PT", "FS", "YSV", "EVR", "BPM", "PSU" ]
+
+    names = set()
+    while len(names) < count:
+        names.add("{}-{:03d}{}:{}-{}-{:03d}".format(rnd.choice(systems), rnd.randint(1, 100) * 10, rnd.choice([ "", "Row", "CDL" ]),
+                                                     rnd.choice(disciplines), rnd.choice(devices), rnd.randint(1, 999)))
+
+    return sorted(names)
+
+
+def mistype(name, rnd):
+    """
+    Returns 'name' with one or two random typos
+    """
+    for _ in range(rnd.randint(1, 2)):
+        i = rnd.randrange(len(name))
+        op = rnd.choice("dis")
+        if op == "d":
+            name = name[:i] + name[i + 1:]
+        elif op == "i":
+            name = name[:i] + rnd.choice("abcdefghijklmnopqrstuvwxyz0123456789") + name[i:]
+        else:
+            name = name[:i] + rnd.choice("abcdefghijklmnopqrstuvwxyz0123456789") + name[i + 1:]
+
+    return name
+
+
+def linear_similar(names, deviceName, X = 10):
+    """
+    The original linear scan of CC.getSimilarDeviceNames()
+    """
+    slot = deviceName.split(":")
+    candidates = None
+    if len(slot) > 1:
+        slot = slot[0].lower()
+        candidates = list(filter(lambda x: x.lower().startswith(slot), names))
+        filtered = True
+
+    if not candidates:
+        candidates = names
+        filtered = False
+
+    return (filtered, list(map(lambda f: f[1], sorted(map(lambda x: (levenshtein.distance(deviceName, x), x), candidates))[:X])))
+
+
+def synthetic_tree(count, props = 10, seed = 0):
+    """
+    Returns (factory, root) of a CCDB_Factory with a 'count' device deep controls tree
+
+    Every device is controlled by one of the last few devices, some of them by two. Properties P0..P<props - 1> are
+    set on a few random devices
+    """
+    rnd     = random.Random(seed)
+    factory = CCDB_Factory()
+    devices = [ factory.addPLC("PLC") ]
+    for i in range(1, count):
+        device = devices[max(0, len(devices) - rnd.randint(1, 4))].addDevice("TYPE{}".format(i % 7), "DEV-{:05d}".format(i))
+        if i > 10 and rnd.random() < 0.05:
+            devices[rnd.randrange(i - 10, i)].setControls(device)
+        if rnd.random() < 0.02:
+            device.setProperty("P{}".format(rnd.randrange(props)), i)
+        devices.append(device)
+
+    return (factory, devices[0])
+
+
+def synthetic_slots(count, props = 30, seed = 0):
+    """
+    Returns 'count' JSON encoded CCDB slots; the devices are controlled by one of the previous devices
+    """
+    rnd   = random.Random(seed)
+    names = synthetic_names(count, seed)
+    controls = dict((name, []) for name in names)
+    controlledBy = dict()
+    for (i, name) in enumerate(names[1:], 1):
+        parent = names[rnd.randrange(max(0, i - 5), i)]
+        controls[parent].append(name)
+        controlledBy[name] = [ parent ]
+
+    slots = []
+    for (i, name) in enumerate(names):
+        slots.append(json.dumps({ "slotType"     : "SLOT",
+                                  "name"         : name,
+                                  "deviceType"   : name.split(":")[1].split("-")[1],
+                                  "description"  : "Device {}".format(i),
+                                  "artifacts"    : [],
+                                  "controls"     : controls[name],
+                                  "controlledBy" : controlledBy.get(name, []),
+                                  "properties"   : [ { "name"     : "PLCF#Property{}".format(p),
+                                                       "value"    : str(rnd.randint(0, 1000)),
+                                                       "dataType" : "Integer",
+                                                       "kind"     : "TYPE" if p % 2 else "SLOT",
+                                                       "unit"     : None } for p in range(props) ],
+                                  "children"     : [],
+                                  "parents"      : [],
+                                  "powers"       : [],
+                                  "poweredBy"    : [] }))
+
+    return slots
+
+
+def synthetic_dump(slots):
+    """
+    Returns a CCDB dump of the JSON encoded 'slots'
+    """
+    dump = CCDB_Dump.Dump()
+    for slot in slots:
+        slot = json.loads(slot)
+        dump._devices[slot["name"]] = dump.Device(slot, ccdb = dump)
+
+    return dump
+
+
+def set_controls_list(device):
+    """
+    The original traversal of Device.buildControlsList()
+    """
+    pool = list(device.controls())
+    controlled_devices = set(pool)
+    while pool:
+        for cdev in pool.pop().controls():
+            if cdev not in controlled_devices:
+                controlled_devices.add(cdev)
+                pool.append(cdev)
+
+    by_type = dict()
+    for dev in controlled_devices:
+        by_type.setdefault(dev.deviceType(), []).append(dev)
+
+    pool = list()
+    for device_type in sorted(by_type):
+        pool.extend(sorted(by_type[device_type], key = lambda d: d.name()))
+
+    return pool
+
+
+def bfs_backtrack(device, prop):
+    """
+    The original BFS of CC._backtrack() (without its iteration limit)
+    """
+    leftToProcess = device.controlledBy(True)
+    if not leftToProcess:
+        leftToProcess = [ device ]
+
+    processed = []
+    while leftToProcess:
+        elem = leftToProcess.pop()
+        if elem in processed:
+            continue
+
+        processed.append(elem)
+        propDict = elem.propertiesDict()
+        if prop in propDict:
+            return propDict.get(prop)
+
+        leftToProcess = elem.controlledBy(True) + leftToProcess
+
+    raise CC.Exception("No such backtrack property: {}".format(prop))
@@ -8,9 +8,11 @@ __license__    = "GPLv3"
 
 
 # Python libraries
+import io
 import os
 from shlex import split as shlex_split
 import subprocess
+import sys
 import unicodedata
 try:
     from urllib.parse import urlsplit, urlunsplit
@@ -97,6 +99,45 @@ def makedirs(path):
             raise
 
 
+def replace_file(src, dst):
+    """
+    Helper that renames 'src' to 'dst' overwriting 'dst' if it exists (os.replace() is Python3 only)
+    """
+    try:
+        os.replace(src, dst)
+    except AttributeError:
+        if os.name == "nt" and os.path.exists(dst):
+            os.remove(dst)
+        os.rename(src, dst)
+
+
+def text_reader(f, encoding = "utf-8"):
+    """
+    Returns a file object that reads native strings from the binary file object 'f'
+    """
+    if str is bytes:
+        # Python2; native strings are bytes
+        return f
+
+    return io.TextIOWrapper(f, encoding = encoding)
+
+
+def intern(string):
+    """
+    Returns the interned version of 'string' if it is a (native) string, otherwise 'string' itself
+    """
+    if type(string) is str:
+        return _intern(string)
+    return string
+
+
+try:
+    _intern = sys.intern
+except AttributeError:
+    import __builtin__
+    _intern = __builtin__.intern
+
+
 def sanitize_path(path):
     """
     Helper that sanitizes path; replaces accented characters and removes invalid ones
@@ -0,0 +1,138 @@
+from __future__ import print_function
+from __future__ import absolute_import
+
+""" PLC Factory: Incremental JSON parsing """
+
+__author__     = "Krisztian Loki"
+__copyright__  = "Copyright 2021, European Spallation Source, Lund"
+__license__    = "GPLv3"
+
+
+# Python libraries
+import json
+
+
+
+class JSONStream(object):
+    """
+    Decodes a JSON document from a file object piece by piece
+
+    Only the part of the document that is currently decoded is kept in memory; values are decoded with
+    json.JSONDecoder.raw_decode() and more input is read if a value does not fit into the buffer
+    """
+    CHUNK_SIZE = 1024 * 1024
+    WHITESPACE = " \t\n\r"
+
+    def __init__(self, f, chunk_size = CHUNK_SIZE):
+        self._f          = f
+        self._chunk_size = chunk_size
+        self._buf        = ""
+        self._pos        = 0
+        self._eof        = False
+        self._decoder    = json.JSONDecoder()
+
+
+    def _fill(self, size):
+        """
+        Reads 'size' more characters. Returns False at the end of the file
+        """
+        if self._eof:
+            return False
+
+        data = self._f.read(size)
+        if not data:
+            self._eof = True
+            return False
+
+        # Drop what is already decoded
+        self._buf = self._buf[self._pos:] + data
+        self._pos = 0
+
+        return True
+
+
+    def _skip_whitespace(self):
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in JSONStream.WHITESPACE:
+                self._pos += 1
+
+            if self._pos < len(self._buf) or not self._fill(self._chunk_size):
+                return
+
+
+    def _expect(self, chars):
+        """
+        Consumes and returns the next non-whitespace character; it has to be one of 'chars'
+        """
+        self._skip_whitespace()
+        if self._pos >= len(self._buf):
+            raise ValueError("Unexpected end of JSON document; expected one of '{}'".format(chars))
+
+        c = self._buf[self._pos]
+        if c not in chars:
+            raise ValueError("Expected one of '{}' at '{}'".format(chars, self._buf[self._pos:self._pos + 20]))
+
+        self._pos += 1
+        return c
+
+
+    def _value(self):
+        """
+        Decodes the next value
+        """
+        self._skip_whitespace()
+        size = self._chunk_size
+        while True:
+            try:
+                (value, end) = self._decoder.raw_decode(self._buf, self._pos)
+                # A number might continue in the next chunk
+                if end < len(self._buf) or self._eof:
+                    self._pos = end
+                    return value
+            except ValueError:
+                if self._eof:
+                    raise
+
+            # The value does not fit into the buffer; read more (doubling the amount to read to stay linear)
+            self._fill(size)
+            size *= 2
+
+
+    def _items(self):
+        """
+        Yields the (key, value) pairs of the object that starts at the current position
+        """
+        self._expect("{")
+        self._skip_whitespace()
+        if self._buf[self._pos:self._pos + 1] == "}":
+            self._pos += 1
+            return
+
+        while True:
+            key = self._value()
+            self._expect(":")
+            yield (key, self._value())
+            if self._expect(",}") == "}":
+                return
+
+
+    def items(self, key):
+        """
+        Yields the (key, value) pairs of the object at 'key' of the top level object
+        """
+        self._expect("{")
+        self._skip_whitespace()
+        if self._buf[self._pos:self._pos + 1] == "}":
+            raise KeyError(key)
+
+        while True:
+            k = self._value()
+            self._expect(":")
+            if k == key:
+                for item in self._items():
+                    yield item
+                return
+
+            self._value()
+            if self._expect(",}") == "}":
+                raise KeyError(key)
@@ -22,13 +22,104 @@ https://creativecommons.org/licenses/by-sa/3.0/
 """
 
 
-def distance(s, t):
+def distance(s, t, max_distance = None):
+    """
+    Returns the Levenshtein distance of 's' and 't'
+
+    If 'max_distance' is not None then the computation stops as soon as the distance is known to be bigger than
+    'max_distance' and max_distance + 1 is returned
+    """
     assert isinstance(s, str)
     assert isinstance(t, str)
 
     if s == t:
         return 0
 
+    return _myers(_peq(s), len(s), t, max_distance)
+
+
+def distances(query, candidates, max_distance = None):
+    """
+    Returns the list of Levenshtein distances of 'query' and every string in 'candidates'
+
+    The bit vectors of 'query' are computed only once. 'max_distance' is the same as in distance()
+    """
+    assert isinstance(query, str)
+
+    peq = _peq(query)
+    m   = len(query)
+
+    return [ _myers(peq, m, t, max_distance) for t in candidates ]
+
+
+def _peq(s):
+    """
+    Returns the match bit vectors of 's'; bit i of peq[c] is set if s[i] == c
+    """
+    peq = dict()
+    bit = 1
+    for c in s:
+        peq[c] = peq.get(c, 0) | bit
+        bit <<= 1
+
+    return peq
+
+
+def _myers(peq, m, t, max_distance):
+    """
+    Bit-parallel edit distance of Myers (1999) in the formulation of Hyyro (2001)
+
+    A column of the DP matrix is represented by the vertical deltas (+1 / -1) of its cells as two bit vectors.
+    Python integers have arbitrary precision, so there is no limit on the length of the strings;
+    device names fit in a single machine word anyway
+    """
+    n = len(t)
+    if m == 0:
+        return n if max_distance is None or n <= max_distance else max_distance + 1
+
+    if max_distance is not None:
+        if abs(m - n) > max_distance:
+            return max_distance + 1
+        # score is the last row of column j + 1; it changes by at most one per column
+        bound = max_distance + n - 1
+    else:
+        bound = m + 2 * n
+
+    mask  = (1 << m) - 1
+    last  = 1 << (m - 1)
+    pv    = mask
+    mv    = 0
+    score = m
+
+    for (j, c) in enumerate(t):
+        eq = peq.get(c, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | (~(xh | pv) & mask)
+        mh = pv & xh
+
+        if ph & last:
+            score += 1
+        elif mh & last:
+            score -= 1
+
+        if score + j > bound:
+            return max_distance + 1
+
+        ph = ((ph << 1) | 1) & mask
+        mh = (mh << 1) & mask
+        pv = mh | (~(xv | ph) & mask)
+        mv = ph & xv
+
+    return score
+
+
+def _distance_dp(s, t):
+    """
+    The textbook dynamic programming implementation; kept as a reference for the tests and benchmarks
+    """
+    if s == t:
+        return 0
     elif len(s) == 0:
         return len(t)
 
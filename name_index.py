@@ -0,0 +1,184 @@
+from __future__ import print_function
+from __future__ import absolute_import
+
+""" PLC Factory: Device name index for similarity search """
+
+__author__     = "Krisztian Loki"
+__copyright__  = "Copyright 2021, European Spallation Source, Lund"
+__license__    = "GPLv3"
+
+
+# Python libraries
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter, defaultdict
+import hashlib
+import os
+import tempfile
+import time
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+# PLC Factory modules
+import helpers
+import levenshtein
+
+
+
+class NameIndex(object):
+    """
+    Returns the most similar device names without computing the distance to every name
+
+    Two indices are kept:
+     - the sorted lower-case names; the names starting with a System-Subsystem prefix are a contiguous range
+     - an inverted index of character occurrences; key (c, k) lists the names that contain character c at least k times
+
+    The second one gives the bag distance of the query and every name, a lower bound of the Levenshtein distance.
+    Names are verified in increasing order of their lower bound and the search stops once the lower bound is bigger
+    than the distance of the X-th best name so far. The result is the same as that of a full scan.
+    """
+    # Increase if the pickled format changes
+    VERSION = 2
+    # Rebuild persistent indices older than this (in seconds)
+    TTL     = 24 * 60 * 60
+    # Below this number of candidates it is faster to simply compute every distance
+    SCAN_LIMIT = 200
+
+    def __init__(self, names):
+        self.version = NameIndex.VERSION
+        self.created = time.time()
+
+        self._names   = sorted(set(names))
+        self._lengths = array('i', map(len, self._names))
+
+        lower = sorted((name.lower(), i) for (i, name) in enumerate(self._names))
+        self._lower     = [ l[0] for l in lower ]
+        self._lower_ids = array('i', [ l[1] for l in lower ])
+
+        postings = defaultdict(lambda: array('i'))
+        for (i, name) in enumerate(self._names):
+            for key in NameIndex._keys(name):
+                postings[key].append(i)
+        self._postings = dict(postings)
+
+
+    def __len__(self):
+        return len(self._names)
+
+
+    @staticmethod
+    def _keys(name):
+        """
+        Returns the multiset of characters in 'name' as a list of (character, occurrence) tuples
+        """
+        return [ (c, k) for (c, n) in Counter(name).items() for k in range(1, n + 1) ]
+
+
+    def _prefixed(self, prefix):
+        """
+        Returns the ids of names starting with (lower-case) 'prefix'
+        """
+        start = bisect_left(self._lower, prefix)
+        end   = start
+        while end < len(self._lower) and self._lower[end].startswith(prefix):
+            end += 1
+
+        return self._lower_ids[start:end]
+
+
+    def similar(self, deviceName, X = 10):
+        """
+        Returns the same (filtered, topX) tuple as the linear scan of CC.getSimilarDeviceNames():
+         - filtered; boolean if the list is filtered to the same System-Subsystem as deviceName
+         - topX; the X most similar names ordered by (distance, name)
+        """
+        # keep only device
+        slot = deviceName.split(":")
+        candidates = None
+        if len(slot) > 1:
+            candidates = self._prefixed(slot[0].lower())
+
+        filtered = bool(candidates)
+        if not filtered:
+            candidates = range(len(self._names))
+
+        return (filtered, list(map(lambda f: f[1], self._nearest(deviceName, candidates, X))))
+
+
+    def _nearest(self, query, candidates, X):
+        """
+        Returns the X closest names of 'candidates' as a sorted list of (distance, name) tuples
+        """
+        names = self._names
+        if X <= 0:
+            return []
+
+        if len(candidates) <= NameIndex.SCAN_LIMIT:
+            cnames = [ names[i] for i in candidates ]
+            return sorted(zip(levenshtein.distances(query, cnames), cnames))[:X]
+
+        # Number of common characters (as multisets) with every name
+        common = Counter()
+        for key in NameIndex._keys(query):
+            common.update(self._postings.get(key, ()))
+
+        # Group the candidates by bag distance
+        lq = len(query)
+        lengths = self._lengths
+        by_bound = defaultdict(list)
+        for i in candidates:
+            by_bound[max(lq, lengths[i]) - common[i]].append(i)
+
+        best = []
+        for bound in sorted(by_bound):
+            # Names with a bigger lower bound cannot be closer than the X-th best name
+            if len(best) == X and bound > best[-1][0]:
+                break
+
+            # Once there are X names anything farther than the X-th best can be cut short
+            max_distance = best[-1][0] if len(best) == X else None
+            cnames = [ names[i] for i in by_bound[bound] ]
+            for (d, name) in zip(levenshtein.distances(query, cnames, max_distance), cnames):
+                if len(best) < X or (d, name) < best[-1]:
+                    insort(best, (d, name))
+                    if len(best) > X:
+                        best.pop()
+
+        return best
+
+
+    @staticmethod
+    def _cache_file(url):
+        return os.path.join(helpers.create_cache_dir("ccdb", "name-index"), hashlib.sha1(url.encode("utf-8")).hexdigest() + ".pickle")
+
+
+    @staticmethod
+    def load(url, get_names, ttl = TTL):
+        """
+        Returns the (persistent) name index of the CCDB at 'url'
+
+        The index is rebuilt from get_names() if it is older than 'ttl' seconds
+        """
+        fname = NameIndex._cache_file(url)
+        try:
+            with open(fname, "rb") as f:
+                index = pickle.load(f)
+            if index.version == NameIndex.VERSION and time.time() - index.created < ttl:
+                return index
+        except Exception:
+            pass
+
+        index = NameIndex(get_names())
+
+        (fd, tmp) = tempfile.mkstemp(dir = os.path.dirname(fname), prefix = ".", suffix = ".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(index, f, pickle.HIGHEST_PROTOCOL)
+            helpers.replace_file(tmp, fname)
+        except (IOError, OSError):
+            os.unlink(tmp)
+
+        return index
@@ -19,10 +19,14 @@ will not lead to an error. Instead, such input is simply returned unchanged.
 
 
 # Python libraries
+from collections import deque
+import os
+import re
 
 # PLC Factory modules
 import plcf_glob       as glob
 import plcf_ext
+from safe_eval import SafeEvaluator
 
 
 
@@ -65,6 +69,92 @@ class PLCFEvalException(PLCFException):
 
 
 
+class PropertyMatcher(object):
+    """
+    Aho-Corasick automaton over the property names of a device
+
+    Finds every occurrence of every property name in one pass over the text, no matter how many properties there are.
+    The names are identified by their index in the list the automaton was built from (their rank)
+    """
+    MAX_CACHED = 10000
+
+    def __init__(self, keys):
+        self._lengths = [ len(key) for key in keys ]
+        # The results of occurs_in(); key: text
+        self._occurs  = dict()
+        # The transitions, the failure links and the ranks of the names ending in each state
+        goto   = [ dict() ]
+        output = [ [] ]
+        for (rank, key) in enumerate(keys):
+            state = 0
+            for c in key:
+                try:
+                    state = goto[state][c]
+                except KeyError:
+                    goto[state][c] = len(goto)
+                    state = len(goto)
+                    goto.append(dict())
+                    output.append([])
+            output[state].append(rank)
+
+        fail  = [ 0 ] * len(goto)
+        queue = deque(goto[0].values())
+        for state in queue:
+            output[state].extend(output[0])
+        while queue:
+            state = queue.popleft()
+            for (c, child) in goto[state].items():
+                queue.append(child)
+                f = fail[state]
+                while f and c not in goto[f]:
+                    f = fail[f]
+                fail[child] = goto[f].get(c, 0)
+                output[child].extend(output[fail[child]])
+
+        self._goto   = goto
+        self._fail   = fail
+        self._output = [ tuple(ranks) for ranks in output ]
+
+
+    def matches(self, text):
+        """
+        Yields (start, rank) of every occurrence of the names in 'text', ordered by the end of the occurrence
+        """
+        (goto, fail, output, lengths) = (self._goto, self._fail, self._output, self._lengths)
+
+        for rank in output[0]:
+            yield (0, rank)
+
+        state = 0
+        for (i, c) in enumerate(text, 1):
+            # The root is never a target of a transition
+            target = goto[state].get(c)
+            while target is None and state:
+                state  = fail[state]
+                target = goto[state].get(c)
+            state = target or 0
+
+            for rank in output[state]:
+                yield (i - lengths[rank], rank)
+
+
+    def occurs_in(self, text):
+        """
+        Returns True if any of the names occurs in 'text'. The results are cached
+        """
+        try:
+            return self._occurs[text]
+        except KeyError:
+            pass
+
+        if len(self._occurs) >= PropertyMatcher.MAX_CACHED:
+            self._occurs.clear()
+        occurs = self._occurs[text] = next(self.matches(text), None) is not None
+
+        return occurs
+
+
+
 class PLCF(object):
     plcf_tag         = "[PLCF#"
     plcf_tag_len     = len(plcf_tag)
@@ -74,6 +164,23 @@ class PLCF(object):
     plcf_counter     = "Counter"
     num_of_counters  = 9
 
+    # Process-wide cache of the segments of an expression (or of a property value); key: text
+    _segments        = dict()
+    MAX_CACHED       = 100000
+    # The PropertyMatcher of the property names of a device; devices of the same type share it. key: the property names
+    _matchers        = dict()
+    MAX_MATCHERS     = 1000
+    # Above this many special properties a PropertyMatcher is used to find them in expressions
+    MAX_SPECIAL_SCAN = 16
+    # The evaluators of expressions after substitution; they cache the compiled expressions
+    _safe_eval       = SafeEvaluator(dict())
+    _safe_eval_ext   = SafeEvaluator({ "ext": plcf_ext })
+
+    # The kinds of segments
+    LITERAL          = 0
+    WORD             = 1
+    BACKTRACK        = 2
+
     @staticmethod
     def __specialProperties(device):
         sp = { 'TIMESTAMP'                 :  glob.timestamp,
@@ -156,12 +263,35 @@ class PLCF(object):
 
         self._keys.extend(keys)
         self._keys.sort(key = lambda s: len(s), reverse = True)
+        # Built when the first expression is substituted textually
+        self._matcher = None
 
         self._properties.update(sp)
 
+        # The properties that the cached segments cannot handle (see _expand()); if any of these is in an expression then
+        # the expression is processed with the textual substitution of _substituteAndEvaluate()
+        # TEMPLATE has no value until register_template()
+        self._special = [ key for (key, value) in self._properties.items() if PLCF._is_special(key, value) ] + [ 'TEMPLATE' ]
+        self._special_matcher = None
+
+
+    @staticmethod
+    def _is_special(key, value):
+        """
+        Returns True if property 'key' has to be substituted textually:
+         - it is not a single word
+         - it has no value (an error if it is referenced)
+         - its value contains the property name (see _check_infinite_recursion())
+        """
+        return not isinstance(value, str) or key in value or not key or not all(PLCF.isWordChar(c) for c in key)
+
 
     def register_template(self, templateId):
         self._properties['TEMPLATE'] = 'template-' + templateId
+        self._special = [ key for key in self._special if key != 'TEMPLATE' ]
+        if PLCF._is_special('TEMPLATE', self._properties['TEMPLATE']):
+            self._special.append('TEMPLATE')
+        self._special_matcher = None
 
 
     def process(self, line_or_lines):
@@ -176,25 +306,78 @@ class PLCF(object):
     # evaluates the expression, and returns a new line with
     # the result of the evaluation
     def processLine(self, line):
+        return self._processCompiledLine(PLCF.compileLine(line))
+
+
+    def processCompiled(self, compiled):
+        """
+        Processes the lines of a template compiled with compileLines()
+        """
+        return [ self._processCompiledLine(line) for line in compiled ]
+
+
+    @staticmethod
+    def compileLines(lines):
+        """
+        Compiles the lines of a template; the result does not depend on the device so it can be processed (with
+        processCompiled()) by every device that uses the template
+        """
+        return tuple(PLCF.compileLine(line) for line in lines)
+
+
+    @staticmethod
+    def compileLine(line):
+        """
+        Splits 'line' into the text before every PLCF# expression and the expression
+
+        Returns 'line' if there is no PLCF# expression in it, otherwise the (text, expression) pairs, the rest of the line
+        and the error message if the rest is not a valid PLCF# expression (or None)
+        """
         assert isinstance(line, str)
 
-        result = ""
+        if PLCF.plcf_tag not in line:
+            return line
+
+        pairs = []
+        error = None
         while True:
-            # recurse until all PLCF_Lang expressions have been processed
-            (start, expression, end) = self.getPLCFExpression(line)
+            try:
+                (start, expression, end) = PLCF.getPLCFExpression(line)
+            except PLCFSyntaxError as e:
+                # Raised after the preceding expressions are evaluated
+                error = e.args[0]
+                break
 
             if expression is None:
-                return result + line
+                break
+
+            pairs.append((line[:start], expression))
+            line = line[end + 1:]
+
+        return (tuple(pairs), line, error)
 
+
+    def _processCompiledLine(self, compiled):
+        if isinstance(compiled, str):
+            return compiled
+
+        (pairs, rest, error) = compiled
+        result = []
+        for (text, expression) in pairs:
             reduced = self._evaluateExpression(expression)
 
             # maintain PLCF tag if a counter variable is part of the expression
             if PLCF.hasCounter(reduced):
-                result += line[:start] + self.plcf_tag + reduced + "]"
+                result.extend((text, self.plcf_tag, reduced, "]"))
             else:
-                result += line[:start] + reduced
+                result.extend((text, reduced))
 
-            line = line[end + 1:]
+        if error is not None:
+            raise PLCFSyntaxError(error)
+
+        result.append(rest)
+
+        return "".join(result)
 
 
     def _evalUp(self, expression):
@@ -220,16 +403,180 @@ class PLCF(object):
 
     def _check_infinite_recursion(self, expression, barrier):
         expression = self._evalUp(expression)
-        for elem in self._keys:
-            # Found infinite recursion
-            if elem == barrier:
-                return True
-
+        barrier    = self._keys.index(barrier)
+        for (_, rank) in self._property_matcher().matches(expression):
             # Caught a longer match, no infinite recursion
-            if elem in expression:
-                break
+            if rank < barrier:
+                return False
+
+        # Found infinite recursion
+        return True
+
+
+    @staticmethod
+    def _cached_matcher(keys):
+        keys = tuple(keys)
+        try:
+            return PLCF._matchers[keys]
+        except KeyError:
+            if len(PLCF._matchers) >= PLCF.MAX_MATCHERS:
+                PLCF._matchers.clear()
+            matcher = PLCF._matchers[keys] = PropertyMatcher(keys)
+            return matcher
+
+
+    def _property_matcher(self):
+        """
+        Returns the PropertyMatcher of the property names; the ranks are the indices in self._keys
+        """
+        if self._matcher is None:
+            self._matcher = PLCF._cached_matcher(self._keys)
+
+        return self._matcher
+
+
+    def _has_special(self, text):
+        """
+        Returns True if any of the special properties (see _is_special()) occurs in 'text'
+        """
+        special = self._special
+        if len(special) <= PLCF.MAX_SPECIAL_SCAN:
+            return any(key in text for key in special)
+
+        if self._special_matcher is None:
+            self._special_matcher = PLCF._cached_matcher(special)
+
+        return self._special_matcher.occurs_in(text)
+
+
+    def _next_property(self, expression):
+        """
+        Returns the name of the property to substitute next in 'expression' or None if there is nothing to substitute
+
+        That is the longest property name that occurs as a word ("maximal munch"); the same that trying the property names
+        one by one from the longest to the shortest would find. Raises PLCFException if a property without value comes first
+        """
+        keys       = self._keys
+        isWordChar = PLCF.isWordChar
+        length     = len(expression)
+        best       = len(keys)
+        for (start, rank) in self._property_matcher().matches(expression):
+            if rank >= best:
+                continue
+
+            elem = keys[rank]
+            # A property without value is an error even if it is not a word
+            if self._properties.get(elem) is not None:
+                end = start + len(elem)
+                if (start and isWordChar(expression[start - 1])) or (end < length and isWordChar(expression[end])):
+                    continue
+            best = rank
+
+        if best == len(keys):
+            return None
+
+        elem = keys[best]
+        if self._properties.get(elem) is None:
+            raise PLCFException("Property '{}' has no value. Fix CCDB configuration: {}".format(elem, self._device.url()))
+
+        return elem
+
+
+    @staticmethod
+    def _compile(text):
+        """
+        Returns the list of (kind, text) segments of 'text'; a segment is literal text, a word or a backtrack (^(PROPERTY))
+
+        Returns None if the text has to be processed by _substituteAndEvaluate(). The segments are cached process-wide
+        """
+        try:
+            return PLCF._segments[text]
+        except KeyError:
+            pass
+
+        isWordChar = PLCF.isWordChar
+        segments   = []
+        literal    = 0
+        i          = 0
+        n          = len(text)
+        while i < n:
+            if text.startswith(PLCF.plcf_up, i):
+                end = text.find(")", i)
+                # The backtracked value is inserted as text; it could form a new word with a neighbouring word (or backtrack)
+                if end == -1 or (i and isWordChar(text[i - 1])) or (end + 1 < n and isWordChar(text[end + 1])) or \
+                   (literal == i and segments and segments[-1][0] == PLCF.BACKTRACK):
+                    segments = None
+                    break
+
+                if literal < i:
+                    segments.append((PLCF.LITERAL, text[literal:i]))
+                segments.append((PLCF.BACKTRACK, text[i + PLCF.plcf_up_len:end]))
+                i = literal = end + 1
+            elif isWordChar(text[i]):
+                start = i
+                while i < n and isWordChar(text[i]):
+                    i += 1
+
+                if literal < start:
+                    segments.append((PLCF.LITERAL, text[literal:start]))
+                segments.append((PLCF.WORD, text[start:i]))
+                literal = i
+            else:
+                i += 1
+
+        if segments is not None and literal < n:
+            segments.append((PLCF.LITERAL, text[literal:]))
 
-        return False
+        if len(PLCF._segments) >= PLCF.MAX_CACHED:
+            PLCF._segments.clear()
+        PLCF._segments[text] = segments
+
+        return segments
+
+
+    def _expand(self, text, expanding = ()):
+        """
+        Returns 'text' with the backtracks and property references (and the ones in their values) substituted
+
+        Every word that is a property name is substituted, the same as the textual substitution does as long as the
+        properties are single words and do not reference themselves. Returns None if this is not the case
+        """
+        if not isinstance(text, str):
+            return None
+
+        if self._has_special(text):
+            return None
+
+        segments = PLCF._compile(text)
+        if segments is None:
+            return None
+
+        result = []
+        for (kind, value) in segments:
+            if kind == PLCF.LITERAL:
+                result.append(value)
+                continue
+
+            if kind == PLCF.WORD:
+                try:
+                    prop = self._properties[value]
+                except KeyError:
+                    result.append(value)
+                    continue
+            else:
+                prop = self._device.backtrack(value)
+                value = PLCF.plcf_up + value
+
+            # A recursive definition
+            if value in expanding:
+                return None
+
+            prop = self._expand(prop, expanding + (value, ))
+            if prop is None:
+                return None
+            result.append(prop)
+
+        return "".join(result)
 
 
     # replaces all variables in a PLCFLang expression with values
@@ -237,29 +584,47 @@ class PLCF(object):
     def _evaluateExpression(self, expression):
         assert isinstance(expression, str)
 
+        expanded = self._expand(expression)
+        if expanded is None or self._has_special(expanded):
+            return self._substituteAndEvaluate(expression)
+
+        return self._evaluate(expanded)
+
+
+    # the textual substitution of properties; it handles every property name
+    def _substituteAndEvaluate(self, expression):
+        assert isinstance(expression, str)
+
         # resolve all references to properties in devices on a higher level
         # in the hierarchy
         expression = self._evalUp(expression)
 
-        for elem in self._keys:
-            try:
-                if elem in expression:
-                    value                = self._properties.get(elem)
-                    if value is None:
-                        raise PLCFException("Property '{}' has no value. Fix CCDB configuration: {}".format(elem, self._device.url()))
-                    (tmp, pos_after_val) = self.substituteWord(expression, elem, value)
-                    # If the substitution string ('value') contains the key ('elem') then check if the result contains other keys than 'elem'
-                    # In other words: try to avoid an infinite recursion
-                    # Not sure if this can still happen now that we don't substitute inside words but let's keep it here for now
-                    if elem in value and self._check_infinite_recursion(tmp, elem):
-                        tmp = tmp[:pos_after_val] + self._evaluateExpression(tmp[pos_after_val:])
-                        expression = self._evalUp(tmp)
-                        break
-                    # recursion to take care of multiple occurrences of variables
-                    return self._evaluateExpression(tmp)
-            except PLCFNoWordException:
-                pass
+        elem = self._next_property(expression)
+        if elem is not None:
+            value                = self._properties[elem]
+            (tmp, pos_after_val) = self.substituteWord(expression, elem, value)
+            # If the substitution string ('value') contains the key ('elem') then check if the result contains other keys than 'elem'
+            # In other words: try to avoid an infinite recursion
+            # Not sure if this can still happen now that we don't substitute inside words but let's keep it here for now
+            if elem in value and self._check_infinite_recursion(tmp, elem):
+                tmp = tmp[:pos_after_val] + self._substituteAndEvaluate(tmp[pos_after_val:])
+                expression = self._evalUp(tmp)
+            else:
+                # recursion to take care of multiple occurrences of variables
+                return self._substituteAndEvaluate(tmp)
 
+        return self._evaluate(expression)
+
+
+    @staticmethod
+    def _evaluator(expression, ext):
+        """
+        Returns the (cached) function that evaluates 'expression'; None if it is not an expression (not valid Python or a reference to a slot name)
+        """
+        return (PLCF._safe_eval_ext if ext else PLCF._safe_eval).evaluator(expression)
+
+
+    def _evaluate(self, expression):
         # evaluation happens after all substitutions have been performed
         wasquoted = False
         #Do not evaluate expressions which consist solely of a quoted string
@@ -267,10 +632,13 @@ class PLCF(object):
            (expression.startswith("'") and expression.endswith("'") and expression.count("'") == 2):
             wasquoted = expression[0]
 
-        if "ext." in expression: #expression.startswith("ext."):
+        ext       = "ext." in expression
+        evaluator = PLCF._evaluator(expression, ext)
+        if ext: #expression.startswith("ext."):
             try:
                 #Evaluate ext module call
-                result = eval(expression, self._evalenv)
+                # eval() raises the exception if it is not an expression
+                result = evaluator(None) if evaluator is not None else eval(expression, self._evalenv)
             except plcf_ext.PLCFExtException as e:
                 raise e #from None
             except Exception as e:
@@ -278,9 +646,13 @@ class PLCF(object):
         else:
             try:
                 #Evaluate this expression
-                result = eval(expression)
-                if wasquoted:
-                    result = wasquoted + result + wasquoted
+                if evaluator is None:
+                    # not valid Python; a reference to a slot name (or erroneous input)
+                    result = expression
+                else:
+                    result = evaluator(None)
+                    if wasquoted:
+                        result = wasquoted + result + wasquoted
             # catch references to slot names (and erroneous input)
             except (SyntaxError, NameError) as e:
                 result = expression
@@ -377,6 +749,22 @@ class PLCF(object):
     def evalCounters(lines, counters = None):
         assert isinstance(lines, list)
 
+        if counters is None:
+            counters = PLCF.initializeCounters()
+
+        output = list(PLCF.iterCounters(lines, counters))
+
+        return (output, counters)
+
+
+    @staticmethod
+    def iterCounters(lines, counters = None):
+        """
+        Returns a generator that evaluates the counters in 'lines' and yields the lines one by one
+
+        The lines are processed only once; only the ones with a PLCF# expression are parsed.
+        'counters' (see initializeCounters()) is updated as the #COUNTER lines are processed
+        """
         if counters is None:
             counters = PLCF.initializeCounters()
         elif not isinstance(counters, dict):
@@ -384,23 +772,49 @@ class PLCF(object):
         elif len(counters) > PLCF.num_of_counters:
             raise PLCFException("Too many counters")
 
-        output = []
+        return PLCF._iterCounters(lines, counters)
+
+
+    @staticmethod
+    def _iterCounters(lines, counters):
+        # The values of the counters in the order of the groups of the counter regex
+        names  = list(counters.keys())
+        values = [ counters[name] for name in names ]
+        regex  = PLCF._counterRegex(names)
 
         for line in lines:
             if PLCF.plcf_tag in line:
                 if PLCF.plcf_counter_tag not in line:
-                    line = PLCF._evalCounter(line, counters)
+                    line = PLCF._evalCounterLine(line, regex, values)
                 else:
-                    (counters, line) = PLCF._evalCounterIncrease(line, counters)
+                    (idx, line) = PLCF._evalCounterIncreaseLine(line, regex, names, values)
+                    counters[names[idx]] = values[idx]
 
-            assert isinstance(line, str)
-            # PLCF should now all be processed
-            if PLCF.plcf_tag in line:
-                raise PLCFException("Leftover PLCF# expression in line: {line}".format(line = line))
+                assert isinstance(line, str)
+                # PLCF should now all be processed
+                if PLCF.plcf_tag in line:
+                    raise PLCFException("Leftover PLCF# expression in line: {line}".format(line = line))
 
-            output.append(line)
+            yield line
 
-        return (output, counters)
+
+    # The compiled regular expressions of the counter names; key: the tuple of names
+    _counter_regexes = dict()
+
+    @staticmethod
+    def _counterRegex(names):
+        """
+        Returns a regular expression that matches the counter names as words (group N matches the Nth name) and the
+        common prefix of the names; there is no counter in a text without the prefix
+        """
+        names = tuple(names)
+        try:
+            return PLCF._counter_regexes[names]
+        except KeyError:
+            # (?!) never matches; there are no counters
+            regex = re.compile(r"(?<!\w)(?:{})(?!\w)".format("|".join("({})".format(re.escape(name)) for name in names) or "(?!)"))
+            regex = PLCF._counter_regexes[names] = (regex, os.path.commonprefix(names))
+            return regex
 
 
     @staticmethod
@@ -408,27 +822,47 @@ class PLCF(object):
         assert isinstance(line,     str )
         assert isinstance(counters, dict)
 
+        names = list(counters.keys())
+
+        return PLCF._evalCounterLine(line, PLCF._counterRegex(names), [ counters[name] for name in names ])
+
+
+    @staticmethod
+    def _evalCounterLine(line, regex, values):
+        # The text between the expressions and the expressions, alternating
+        pieces = []
         s = 0
         while True:
             # Check if PLCF# expressions are valid
-            (_, expr, e) = PLCF.getPLCFExpression(line[s:])
+            (start, expr, e) = PLCF.getPLCFExpression(line[s:])
             if e is None:
                 break
+            pieces.append(line[s:s + start])
+            pieces.append(expr)
             s += e + 1
+        pieces.append(line[s:])
 
-        # substitutions
-        for key in counters.keys():
-            try:
-                while True:
-                    (line, _) = PLCF.substituteWord(line, key, str(counters[key]), True)
-            except PLCFNoWordException:
-                pass
+        # substitutions; the expressions and the text around them are separated by non-word characters
+        (regex, prefix) = regex
+        substitute = lambda m: str(values[m.lastindex - 1])
+        pieces     = [ regex.sub(substitute, piece) if prefix in piece else piece for piece in pieces ]
 
         # evaluation
-        while True:
-            (expr, line) = PLCF._processLineCounter(line)
-            if expr is None:
-                return line
+        result = [ pieces[0] ]
+        for i in range(1, len(pieces), 2):
+            value = str(PLCF._evalCounterExpression(pieces[i]))
+            if "[" in value:
+                # The result has a (nested) PLCF# expression; evaluate the line from the start like _processLineCounter() does
+                line = "".join(result) + value + "".join(PLCF.plcf_tag.join(pieces[j:j + 2]) + "]" for j in range(i + 1, len(pieces) - 1, 2)) + pieces[-1]
+                while True:
+                    (expr, line) = PLCF._processLineCounter(line)
+                    if expr is None:
+                        return line
+
+            result.append(value)
+            result.append(pieces[i + 1])
+
+        return "".join(result)
 
 
     @staticmethod
@@ -436,24 +870,39 @@ class PLCF(object):
         assert isinstance(line, str)
         assert isinstance(counters, dict)
 
+        names  = list(counters.keys())
+        values = [ counters[name] for name in names ]
+        (idx, line) = PLCF._evalCounterIncreaseLine(line, PLCF._counterRegex(names), names, values)
+        counters[names[idx]] = values[idx]
+
+        return (counters, line)
+
+
+    @staticmethod
+    def _evalCounterIncreaseLine(line, regex, names, values):
+        """
+        Processes a '#COUNTER <counter> = [PLCF# ...]' line; updates 'values' and returns the index of the counter and the line
+        """
         # identify start of expression and substitute
         (pos, _, _) = PLCF.getPLCFExpression(line)
 
         if pos is not None:
-            pre  = line[:pos]
-            post = line[pos:]
+            # Only the first occurrence of each counter
+            substituted = set()
+            def substitute(m):
+                idx = m.lastindex - 1
+                if idx in substituted:
+                    return m.group(0)
+                substituted.add(idx)
+                return str(values[idx])
 
-            for key in counters.keys():
-                try:
-                    (post, _) = PLCF.substituteWord(post, key, str(counters[key]))
-                except PLCFNoWordException:
-                    pass
-
-            line = pre + post
+            line = line[:pos] + regex[0].sub(substitute, line[pos:])
 
         # identify counter
         counterVar = line.split()[1]
-        if counterVar not in counters.keys():
+        try:
+            idx = names.index(counterVar)
+        except ValueError:
             raise PLCFSyntaxError("Unknown counter: {} in line {}".format(counterVar, line))
 
         # evaluate
@@ -461,11 +910,9 @@ class PLCF(object):
         assert isinstance(counter, int), counter
         assert isinstance(line,    str)
 
-        for key in counters.keys():
-            if counterVar == key:
-                counters[key] = counter
+        values[idx] = counter
 
-        return (counters, line)
+        return (idx, line)
 
 
     @staticmethod
@@ -477,17 +924,24 @@ class PLCF(object):
         if expression is None:
             return (None, line)
 
-        result = ""
+        result = PLCF._evalCounterExpression(expression)
+
+        return (result, line[:start] + str(result) + line[end + 1:])
+
 
+    @staticmethod
+    def _evalCounterExpression(expression):
         # evaluation happens after all substitutions have been performed
         try:
-            result = eval(expression)
+            evaluator = PLCF._evaluator(expression, False)
+            if evaluator is None:
+                return expression
+
+            return evaluator(None)
 
         # catch references to slot names (and erroneous input)
         except (SyntaxError, NameError) as e:
-            result = expression
-
-        return (result, line[:start] + str(result) + line[end + 1:])
+            return expression
 
 
     @staticmethod
@@ -514,33 +968,39 @@ class PLCF(object):
         return (start, expression, end)
 
 
+    # The regular expressions matching a pair of parentheses; key: the pair
+    _parentheses = dict()
+
+    @staticmethod
+    def _parenthesesRegex(paren):
+        try:
+            return PLCF._parentheses[paren]
+        except KeyError:
+            regex = PLCF._parentheses[paren] = re.compile("[{}]".format(re.escape(paren[:2])))
+            return regex
+
+
     #Returns the index of the closing paren which matches the first opening paren
     @staticmethod
     def findMatchingParenthesis(line, paren):
-        istart = []  # stack of indices of opening parentheses
-        d      = []
         oparen = paren[0]
-        cparen = paren[1]
-
-        for i, c in enumerate(line):
-            if c == oparen:
-                istart.append(i)
-            elif c == cparen:
-                try:
-                    ci = istart.pop()
-                    if not istart:   # check if this closed the first opening parenthesis
-                        return i
-
-                    d.append([ci, i])
-                except IndexError:
-                    raise PLCFSyntaxError('Too many closing parentheses')
+        depth  = 0  # number of open parentheses
+
+        # Only the parentheses are looked at
+        for m in PLCF._parenthesesRegex(paren).finditer(line):
+            if m.group() == oparen:
+                depth += 1
+            elif depth:
+                depth -= 1
+                if not depth:   # check if this closed the first opening parenthesis
+                    return m.start()
+            else:
+                raise PLCFSyntaxError('Too many closing parentheses')
 
-        if istart:  # check if stack is empty afterwards
+        if depth:
             raise PLCFSyntaxError('Too many opening parentheses')
 
-        d.sort()
-
-        return d[0][1]
+        raise IndexError("No {} in line".format(oparen))
 
 
     # substitutes a variable in an expression with the provided value
@@ -569,10 +1029,10 @@ class PLCF(object):
         assert isinstance(line, str)
 
         acc = 0
-        for c in line:
-            if c == '(':
+        for m in PLCF._parenthesesRegex('()').finditer(line):
+            if m.group() == '(':
                 acc += 1
-            elif c == ')':
+            else:
                 acc -= 1
 
             if acc < 0:
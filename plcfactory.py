@@ -29,10 +29,15 @@ import datetime
 import filecmp
 import os
 import time
+import traceback
 import hashlib
 import zlib
 from shutil import copy2
 from ast import literal_eval as ast_literal_eval
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
 
 import plcf_git as git
 
@@ -104,7 +109,9 @@ import plcf_glob as glob
 import plcf
 from plcf_ext import PLCFExtException
 from cc import CC
+from ccdb_dump import CCDB_Dump
 import helpers
+from safe_eval import SafeEvaluator
 
 
 # global variables
@@ -116,16 +123,22 @@ FOOTER_TAG      = "FOOTER"
 IFDEF_EXTENSION = ".def"
 hashobj         = None
 ifdefs          = dict()
+templates       = dict()
 printers        = dict()
-ifdef_params    = dict(PLC_TYPE = "SIEMENS", PLCF_STATUS = not tainted)
+# the interface definitions use true division
+ifdef_params    = dict(PLC_TYPE = "SIEMENS", PLCF_STATUS = not tainted, EVALUATOR = SafeEvaluator(true_division = True))
 plcfs           = dict()
 output_files    = dict()
 previous_files  = None
+ccdb_dump_base  = None
 device_tag      = None
 epi_version     = None
 hashes          = dict()
 prev_hashes     = None
 IOC_ARGS        = None
+JOBS            = 1
+# The devices and the hash base of the templates processed by forked processes
+template_job    = None
 ioc             = None
 e3              = None
 PLCF_BRANCH     = git.get_current_branch()
@@ -1109,64 +1122,47 @@ PLC-EPICS-COMMS: GatewayDatablock: {}""".format(hash_base, gw_db)
 
 
     def generate_files(self, devices, templates):
-        remaining_templates = []
-        for template in templates:
-            if not self._generate_file(devices, template):
-                remaining_templates.append(template)
-
-        return remaining_templates
-
-
-    def _get_printer(self, template):
-        try:
-            return printers[template]
-        except KeyError:
-            templatePrinter = tf.get_printer(template)
-
-        if templatePrinter is not None:
-            printers[template] = templatePrinter
-
-        return templatePrinter
-
+        """
+        Generates the files of 'templates' that have a built-in printer; the devices (and their interface definitions) are
+        visited only once and fed to every printer
 
-    def _generate_file(self, devices, template):
-        printer = self._get_printer(template)
-        if printer is None:
-            return False
+        Returns the templates that were not generated
+        """
+        printers = [ (template, self._get_printer(template)) for template in templates ]
+        printers = [ (template, printer) for (template, printer) in printers if printer is not None ]
+        if not printers:
+            return list(templates)
 
         start_time = time.time()
 
-        self._plc_plcf.register_template(template)
-
-        if device_tag:
-            tagged_templateID = "_".join([ device_tag, template ])
-        else:
-            tagged_templateID = template
+        multi_printer = tf.MULTI_PRINTER(printers)
+        tagged_templateIDs = [ "_".join([ device_tag, template ]) if device_tag else template for template in multi_printer.templates() ]
 
         print("#" * 60)
-        print("Template ID " + tagged_templateID)
+        print("Template IDs " + ", ".join(tagged_templateIDs))
         print("Device at root: " + str(self._plc) + "\n")
 
-        header = []
-        printer.header(None, header, ROOT_DEVICE = self._plc, PLCF = self._plc_plcf, OUTPUT_DIR = OUTPUT_DIR, HELPERS = helpers, **ifdef_params)
-        # has to acquire filename _before_ processing the header
-        # there are some special tags that are only valid in the header
-        outputFile = os.path.join(OUTPUT_DIR, createFilename(self._plc_plcf, header))
+        headers = multi_printer.outputs()
+        multi_printer.header(None, headers, ROOT_DEVICE = self._plc, PLCF = self._plc_plcf, OUTPUT_DIR = OUTPUT_DIR, HELPERS = helpers, **ifdef_params)
+        outputFiles = []
+        for (template, header) in zip(multi_printer.templates(), headers):
+            self._plc_plcf.register_template(template)
+            # has to acquire filename _before_ processing the header
+            # there are some special tags that are only valid in the header
+            outputFiles.append(os.path.join(OUTPUT_DIR, createFilename(self._plc_plcf, header)))
 
-        if header:
-            header = self._plc_plcf.process(header)
-            header = processHash(header, self._hashobj)
+            if header:
+                header[:] = processHash(self._plc_plcf.process(header), self._hashobj)
 
         print("Processing entire tree of controls-relationships:\n")
 
-        template_from_def_file = "Generating '{}' template from Definition File...".format(template)
+        template_from_def_file = "Generating {} templates from Definition File...".format(", ".join("'{}'".format(template) for template in multi_printer.templates()))
 
-        # for each device, find corresponding template and process it
-        output     = []
+        # for each device, find corresponding interface definition and feed it to every printer
+        outputs = multi_printer.outputs()
         for device in devices:
             deviceType = device.deviceType()
             cplcf      = getPLCF(device)
-            cplcf.register_template(template)
 
             print(device.name())
             print("Device type: " + deviceType)
@@ -1176,46 +1172,54 @@ PLC-EPICS-COMMS: GatewayDatablock: {}""".format(hash_base, gw_db)
                 print(template_from_def_file)
 
                 try:
-                    printer.body(ifdef, output, DEVICE = device, PLCF = cplcf)
+                    multi_printer.body(ifdef, outputs, DEVICE = device, PLCF = cplcf)
                 except (tf.TemplatePrinterException, plcf.PLCFException, PLCFExtException) as e:
-                    raise ProcessTemplateException(device.name(), template, e)
+                    raise ProcessTemplateException(device.name(), multi_printer.current(), e)
 
             print("=" * 40)
 
         print("\n")
 
-        footer = []
-        printer.footer(self._footer_ifdef, footer, PLCF = self._plc_plcf)
-        if footer:
-            footer = self._plc_plcf.process(footer)
-            footer = processHash(footer, self._hashobj)
+        footers = multi_printer.outputs()
+        multi_printer.footer(self._footer_ifdef, footers, PLCF = self._plc_plcf)
 
-        output = header + output + footer
+        generated = set()
+        for (template, tagged_templateID, header, output, footer, outputFile) in zip(multi_printer.templates(), tagged_templateIDs, headers, outputs, footers, outputFiles):
+            if footer:
+                self._plc_plcf.register_template(template)
+                footer = processHash(self._plc_plcf.process(footer), self._hashobj)
 
-        if not output:
-            print("There were no templates for ID = {}.\n".format(tagged_templateID))
-            return
+            output = header + output + footer
 
-        # Process counters
-        (output, _) = plcf.PLCF.evalCounters(output)
+            if not output:
+                print("There were no templates for ID = {}.\n".format(tagged_templateID))
+                continue
 
-        eol = getEOL(header)
-        # write file
-        with open(outputFile, 'w') as f:
-            for line in output:
-                line = line.rstrip()
-                if not line.startswith("#COUNTER") \
-                   and not line.startswith("#FILENAME") \
-                   and not line.startswith("#EOL"):
-                    print(line, end = eol, file = f)
+            # Process counters and write file
+            writeOutput(outputFile, output, getEOL(header))
 
-        output_files[template] = outputFile
+            output_files[template] = outputFile
+            generated.add(template)
 
-        print("Output file written:", outputFile)
-        print("Hash sum:", self._hashobj.getCRC32())
-        print("--- %s %.1f seconds ---\n" % (tagged_templateID, time.time() - start_time))
+            print("Output file written:", outputFile)
+            print("Hash sum:", self._hashobj.getCRC32())
+
+        print("--- %s %.1f seconds ---\n" % (", ".join(tagged_templateIDs), time.time() - start_time))
+
+        return [ template for template in templates if template not in generated ]
+
+
+    def _get_printer(self, template):
+        try:
+            return printers[template]
+        except KeyError:
+            templatePrinter = tf.get_printer(template)
+
+        if templatePrinter is not None:
+            printers[template] = templatePrinter
+
+        return templatePrinter
 
-        return True
 
 
     def generate_plc(self, out_dir, commit_id, verify):
@@ -1382,7 +1386,7 @@ def openHeaderFooter(device, tag, templateID):
     if not artifact:
         return []
 
-    with open(artifact.saved_as()) as f:
+    with artifact.open() as f:
         lines = f.readlines()
 
     return lines
@@ -1396,10 +1400,20 @@ def downloadTemplate(device, templateID):
                                        custom_filter = matchingArtifact,
                                        filter_args = (TEMPLATE_TAG, templateID))
 
-    if artifact is not None:
-        return artifact.saved_as()
+    if artifact is None:
+        return None
+
+    # Devices of the same type share the artifact; it is read and compiled only once
+    key = (artifact, templateID)
+    try:
+        return templates[key]
+    except KeyError:
+        pass
+
+    with artifact.open() as f:
+        template = templates[key] = plcf.PLCF.compileLines(f)
 
-    return None
+    return template
 
 
 def matchingArtifact(artifact, tag, templateID):
@@ -1497,6 +1511,27 @@ def getEOL(header):
     return header[tagPos][len(tag):].strip().replace('\\n', '\n').replace('\\r', '\r').strip('"').strip("'")
 
 
+#
+# Evaluates the counters in 'output' and writes the lines to 'outputFile'
+#
+def writeOutput(outputFile, output, eol):
+    # The lines are written as they are evaluated; the file is replaced only if every line could be evaluated
+    tmpFile = outputFile + ".part"
+    try:
+        with open(tmpFile, 'w') as f:
+            for line in plcf.PLCF.iterCounters(output):
+                line = line.rstrip()
+                if not line.startswith("#COUNTER") \
+                   and not line.startswith("#FILENAME") \
+                   and not line.startswith("#EOL"):
+                    print(line, end = eol, file = f)
+    except:
+        os.unlink(tmpFile)
+        raise
+
+    helpers.replace_file(tmpFile, outputFile)
+
+
 #
 # Returns an interface definition object
 #
@@ -1672,6 +1707,9 @@ def processTemplateID(templateID, devices):
                     if isinstance(template, str):
                         with open(template, 'r') as f:
                             output += cplcf.process(f)
+                    elif isinstance(template, tuple):
+                        # compiled by downloadTemplate()
+                        output += cplcf.processCompiled(template)
                     else:
                         output += cplcf.process(template)
                 except (plcf.PLCFException, PLCFExtException) as e:
@@ -1703,18 +1741,8 @@ def processTemplateID(templateID, devices):
         print("There were no templates for ID = {}.\n".format(tagged_templateID))
         return
 
-    # Process counters
-    (output, _) = plcf.PLCF.evalCounters(output)
-
-    eol = getEOL(header)
-    # write file
-    with open(outputFile, 'w') as f:
-        for line in output:
-            line = line.rstrip()
-            if not line.startswith("#COUNTER") \
-               and not line.startswith("#FILENAME") \
-               and not line.startswith("#EOL"):
-                print(line, end = eol, file = f)
+    # Process counters and write file
+    writeOutput(outputFile, output, getEOL(header))
 
     output_files[templateID] = outputFile
 
@@ -1723,6 +1751,125 @@ def processTemplateID(templateID, devices):
     print("--- %s %.1f seconds ---\n" % (tagged_templateID, time.time() - start_time))
 
 
+def processTemplateIDs(templateIDs, devices, hash_base):
+    """
+    Processes 'templateIDs' one by one or in parallel (in forked processes) if --jobs is greater than 1
+
+    Returns the hash of the last template
+    """
+    context = None
+    if JOBS > 1 and len(templateIDs) > 1:
+        context = getForkContext()
+        if context is None:
+            print("Cannot fork processes; processing templates one by one")
+
+    if context is None:
+        cur_hash = None
+        for templateID in templateIDs:
+            cur_hash = _processTemplateID(templateID, devices, hash_base)
+
+        return cur_hash
+
+    # The workers are forked with the parsed Interface Definitions
+    parseIfDefs(templateIDs, devices)
+
+    global template_job
+    template_job = (devices, hash_base)
+
+    # Whatever is buffered would be printed by every worker
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+    pool = context.Pool(min(JOBS, len(templateIDs)))
+    try:
+        cur_hash = None
+        # The results are processed in the order of 'templateIDs', just like when processing one by one
+        for (templateID, (log, outputFile, cur_hash, downloaded, error)) in zip(templateIDs, pool.imap(_processTemplateIDJob, templateIDs)):
+            print(log, end = '')
+            glob.ccdb.registerDownloadedArtifacts(downloaded)
+
+            if error is not None:
+                exception = PLCFactoryException(error[1])
+                exception.status = error[0]
+                raise exception
+
+            if outputFile is not None:
+                output_files[templateID] = outputFile
+    finally:
+        pool.terminate()
+        pool.join()
+        template_job = None
+
+    return cur_hash
+
+
+def getForkContext():
+    """
+    Returns the multiprocessing context that forks processes or None if forking is not supported
+    """
+    import multiprocessing
+
+    try:
+        return multiprocessing.get_context("fork")
+    except AttributeError:
+        # Python 2 forks on POSIX
+        return multiprocessing if os.name == "posix" else None
+    except ValueError:
+        return None
+
+
+def parseIfDefs(templateIDs, devices):
+    """
+    Parses the Interface Definitions of 'devices' just like the first template with a built-in printer would
+    """
+    available_printers = tf.available_printers()
+    for templateID in templateIDs:
+        if templateID in available_printers:
+            break
+    else:
+        return
+
+    for device in devices:
+        cplcf = getPLCF(device)
+        cplcf.register_template(templateID)
+        getIfDef(device, cplcf)
+
+
+def _processTemplateID(templateID, devices, hash_base):
+    global hashobj
+    hashobj = initializeHash(hash_base)
+
+    processTemplateID(templateID, devices)
+
+    return (hashobj.getHash(), hashobj.getCRC32())
+
+
+def _processTemplateIDJob(templateID):
+    """
+    Processes 'templateID' in a forked process
+
+    Returns what processTemplateID() printed, the output file, the hash, the newly downloaded artifacts and the error (if any)
+    """
+    (devices, hash_base) = template_job
+    downloaded = glob.ccdb.downloadedArtifacts()
+    cur_hash   = None
+    error      = None
+
+    log = StringIO()
+    (stdout, sys.stdout) = (sys.stdout, log)
+    try:
+        cur_hash = _processTemplateID(templateID, devices, hash_base)
+    except PLCFactoryException as e:
+        error = (e.status, e.message)
+    except Exception:
+        # Not every exception can be passed to the parent
+        error = (1, traceback.format_exc())
+    finally:
+        sys.stdout = stdout
+
+    return (log.getvalue(), output_files.get(templateID), cur_hash, glob.ccdb.downloadedArtifacts() - downloaded, error)
+
+
 def get_repository(device, link_name):
     repo = None
 
@@ -1733,6 +1880,37 @@ def get_repository(device, link_name):
     return repo
 
 
+def prefetchArtifacts(devices, templateIDs):
+    """
+    Downloads (in parallel) the artifacts that processing 'devices' will need
+    """
+    # Templates and header/footers are only used if there is no built-in template printer
+    custom_templateIDs = [ templateID for templateID in templateIDs if templateID not in tf.available_printers() ]
+    if device_tag:
+        tagged_templateIDs = [ "_" + "_".join([ device_tag, templateID ]) for templateID in custom_templateIDs ]
+    else:
+        tagged_templateIDs = custom_templateIDs
+
+    artifacts = []
+    for device in devices:
+        try:
+            artifacts.append(device.findArtifact(IFDEF_EXTENSION, device_tag))
+            for templateID in tagged_templateIDs:
+                artifacts.append(device.findArtifact(".txt", custom_filter = matchingArtifact, filter_args = (TEMPLATE_TAG, templateID)))
+        except CC.ArtifactException:
+            # Will be reported when the device is processed
+            pass
+
+    for templateID in custom_templateIDs:
+        for tag in (HEADER_TAG, FOOTER_TAG):
+            try:
+                artifacts.append(devices[0].findArtifact(".txt", custom_filter = matchingArtifact, filter_args = ((tag, TEMPLATE_TAG), templateID)))
+            except CC.ArtifactException:
+                pass
+
+    glob.ccdb.prefetchArtifacts(artifacts)
+
+
 def processDevice(deviceName, plc, templateIDs):
     assert isinstance(deviceName,  str)
     assert plc is None or isinstance(plc, PLC)
@@ -1780,6 +1958,9 @@ Exiting.
     # create a stable list of controlled devices
     devices = device.buildControlsList(include_self = True, verbose = True)
 
+    # download the artifacts in parallel; the devices are processed sequentially
+    prefetchArtifacts(devices, templateIDs)
+
     # create a factory of CCDB
     try:
         output_files["CCDB-FACTORY"] = device.toFactory(deviceName, OUTPUT_DIR, git_tag = epi_version, script = "-".join([ deviceName, glob.timestamp ]))
@@ -1803,14 +1984,9 @@ Exiting.
         # Returns the template IDs that have nothing to do with the PLC
         templateIDs = plc.generate_files(devices, templateIDs)
 
-    for templateID in templateIDs:
-        global hashobj
-        hashobj = initializeHash(hash_base)
-
-        processTemplateID(templateID, devices)
+    cur_hash = processTemplateIDs(templateIDs, devices, hash_base)
 
     if plc is None:
-        cur_hash = (hashobj.getHash(), hashobj.getCRC32())
         global hashes
         hashes[device.name()] = cur_hash
 
@@ -1981,6 +2157,9 @@ def verify_output(devicename, strictness, ignore):
     files_to_delete = []
     for template in ignored_templates:
         fname = previous_files.pop(template, None)
+        # The new CCDB dump might be a delta of the previous one
+        if fname is not None and fname == ccdb_dump_base:
+            continue
         if fname is not None and not isinstance(fname, list):
             if isinstance(fname, list):
 # E3 produces lists BUT we don't want to delete those files yet until we can actually verify them
@@ -2263,6 +2442,15 @@ Your Python version is {}
                         type     = str,
                         default  = "")
 
+    parser.add_argument(
+                        '--delta-dump',
+                        dest     = "delta_dump",
+                        help     = 'save only the changes since the CCDB dump of the previous run. Not used when creating an E3 module',
+                        default  = False,
+                        action   = 'store_true')
+
+    CC.dump_args(parser)
+
     parser.add_argument(
                         '--tag',
                         help     = 'tag to use if more than one matching artifact is found',
@@ -2283,6 +2471,14 @@ Your Python version is {}
                         default  = [],
                         required = not (plc or e3))
 
+    parser.add_argument(
+                        '--jobs',
+                        dest     = "jobs",
+                        help     = 'the maximum number of templates to generate in parallel (in separate processes). Default: 1',
+                        metavar  = 'N',
+                        type     = int,
+                        default  = 1)
+
     global OUTPUT_DIR
     parser.add_argument(
                         '--output',
@@ -2321,6 +2517,9 @@ Your Python version is {}
     global epi_version
     epi_version = args.epi_version
 
+    global JOBS
+    JOBS = args.jobs
+
     default_printers = set(["DEVICE-LIST"])
 
     ifdef_params["EXPERIMENTAL"] = args.experimental
@@ -2375,8 +2574,9 @@ Your Python version is {}
     helpers.makedirs(OUTPUT_DIR)
 
     read_data_files()
-    if VERIFY:
+    if VERIFY or args.delta_dump:
         obtain_previous_files()
+    if VERIFY:
         # Remove commit-id when verifying
         ifdef_params.pop("COMMIT_ID", COMMIT_ID)
         # Remove plcfactory status when verifying
@@ -2387,8 +2587,13 @@ Your Python version is {}
     # record the arguments used to run this instance
     record_args(root_device)
 
-    # create a dump of CCDB
-    output_files["CCDB-DUMP"] = glob.ccdb.save("-".join([ device, glob.timestamp ]), OUTPUT_DIR)
+    # create a dump of CCDB; the E3 module needs a full dump
+    global ccdb_dump_base
+    if args.delta_dump and previous_files is not None and not (plc and e3) and previous_files.get("CCDB-DUMP") is not None:
+        ccdb_dump_base = CCDB_Dump.full_dump_of(previous_files["CCDB-DUMP"])
+    output_files["CCDB-DUMP"] = glob.ccdb.save("-".join([ device, glob.timestamp ]), OUTPUT_DIR, base = ccdb_dump_base,
+                                               formats = args.dump_formats, libyaml = args.dump_libyaml,
+                                               dedupe_artifacts = args.dump_dedupe_artifacts)
 
     if plc and e3:
         e3.create()
@@ -2419,6 +2624,13 @@ Your Python version is {}
     if not args.clear_ccdb_cache:
         print("\nTemplates were reused\n")
 
+    if CC.http_cache is not None:
+        print(CC.http_cache.stats())
+    if CC.blob_store is not None:
+        print(CC.blob_store.stats())
+    if hasattr(glob.ccdb, "mirror"):
+        print(glob.ccdb.mirror().stats())
+
     try:
         if prev_hashes is not None and prev_hashes[root_device.name()][1] != hashes[root_device.name()][1]:
             print("""
@@ -0,0 +1,284 @@
+from __future__ import print_function
+from __future__ import absolute_import
+
+""" PLC Factory: Restricted evaluation of Python expressions """
+
+__author__     = "Krisztian Loki"
+__copyright__  = "Copyright 2021, European Spallation Source, Lund"
+__license__    = "GPLv3"
+
+
+# Python libraries
+import __future__
+import ast
+import operator
+import sys
+
+
+
+class UnsupportedExpression(Exception):
+    """
+    The expression is outside of the subset handled by SafeEvaluator
+    """
+    pass
+
+
+
+class SafeEvaluator(object):
+    """
+    Evaluates the subset of Python that PLCF# expressions and interface definitions use without eval()
+
+    The expression is parsed (with ast) once and turned into a tree of closures; the subset is: literals (including
+    lists, tuples, sets and dictionaries), arithmetic, comparison, boolean and conditional expressions and calls of
+    functions. UnsupportedExpression is raised for anything else.
+
+    The names are either fixed when the evaluator is created ('names') or passed to the compiled expression
+    every time it is evaluated (if 'names' is None). A name that is not defined raises NameError when evaluated,
+    just like in eval(). Only names and the public attributes of names can be called. Division is the classic one
+    (as in modules without 'from __future__ import division') unless 'true_division' is True.
+
+    evaluator() caches the compiled expressions; the ones outside of the subset are evaluated with eval() and a
+    cached code object.
+    """
+    BINOPS  = { ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul,
+                ast.Div: getattr(operator, "div", operator.truediv),
+                ast.FloorDiv: operator.floordiv, ast.Mod: operator.mod, ast.Pow: operator.pow,
+                ast.LShift: operator.lshift, ast.RShift: operator.rshift,
+                ast.BitOr: operator.or_, ast.BitAnd: operator.and_, ast.BitXor: operator.xor }
+    UNARYOPS = { ast.UAdd: operator.pos, ast.USub: operator.neg, ast.Not: operator.not_, ast.Invert: operator.invert }
+    CMPOPS   = { ast.Eq: operator.eq, ast.NotEq: operator.ne, ast.Lt: operator.lt, ast.LtE: operator.le,
+                 ast.Gt: operator.gt, ast.GtE: operator.ge, ast.Is: operator.is_, ast.IsNot: operator.is_not,
+                 ast.In: lambda a, b: a in b, ast.NotIn: lambda a, b: a not in b }
+    NAMED_CONSTANTS = { "True": True, "False": False, "None": None }
+    CONTAINERS      = { ast.List: list, ast.Tuple: tuple, ast.Set: set }
+    # The result of these is not shared between evaluations
+    MUTABLE         = (list, dict, set)
+
+    if sys.version_info >= (3, 8):
+        CONSTANTS = ((ast.Constant, "value"), )
+    else:
+        CONSTANTS = tuple((getattr(ast, cls), attr) for (cls, attr) in (("Num", "n"), ("Str", "s"), ("Bytes", "s"), ("NameConstant", "value")) if hasattr(ast, cls))
+
+    MAX_CACHED = 100000
+
+    def __init__(self, names = None, filename = "<string>", true_division = False):
+        self._names    = names
+        self._filename = filename
+        self._binops   = dict(SafeEvaluator.BINOPS)
+        self._flags    = 0
+        if true_division:
+            self._binops[ast.Div] = operator.truediv
+            self._flags = __future__.division.compiler_flag
+        # The compiled expressions; key: the text of the expression
+        self._cache    = dict()
+
+
+    def compile(self, expression):
+        """
+        Returns a function that evaluates 'expression'; the function has one argument: the dictionary of names (None if the
+        names are fixed)
+
+        Raises SyntaxError if 'expression' is not valid Python and UnsupportedExpression if it is outside of the subset
+        """
+        return self._compile(expression)[0]
+
+
+    def _compile(self, expression):
+        """
+        Returns the function that evaluates 'expression' and True if its result depends only on the expression
+        """
+        constant = [ True ]
+        func     = self._node(ast.parse(expression.strip(), mode = "eval").body, constant)
+
+        return (func, constant[0])
+
+
+    def evaluator(self, expression):
+        """
+        Returns the (cached) function that evaluates 'expression' or None if 'expression' is not an expression
+
+        Not an expression is something that is not valid Python or that refers to a name that is not defined no matter
+        what. These are found out only once, without raising an exception every time the expression is evaluated
+        """
+        try:
+            return self._cache[expression]
+        except KeyError:
+            pass
+
+        try:
+            (func, constant) = self._compile(expression)
+            if constant:
+                # Evaluated only once
+                try:
+                    value = func(None)
+                    if not isinstance(value, SafeEvaluator.MUTABLE):
+                        func = lambda names: value
+                except NameError:
+                    func  = None
+                except Exception:
+                    # Raised when evaluated
+                    pass
+        except SyntaxError:
+            func = None
+        except UnsupportedExpression:
+            func = self._eval(compile(expression.strip(), self._filename, "eval", self._flags, True))
+
+        if len(self._cache) >= SafeEvaluator.MAX_CACHED:
+            self._cache.clear()
+        self._cache[expression] = func
+
+        return func
+
+
+    def _eval(self, code):
+        fixed = self._names
+        if fixed is None:
+            return lambda names: eval(code, names)
+
+        # eval() adds __builtins__ to the globals; the fixed names are kept intact
+        env = dict(fixed)
+        return lambda names: eval(code, env)
+
+
+    def _name(self, name, constant):
+        try:
+            value = SafeEvaluator.NAMED_CONSTANTS[name]
+            return lambda names: value
+        except KeyError:
+            pass
+
+        def name_error():
+            raise NameError("name '{}' is not defined".format(name))
+
+        fixed = self._names
+        if fixed is None:
+            constant[0] = False
+            def lookup(names):
+                try:
+                    return names[name]
+                except KeyError:
+                    name_error()
+            return lookup
+
+        try:
+            value = fixed[name]
+            return lambda names: value
+        except KeyError:
+            return lambda names: name_error()
+
+
+    def _call(self, node, constant):
+        func = node.func
+        if isinstance(func, ast.Attribute) and isinstance(func.value, ast.Name) and not func.attr.startswith("_"):
+            (name, attr) = (func.value.id, func.attr)
+        elif isinstance(func, ast.Name):
+            (name, attr) = (func.id, None)
+        else:
+            raise UnsupportedExpression()
+
+        # eval() can call builtins
+        if self._names is not None and name not in self._names:
+            raise UnsupportedExpression()
+
+        func = self._name(name, constant)
+        if attr is not None:
+            value = func
+            func  = lambda names: getattr(value(names), attr)
+
+        if getattr(node, "starargs", None) or getattr(node, "kwargs", None) or any(type(arg).__name__ == "Starred" for arg in node.args) or \
+           any(keyword.arg is None for keyword in node.keywords):
+            raise UnsupportedExpression()
+
+        # The result of a call is not known in advance
+        constant[0] = False
+        args     = [ self._node(arg, constant) for arg in node.args ]
+        keywords = [ (keyword.arg, self._node(keyword.value, constant)) for keyword in node.keywords ]
+        if not keywords:
+            return lambda names: func(names)(*[ arg(names) for arg in args ])
+
+        return lambda names: func(names)(*[ arg(names) for arg in args ], **dict((key, value(names)) for (key, value) in keywords))
+
+
+    def _node(self, node, constant):
+        for (cls, attr) in SafeEvaluator.CONSTANTS:
+            if isinstance(node, cls):
+                value = getattr(node, attr)
+                return lambda names: value
+
+        if isinstance(node, ast.Name):
+            return self._name(node.id, constant)
+
+        if isinstance(node, ast.BinOp):
+            try:
+                op = self._binops[type(node.op)]
+            except KeyError:
+                raise UnsupportedExpression()
+            (left, right) = (self._node(node.left, constant), self._node(node.right, constant))
+            return lambda names: op(left(names), right(names))
+
+        if isinstance(node, ast.UnaryOp):
+            try:
+                op = SafeEvaluator.UNARYOPS[type(node.op)]
+            except KeyError:
+                raise UnsupportedExpression()
+            operand = self._node(node.operand, constant)
+            return lambda names: op(operand(names))
+
+        if isinstance(node, ast.BoolOp):
+            values = [ self._node(value, constant) for value in node.values ]
+            if isinstance(node.op, ast.And):
+                def bool_and(names):
+                    for value in values:
+                        result = value(names)
+                        if not result:
+                            return result
+                    return result
+                return bool_and
+
+            def bool_or(names):
+                for value in values:
+                    result = value(names)
+                    if result:
+                        return result
+                return result
+            return bool_or
+
+        if isinstance(node, ast.Compare):
+            try:
+                ops = [ SafeEvaluator.CMPOPS[type(op)] for op in node.ops ]
+            except KeyError:
+                raise UnsupportedExpression()
+            left        = self._node(node.left, constant)
+            comparators = [ self._node(comparator, constant) for comparator in node.comparators ]
+            def compare(names):
+                a = left(names)
+                for (op, comparator) in zip(ops, comparators):
+                    b = comparator(names)
+                    if not op(a, b):
+                        return False
+                    a = b
+                return True
+            return compare
+
+        if isinstance(node, ast.IfExp):
+            (test, body, orelse) = (self._node(node.test, constant), self._node(node.body, constant), self._node(node.orelse, constant))
+            return lambda names: body(names) if test(names) else orelse(names)
+
+        if isinstance(node, ast.Call):
+            return self._call(node, constant)
+
+        if type(node) in SafeEvaluator.CONTAINERS:
+            if any(type(elt).__name__ == "Starred" for elt in node.elts):
+                raise UnsupportedExpression()
+            container = SafeEvaluator.CONTAINERS[type(node)]
+            elts      = [ self._node(elt, constant) for elt in node.elts ]
+            # A new container every time
+            return lambda names: container([ elt(names) for elt in elts ])
+
+        if isinstance(node, ast.Dict):
+            if any(key is None for key in node.keys):
+                raise UnsupportedExpression()
+            items = [ (self._node(key, constant), self._node(value, constant)) for (key, value) in zip(node.keys, node.values) ]
+            return lambda names: dict((key(names), value(names)) for (key, value) in items)
+
+        raise UnsupportedExpression()
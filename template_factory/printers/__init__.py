@@ -452,6 +452,71 @@ class PRINTER(object):
 
 
 
+#
+# MULTI_PRINTER
+#
+class MULTI_PRINTER(object):
+    """
+    Feeds the header, the interface definitions and the footer to several printers in one pass
+
+    'printers' is a list of (template ID, printer) pairs; every printer has its own output (a list in 'outputs', in the
+    order of 'printers'). The template ID is registered with the PLCF instance (if any) before a printer is fed so that
+    the PLCF expressions are expanded exactly as if the printers were used one after the other
+    """
+    def __init__(self, printers):
+        super(MULTI_PRINTER, self).__init__()
+
+        self._printers = list(printers)
+        self._current  = None
+
+
+    def templates(self):
+        return [ template for (template, printer) in self._printers ]
+
+
+    def current(self):
+        """
+        Returns the template ID of the printer that was fed last (the one that raised the exception)
+        """
+        return self._current
+
+
+    def outputs(self):
+        """
+        Returns an empty output for every printer
+        """
+        return [ [] for _ in self._printers ]
+
+
+    def _dispatch(self, func, if_def, outputs, keyword_params):
+        assert len(outputs) == len(self._printers),    "Need one output for every printer"
+
+        plcf = keyword_params.get("PLCF", None)
+        for ((template, printer), output) in zip(self._printers, outputs):
+            self._current = template
+            if plcf is not None:
+                plcf.register_template(template)
+            getattr(printer, func)(if_def, output, **keyword_params)
+
+
+    def header(self, header_if_def, outputs, **keyword_params):
+        self._dispatch("header", header_if_def, outputs, keyword_params)
+
+        return self
+
+
+    def body(self, if_def, outputs, **keyword_params):
+        self._dispatch("body", if_def, outputs, keyword_params)
+
+
+    def footer(self, footer_if_def, outputs, **keyword_params):
+        self._dispatch("footer", footer_if_def, outputs, keyword_params)
+
+        return self
+
+
+
+
 _available_printers  = []
 _combinable_printers = set()
 for printer in glob.iglob(os.path.dirname(__file__) + "/printer_*.py"):
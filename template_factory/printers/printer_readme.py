@@ -54,7 +54,7 @@ class PLC_README(PRINTER):
            filename = artifact.filename(),
            version  = "CCDB" if artifact.epi_version() is None else artifact.epi_version(),
            url      = artifact.url(),
-           saved_as = self.tourl(basename(artifact.saved_as()), "misc/ccdb/{fname}".format(fname = artifact.saved_as()))), output)
+           saved_as = self.tourl(basename(artifact.saved_as(extract = False)), "misc/ccdb/{fname}".format(fname = artifact.saved_as(extract = False)))), output)
 
 
 
@@ -8,6 +8,7 @@ import shutil
 import tempfile
 import unittest
 
+import tf
 import tf_ifdef
 
 
@@ -750,6 +751,58 @@ add_digital("q2")
 
 
 
+    def test_evaluator(self):
+        class RecordingEvaluator(object):
+            def __init__(self):
+                self.lines = []
+
+            def evaluator(self, line):
+                self.lines.append(line)
+                return lambda names: eval(line, names)
+
+        with mkdtemp(prefix = "test-ifdef-evaluator") as tmpdir:
+            evaluator_def = os.path.join(tmpdir, "evaluator.def")
+            with open(evaluator_def, "w") as def_file:
+                print("""
+define_status_block()
+add_digital("foo")
+""", file = def_file)
+
+            # Without an EVALUATOR the lines are eval()-ed
+            ifdef = tf_ifdef.IF_DEF.parse(evaluator_def, QUIET = True)
+            self.assertIsNotNone(ifdef.has_pv("foo"))
+
+            tf_ifdef.PV.init(None)
+            evaluator = RecordingEvaluator()
+            ifdef = tf_ifdef.IF_DEF.parse(evaluator_def, QUIET = True, EVALUATOR = evaluator)
+            self.assertIsNotNone(ifdef.has_pv("foo"))
+            self.assertEqual(evaluator.lines, [ "define_status_block()", 'add_digital("foo")' ])
+
+
+    def test_multi_printer(self):
+        ifdef     = tf_ifdef.IF_DEF.parse(os.path.join(os.path.dirname(os.path.abspath(__file__)), "every.def"), QUIET = True)
+        templates = [ "BEAST", "ENGUI", "DEVICE-LIST" ]
+
+        expected = []
+        for template in templates:
+            output = []
+            tf.get_printer(template).body(ifdef, output)
+            expected.append(output)
+
+        multi_printer = tf.MULTI_PRINTER([ (template, tf.get_printer(template)) for template in templates ])
+        self.assertEqual(multi_printer.templates(), templates)
+
+        # Every printer has its own output
+        outputs = multi_printer.outputs()
+        multi_printer.body(ifdef, outputs)
+        self.assertEqual(outputs, expected)
+        self.assertEqual(multi_printer.current(), "DEVICE-LIST")
+
+        with self.assertRaises(AssertionError):
+            multi_printer.body(ifdef, [ [] ])
+
+
+
 if __name__ == "__main__":
     unittest.main()
 
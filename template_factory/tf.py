@@ -9,7 +9,7 @@ __license__    = "GPLv3"
 
 
 from tf_ifdef import IF_DEF
-from printers import get_printer, available_printers, is_combinable, TemplatePrinterException
+from printers import get_printer, available_printers, is_combinable, TemplatePrinterException, MULTI_PRINTER
 
 def parseDef(def_file, **kwargs):
     assert isinstance(def_file, str)
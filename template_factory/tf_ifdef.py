@@ -13,6 +13,7 @@ __license__    = "GPLv3"
 import copy
 from collections import OrderedDict
 #import inspect
+import sys
 
 # FIXME: I don't think it is needed anymore
 #try:
@@ -876,16 +877,19 @@ class IF_DEF(object):
         # TODO: change to str once we moved to Python3
         if isinstance(def_file, basestring):
             artifact = keyword_params.get("ARTIFACT")
+            def_open = lambda: open(def_file, 'r')
         else:
+            # Read the artifact directly; it might not be extracted from a CCDB dump
             artifact = def_file
-            def_file = artifact.saved_as()
+            def_file = artifact.saved_as(extract = False)
+            def_open = artifact.open
 
         keyword_params["PLCF"] = keyword_params.get("PLCF", IF_DEF.create_dummy_plcf())
         cplcf = keyword_params["PLCF"]
 
         with IF_DEF(**keyword_params) as if_def:
             if_def._artifact = artifact
-            if_def._read_def(def_file, cplcf)
+            if_def._read_def(def_file, def_open, cplcf)
 
         return if_def
 
@@ -927,6 +931,8 @@ class IF_DEF(object):
         self._readonly              = keyword_params.get("PLC_READONLY", False)
         self._experimental          = keyword_params.get("EXPERIMENTAL", False)
         self._quiet                 = keyword_params.get("QUIET",        False)
+        # Compiles (and caches) the interface definition lines, a SafeEvaluator with true division; eval() if not set
+        self._evaluator             = keyword_params.get("EVALUATOR",    None)
         self._global_defaults       = dict()
         self._defaults              = dict()
         self._macros                = list()
@@ -969,7 +975,14 @@ class IF_DEF(object):
             raise IfDefSyntaxError("Not supported keyword")
 
         try:
-            result = eval(line, self._evalEnv)
+            if self._evaluator is not None:
+                evaluator = self._evaluator.evaluator(line)
+                if evaluator is None:
+                    # Not valid Python; compile() raises the SyntaxError that _parse() expects
+                    compile(line, "<string>", "eval")
+                result = evaluator(self._evalEnv)
+            else:
+                result = eval(line, self._evalEnv)
 
             if not isinstance(result, IF_DEF_INTERFACE_FUNC):
                raise IfDefSyntaxError("Missing parentheses?")
@@ -1168,12 +1181,12 @@ class IF_DEF(object):
             raise
 
 
-    def _read_def(self, def_file, cplcf):
+    def _read_def(self, def_file, def_open, cplcf):
         if self._filename is not None:
             raise IfDefInternalError("Cannot parse more than one Interface Definition file")
 
         self._filename = def_file
-        with open(def_file, 'r') as defs:
+        with def_open() as defs:
             multiline    = None
             multilinenum = 1
             linenum      = 1
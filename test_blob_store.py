@@ -0,0 +1,123 @@
+from __future__ import absolute_import
+from __future__ import print_function
+
+import hashlib
+import io
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+
+from blob_store import BlobStore
+
+
+
+class TestBlobStore(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix = "test_blob_store")
+        self.store  = BlobStore(os.path.join(self.tmpdir, "blobs"))
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+
+    def _file(self, name, content):
+        fname = os.path.join(self.tmpdir, name)
+        with open(fname, "wb") as f:
+            f.write(content)
+
+        return fname
+
+
+    def testPut(self):
+        content = b"PLC Factory\n" * 1000
+        digest  = self.store.put(io.BytesIO(content))
+        self.assertEqual(digest, hashlib.sha256(content).hexdigest())
+        self.assertTrue(self.store.has(digest))
+        with self.store.open(digest) as f:
+            self.assertEqual(f.read(), content)
+
+        # The same content is stored only once
+        self.assertEqual(self.store.put(io.BytesIO(content)), digest)
+        self.assertEqual((self.store.stored, self.store.reused), (1, 1))
+        self.assertFalse(self.store.has(hashlib.sha256(b"").hexdigest()))
+
+
+    def testPutFile(self):
+        a = self._file("a.def", b"define_status_block()\n")
+        b = self._file("b.def", b"define_status_block()\n")
+        c = self._file("c.def", b"define_command_block()\n")
+
+        digests = list(map(self.store.put_file, [ a, b, c ]))
+        self.assertEqual(digests[0], digests[1])
+        self.assertNotEqual(digests[0], digests[2])
+        self.assertEqual(self.store.stored, 2)
+
+        # The files are kept (as links to the stored copy if possible)
+        for (fname, digest) in zip([ a, b, c ], digests):
+            with open(fname, "rb") as f:
+                self.assertEqual(BlobStore.digest_of(f), digest)
+
+
+    def testLink(self):
+        digest = self.store.put(io.BytesIO(b"content"))
+        fname  = os.path.join(self.tmpdir, "sub", "dir", "file.txt")
+        self.assertEqual(self.store.link(digest, fname), fname)
+        with open(fname, "rb") as f:
+            self.assertEqual(f.read(), b"content")
+
+        # Existing files are replaced
+        other = self.store.put(io.BytesIO(b"other content"))
+        self.store.link(other, fname)
+        with open(fname, "rb") as f:
+            self.assertEqual(f.read(), b"other content")
+        with self.store.open(digest) as f:
+            self.assertEqual(f.read(), b"content")
+
+
+    @unittest.skipUnless(BlobStore.HARD_LINKS, "files are copied")
+    def testReadOnlyLink(self):
+        fname  = self._file("file.txt", b"content")
+        digest = self.store.put_file(fname)
+
+        # Editing a linked file in place must not modify the stored blob
+        self.assertEqual(os.stat(fname).st_ino, os.stat(self.store.path(digest)).st_ino)
+        self.assertFalse(os.stat(fname).st_mode & (stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+
+
+    def testEviction(self):
+        store   = BlobStore(os.path.join(self.tmpdir, "evicting"), max_size = 12)
+        digests = []
+        for i in range(2):
+            digests.append(store.put(io.BytesIO("{}2345".format(i).encode())))
+            # Make sure modification times differ
+            os.utime(store.path(digests[-1]), (i, i))
+        self.assertEqual(store.evicted, 0)
+
+        # Using a blob makes it recently used
+        store.open(digests[0]).close()
+        digests.append(store.put(io.BytesIO(b"22345")))
+        self.assertEqual(store.evicted, 1)
+        self.assertTrue(store.has(digests[0]))
+        self.assertFalse(store.has(digests[1]))
+        self.assertTrue(store.has(digests[2]))
+
+
+    def testRemove(self):
+        digests = set(self.store.put(io.BytesIO(content)) for content in (b"a", b"b", b"c"))
+        self.assertEqual(set(self.store.digests()), digests)
+
+        digest = digests.pop()
+        fname  = self.store.link(digest, os.path.join(self.tmpdir, "linked"))
+        self.store.remove(digest)
+        self.store.remove(digest)
+        self.assertEqual(set(self.store.digests()), digests)
+        # Links are kept
+        with open(fname, "rb") as f:
+            self.assertEqual(BlobStore.digest_of(f), digest)
+
+
+if __name__ == "__main__":
+    unittest.main()
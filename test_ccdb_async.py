@@ -0,0 +1,60 @@
+from __future__ import absolute_import
+from __future__ import print_function
+
+# This module uses 'async def'; conftest.py does not collect it on Python 2
+
+import asyncio
+import unittest
+
+import ccdb_async
+from ccdb_server import CCDBServer
+from test_ccdb_dump import CCDBServerTestCase, MultiDeviceDB
+
+
+
+class TestAsyncCCDB(CCDBServerTestCase):
+    def testMultiDevice(self):
+        self._testMultiDevice(ccdb_async.AsyncCCDB).close()
+
+
+    def testArtifact(self):
+        self._testArtifact(ccdb_async.AsyncCCDB).close()
+
+
+    @unittest.skipIf(ccdb_async.aiohttp is None, "aiohttp is not available")
+    def testAiohttp(self):
+        class AiohttpCCDB(ccdb_async.AsyncCCDB):
+            async def _aget_with_requests(self, url, headers):
+                raise AssertionError("{} was not downloaded with aiohttp".format(url))
+
+        self._testMultiDevice(AiohttpCCDB).close()
+        self._testArtifact(AiohttpCCDB).close()
+
+
+    def testWithoutAiohttp(self):
+        # The requests are run on a thread pool
+        aiohttp = ccdb_async.aiohttp
+        ccdb_async.aiohttp = None
+        try:
+            self._testMultiDevice(ccdb_async.AsyncCCDB).close()
+            self._testArtifact(ccdb_async.AsyncCCDB).close()
+        finally:
+            ccdb_async.aiohttp = aiohttp
+
+
+    def testCoroutines(self):
+        with CCDBServer(str(self.MULTI_DEVICE_ZIP)) as server:
+            cc_obj = ccdb_async.AsyncCCDB(server.url(), http_cache = False)
+
+            async def get_devices():
+                return await asyncio.gather(cc_obj.adevice("root"), cc_obj.agetAllDeviceNames())
+
+            (root, names) = cc_obj._run(get_devices())
+            self.assertEqual(root.name(), "root")
+            self.assertEqual(len(list(names)), len(MultiDeviceDB.controls_list) + 1)
+            cc_obj.close()
+
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,167 @@
+from __future__ import absolute_import
+from __future__ import print_function
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import requests
+
+from cc import CC
+from ccdb import CCDB
+from ccdb_cache import HTTPCache
+from ccdb_factory import CCDB_Factory
+from ccdb_server import CCDBServer
+
+if sys.version_info.major >= 3:
+    import ccdb_async
+
+
+
+def response(status_code, content = b"", headers = None):
+    r = requests.models.Response()
+    r.status_code       = status_code
+    r.url               = "https://ccdb.test/rest/slots/foo"
+    r.headers           = requests.structures.CaseInsensitiveDict(headers or {})
+    r._content          = content
+    r._content_consumed = True
+
+    return r
+
+
+
+class TestHTTPCache(unittest.TestCase):
+    url = "https://ccdb.test/rest/slots/foo"
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix = "test_ccdb_cache")
+        self.cache     = HTTPCache(self.directory)
+
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+
+    def testNoValidators(self):
+        self.cache.response(self.url, None, response(200, b"body"))
+        self.assertEqual(self.cache.uncacheable, 1)
+        self.assertEqual(self.cache.request_headers(self.url), None)
+
+
+    def testRevalidate(self):
+        headers = { "Accept": "application/json" }
+        self.assertEqual(self.cache.request_headers(self.url, headers), headers)
+
+        r = self.cache.response(self.url, headers, response(200, b"body", { "ETag": '"1"', "Last-Modified": "Mon, 01 Mar 2021 00:00:00 GMT" }))
+        self.assertEqual(r.content, b"body")
+        self.assertEqual(self.cache.downloaded, 1)
+
+        cond_headers = self.cache.request_headers(self.url, headers)
+        self.assertEqual(cond_headers["If-None-Match"], '"1"')
+        self.assertEqual(cond_headers["If-Modified-Since"], "Mon, 01 Mar 2021 00:00:00 GMT")
+        self.assertEqual(cond_headers["Accept"], "application/json")
+        # The original headers are not modified
+        self.assertNotIn("If-None-Match", headers)
+
+        # Different Accept header is a different entry
+        self.assertEqual(self.cache.request_headers(self.url), None)
+
+        r = self.cache.response(self.url, headers, response(304))
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.content, b"body")
+        self.assertEqual(r.text, "body")
+        self.assertEqual(b"".join(r), b"body")
+        self.assertEqual(self.cache.revalidated, 1)
+        self.assertEqual(self.cache.bytes_saved, 4)
+
+
+    def testEviction(self):
+        cache = HTTPCache(self.directory, max_size = 12)
+        for i in range(3):
+            cache.response("{}/{}".format(self.url, i), None, response(200, b"12345", { "ETag": str(i) }))
+            # Make sure modification times differ
+            body = os.path.join(self.directory, HTTPCache._key("{}/{}".format(self.url, i), None) + HTTPCache.BODY_SUFFIX)
+            os.utime(body, (i, i))
+
+        self.assertEqual(cache.evicted, 1)
+        self.assertEqual(cache.request_headers("{}/0".format(self.url)), None)
+        self.assertEqual(cache.request_headers("{}/2".format(self.url))["If-None-Match"], "2")
+
+
+
+    def testEvictedBody(self):
+        self.cache.response(self.url, None, response(200, b"body", { "ETag": '"1"' }))
+        self.assertEqual(self.cache.request_headers(self.url)["If-None-Match"], '"1"')
+
+        # Evicted by another process after the conditional request was sent
+        os.unlink(os.path.join(self.directory, HTTPCache._key(self.url, None) + HTTPCache.BODY_SUFFIX))
+        self.assertIsNone(self.cache.response(self.url, None, response(304)))
+        self.assertEqual(self.cache.revalidated, 0)
+
+
+    def _testGetEvicted(self, get):
+        factory = CCDB_Factory()
+        factory.addDevice("type", "foo")
+        dump = factory.save("evicted", self.directory)
+
+        # The body is evicted between the conditional request and the '304 Not Modified' reply
+        request_headers = self.cache.request_headers
+        def evicting_request_headers(url, headers = None):
+            headers = request_headers(url, headers)
+            for f in os.listdir(self.directory):
+                if f.endswith(HTTPCache.BODY_SUFFIX):
+                    os.unlink(os.path.join(self.directory, f))
+            return headers
+        self.cache.request_headers = evicting_request_headers
+
+        http_cache = CC.http_cache
+        CC.http_cache = self.cache
+        try:
+            with CCDBServer(dump) as server:
+                url = CCDB(server.url())._slot_url("foo")
+                content = get(server, url).content
+                self.assertIn(b'"foo"', content)
+                self.assertEqual(self.cache.downloaded, 1)
+
+                sent = server.requests
+                r = get(server, url)
+                self.assertEqual(r.status_code, 200)
+                self.assertEqual(r.content, content)
+                # Sent again without the validators
+                self.assertEqual(server.requests, sent + 2)
+                self.assertEqual(self.cache.downloaded, 2)
+        finally:
+            CC.http_cache = http_cache
+
+
+    def testGetEvicted(self):
+        self._testGetEvicted(lambda server, url: CC.get(url, headers = CCDB.JSON_HEADERS))
+
+
+    @unittest.skipIf(sys.version_info.major < 3, "asyncio requires Python3")
+    def testAsyncGetEvicted(self):
+        def get(server, url):
+            cc_obj = ccdb_async.AsyncCCDB(server.url())
+            try:
+                return cc_obj._run(cc_obj._aget(url, CCDB.JSON_HEADERS))
+            finally:
+                cc_obj.close()
+
+        self._testGetEvicted(get)
+
+
+    def testOptIn(self):
+        http_cache = CC.http_cache
+        CC.http_cache = None
+        try:
+            CCDB("https://ccdb.test")
+            self.assertIsNone(CC.http_cache)
+        finally:
+            CC.http_cache = http_cache
+
+
+
+if __name__ == "__main__":
+    unittest.main()
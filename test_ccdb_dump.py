@@ -1,16 +1,23 @@
 from __future__ import absolute_import
 from __future__ import print_function
 
+from collections import OrderedDict
 import filecmp
+import json
 import os
 import shutil
+import sys
 import tempfile
 import unittest
 import zipfile
 
+from blob_store import BlobStore
 import ccdb
 import ccdb_dump
 from ccdb_factory import CCDB_Factory
+from ccdb_server import CCDBServer
+import fixtures
+import helpers
 
 
 
@@ -475,6 +482,54 @@ class TestCCDBDump(unittest.TestCase):
     def testMultiDeviceZip(self):
         cc_obj = ccdb_dump.CCDB_Dump.load(str(self.MULTI_DEVICE_ZIP))
         self._testMultiDevice(cc_obj)
+        self._testNativeStrings(cc_obj)
+
+
+    def testLazyZip(self):
+        cc_obj = ccdb_dump.CCDB_Dump.load(str(self.MULTI_DEVICE_ZIP))
+        # Devices are loaded on demand
+        self.assertEqual(len(cc_obj._devices), 0)
+        self.assertEqual(len(cc_obj.getAllDeviceNames()), 5)
+        cc_obj.device("foo1_level1")
+        self.assertEqual(list(cc_obj._devices.keys()), ["foo1_level1"])
+
+        # Everything is loaded if needed
+        self.assertEqual(list(json.loads(cc_obj.to_json(), object_pairs_hook = OrderedDict)["devices"].keys()), cc_obj.getAllDeviceNames())
+
+
+    def _testNativeStrings(self, cc_obj):
+        # plcfactory cannot handle Python2 unicode strings
+        for deviceName in cc_obj.getAllDeviceNames():
+            self.assertIsInstance(deviceName, str)
+            device = cc_obj.device(deviceName)
+            self.assertIsInstance(device.name(), str)
+            self.assertIsInstance(device.deviceType(), str)
+
+
+    def _testOldFormatZip(self, exclude):
+        with mkstemp(suffix = ".ccdb.zip") as (tmpfile, tmpfilepath):
+            with zipfile.ZipFile(str(self.MULTI_DEVICE_ZIP)) as src:
+                with os.fdopen(tmpfile, "wb") as tmpfilefile:
+                    with zipfile.ZipFile(tmpfilefile, mode = "w") as dst:
+                        for info in src.infolist():
+                            if not info.filename.startswith(tuple(map(lambda e: "ccdb/" + e, exclude))):
+                                dst.writestr(info, src.read(info))
+
+            cc_obj = ccdb_dump.CCDB_Dump.load(tmpfilepath)
+            self.assertIsNone(cc_obj._index)
+            self.assertEqual(len(cc_obj._devices), 5)
+            self._testMultiDevice(cc_obj)
+            self._testNativeStrings(cc_obj)
+
+
+    def testDeviceJSONZip(self):
+        # Dumps without an index are read from device.json
+        self._testOldFormatZip([ ccdb_dump.CC.DEVICE_INDEX, "devices/" ])
+
+
+    def testDeviceDictZip(self):
+        # Dumps without device.json are still readable
+        self._testOldFormatZip([ ccdb_dump.CC.DEVICE_INDEX, "devices/", ccdb_dump.CC.DEVICE_JSON ])
 
 
     def testArtifactZip(self):
@@ -487,6 +542,279 @@ class TestCCDBDump(unittest.TestCase):
         self._testArtifact(cc_obj, self.UTF_ARTIFACT_ZIP)
 
 
+    def testZipArtifactOpen(self):
+        cc_obj = ccdb_dump.CCDB_Dump.load(str(self.UTF_ARTIFACT_ZIP))
+        device = cc_obj.device("device")
+        artifact = device.findArtifact(ArtifactDB.pyext)
+        if os.path.exists(artifact.saveas()):
+            os.remove(artifact.saveas())
+
+        # The artifact is read from the zip file
+        dArtifact = device.downloadArtifact(ArtifactDB.pyext)
+        fname = dArtifact.saved_as(extract = False)
+        self.assertFalse(os.path.exists(fname))
+        with dArtifact.open() as f:
+            lines = f.readlines()
+        with helpers.text_reader(open(self.UTF_ARTIFACT_ZIP.artifact_py, "rb")) as f:
+            self.assertEqual(lines, f.readlines())
+        self.assertFalse(os.path.exists(fname))
+
+        # And extracted if a file is needed
+        self.assertEqual(dArtifact.saved_as(), fname)
+        self.assertTrue(filecmp.cmp(fname, self.UTF_ARTIFACT_ZIP.artifact_py, shallow = False))
+
+
+    def testDedupedArtifacts(self):
+        with mkdtemp(prefix = "testDedupedArtifacts") as tmpdirpath:
+            same  = os.path.join(tmpdirpath, "same.txt")
+            other = os.path.join(tmpdirpath, "other.txt")
+            for (fname, content) in ((same, "same\n"), (other, "other\n")):
+                with open(fname, "w") as f:
+                    f.write(content)
+
+            factory = CCDB_Factory()
+            for i in range(3):
+                factory.addDevice("type", "device{}".format(i)).addArtifact("artifact.txt", other if i == 2 else same)
+            # Every artifact is saved as itself by default
+            fullfile = factory.save("full", tmpdirpath)
+            with zipfile.ZipFile(fullfile) as z:
+                self.assertEqual(len([ n for n in z.namelist() if n.endswith("artifact.txt") ]), 3)
+            os.unlink(fullfile)
+
+            dumpfile = factory.save("dedupe", tmpdirpath, dedupe_artifacts = True)
+            del factory
+
+            # Artifacts with the same content are saved only once
+            with zipfile.ZipFile(dumpfile) as z:
+                self.assertEqual(len([ n for n in z.namelist() if n.endswith("artifact.txt") ]), 2)
+            dumpdir = os.path.join(tmpdirpath, "dir")
+            self._unzip(dumpfile, dumpdir)
+
+            def check(cc_obj):
+                for i in range(3):
+                    dArtifact = cc_obj.device("device{}".format(i)).downloadArtifact("txt")
+                    self.assertTrue(filecmp.cmp(dArtifact.saved_as(), other if i == 2 else same, shallow = False))
+
+            check(ccdb_dump.CCDB_Dump.load(dumpfile))
+            check(ccdb_dump.CCDB_Dump.load(dumpdir))
+
+            # Extracting populates the artifact store
+            ccdb_dump.CC.blob_store = BlobStore(os.path.join(tmpdirpath, "blobs"))
+            try:
+                helpers.rmdirs(ccdb_dump.CC.TEMPLATE_DIR)
+                check(ccdb_dump.CCDB_Dump.load(dumpfile))
+                self.assertEqual(ccdb_dump.CC.blob_store.stored, 2)
+            finally:
+                ccdb_dump.CC.blob_store = None
+
+
+    def testDeltaDump(self):
+        with mkdtemp(prefix = "testDeltaDump") as tmpdirpath:
+            artifacts = []
+            for i in range(3):
+                artifact = os.path.join(tmpdirpath, "artifact{}.txt".format(i))
+                with open(artifact, "w") as f:
+                    print(i, file = f)
+                artifacts.append(artifact)
+
+            def factory(changed):
+                factory = CCDB_Factory()
+                root = factory.addDevice("root", "root")
+                for i in range(4):
+                    device = root.addDevice("type", "device{}".format(i))
+                    device.setProperty("P", "changed" if changed and i == 1 else "original")
+                    if i < 2:
+                        device.addArtifact("artifact.txt", artifacts[2 if changed and i == 1 else i])
+                return factory
+
+            base  = factory(False).save("base", tmpdirpath)
+            delta = factory(True).save("delta", tmpdirpath, base = base)
+            full  = factory(True).save("full", tmpdirpath)
+
+            # Only the changed device and artifact are saved
+            with zipfile.ZipFile(delta) as z:
+                names = z.namelist()
+            self.assertNotIn(os.path.join("ccdb", ccdb_dump.CC.DEVICE_JSON), names)
+            self.assertEqual([ n for n in names if n.startswith(os.path.join("ccdb", "devices")) ], [ os.path.join("ccdb", ccdb_dump.CC.DEVICE_RECORD.format(2)) ])
+            self.assertEqual(len([ n for n in names if n.endswith("artifact.txt") ]), 1)
+
+            self.assertEqual(ccdb_dump.CCDB_Dump.full_dump_of(delta), os.path.abspath(base))
+            self.assertEqual(ccdb_dump.CCDB_Dump.full_dump_of(base), base)
+            self.assertIsNone(ccdb_dump.CCDB_Dump.full_dump_of(os.path.join(tmpdirpath, "no-such.ccdb.zip")))
+
+            # The delta dump is layered on the base
+            os.mkdir(os.path.join(tmpdirpath, "copy"))
+            for fname in (delta, ccdb_dump.CCDB_Dump.load(delta).save("copy", os.path.join(tmpdirpath, "copy"))):
+                delta_obj = ccdb_dump.CCDB_Dump.load(fname)
+                full_obj  = ccdb_dump.CCDB_Dump.load(full)
+                self.assertEqual(json.loads(delta_obj.to_json())["devices"], json.loads(full_obj.to_json())["devices"])
+                for i in range(2):
+                    dArtifact = delta_obj.device("device{}".format(i)).downloadArtifact("txt")
+                    with dArtifact.open() as f:
+                        self.assertEqual(f.read(), "{}\n".format(2 if i == 1 else i))
+
+            # The extracted delta dump is layered on the base too
+            self._unzip(delta, os.path.join(tmpdirpath, "deltadir"))
+            delta_obj = ccdb_dump.CCDB_Dump.load(os.path.join(tmpdirpath, "deltadir"))
+            for i in range(2):
+                dArtifact = delta_obj.device("device{}".format(i)).downloadArtifact("txt")
+                self.assertTrue(os.path.isfile(dArtifact.saved_as()))
+                with open(dArtifact.saved_as()) as f:
+                    self.assertEqual(f.read(), "{}\n".format(2 if i == 1 else i))
+                with dArtifact.open() as f:
+                    self.assertEqual(f.read(), "{}\n".format(2 if i == 1 else i))
+
+
+    def testDiff(self):
+        with mkdtemp(prefix = "testDiff") as tmpdirpath:
+            def factory(new):
+                artifact = os.path.join(tmpdirpath, "artifact.txt")
+                with open(artifact, "w") as f:
+                    print("new" if new else "old", file = f)
+
+                factory = CCDB_Factory()
+                root = factory.addDevice("root", "root")
+                plc1 = root.addDevice("plc", "plc1")
+                plc2 = root.addDevice("plc", "plc2")
+                plc1.addDevice("type", "device1").setProperty("P", "changed" if new else "original")
+                plc1.addDevice("type", "device2")
+                plc2.addDevice("type", "device3").addArtifact("artifact.txt", artifact)
+                plc2.addDevice("type", "device4" if new else "device5")
+                return factory.save("new" if new else "old", tmpdirpath)
+
+            old = factory(False)
+            new = factory(True)
+
+            changes = os.path.join(tmpdirpath, "changes.json")
+            ccdb_dump.main([ "diff", "--output", changes, old, new ])
+            with open(changes) as f:
+                changeset = json.load(f)
+
+            self.assertEqual(changeset["added"], [ "device4" ])
+            self.assertEqual(changeset["removed"], [ "device5" ])
+            self.assertEqual(changeset["changed"]["device1"], { "properties": { "changed": { "P": [ "original", "changed" ] } } })
+            self.assertEqual(changeset["changed"]["plc2"], { "controls": { "added": [ "device4" ], "removed": [ "device5" ] } })
+            self.assertEqual(sorted(changeset["changed"].keys()), [ "device1", "plc2" ])
+            self.assertEqual(changeset["unchanged"], 4)
+            self.assertEqual(list(changeset["artifacts"].keys()), [ "changed" ])
+            self.assertEqual(changeset["affected"], [ "device1", "device3", "device4", "plc1", "plc2", "root" ])
+
+            # Nothing changed
+            changeset = ccdb_dump.diff_dumps(ccdb_dump.CCDB_Dump.load(new), ccdb_dump.CCDB_Dump.load(new))
+            self.assertEqual((changeset["changed"], changeset["artifacts"], changeset["affected"]), (dict(), dict(), []))
+
+
+    def testDiffLegacy(self):
+        # Dumps without artifacts.json have every artifact saved as itself
+        with mkdtemp(prefix = "testDiffLegacy") as tmpdirpath:
+            def legacy(new):
+                definition = os.path.join(tmpdirpath, "device.def")
+                with open(definition, "w") as f:
+                    print("define_status_block()", file = f)
+                    if new:
+                        print("add_digital(\"Changed\")", file = f)
+
+                factory = CCDB_Factory()
+                root = factory.addDevice("root", "root")
+                root.addDevice("plc", "plc1").addDevice("type", "device1").addArtifact("device.def", definition)
+                root.addDevice("plc", "plc2").addDevice("type", "device2")
+                dumpfile = factory.save("full", tmpdirpath)
+
+                legacyfile = os.path.join(tmpdirpath, "{}.ccdb.zip".format("new" if new else "old"))
+                with zipfile.ZipFile(dumpfile) as src:
+                    with zipfile.ZipFile(legacyfile, mode = "w") as dst:
+                        for info in src.infolist():
+                            if info.filename != "ccdb/" + ccdb_dump.CC.ARTIFACT_JSON:
+                                dst.writestr(info, src.read(info))
+                os.unlink(dumpfile)
+
+                return legacyfile
+
+            old = legacy(False)
+            new = legacy(True)
+            newdir = os.path.join(tmpdirpath, "newdir")
+            self._unzip(new, newdir)
+
+            for new_dump in (new, newdir):
+                changeset = ccdb_dump.diff_dumps(ccdb_dump.CCDB_Dump.load(old), ccdb_dump.CCDB_Dump.load(new_dump))
+                self.assertEqual(changeset["changed"], dict())
+                self.assertEqual(list(changeset["artifacts"].keys()), [ "changed" ])
+                self.assertEqual(list(changeset["artifacts"]["changed"].keys()), [ os.path.join(ccdb_dump.CC.TEMPLATE_DIR, "device1", "device.def") ])
+                self.assertEqual(changeset["affected"], [ "device1", "plc1", "root" ])
+
+            # Nothing changed
+            changeset = ccdb_dump.diff_dumps(ccdb_dump.CCDB_Dump.load(new), ccdb_dump.CCDB_Dump.load(newdir))
+            self.assertEqual((changeset["changed"], changeset["artifacts"], changeset["affected"]), (dict(), dict(), []))
+
+
+    def testSerializedFragments(self):
+        import ast
+        import yaml
+
+        # Python 2 dicts do not keep the order of the document
+        class OrderedLoader(yaml.SafeLoader):
+            pass
+
+        def ordered_mapping(loader, node):
+            loader.flatten_mapping(node)
+            return OrderedDict(loader.construct_pairs(node))
+
+        OrderedLoader.add_constructor(yaml.resolver.BaseResolver.DEFAULT_MAPPING_TAG, ordered_mapping)
+
+        # CCDB_Factory.setProperty() converts the value with str(); that cannot encode non-ASCII characters on Python 2
+        accents = "" if str is bytes else u" \u00e1rv\u00edzt\u0171r\u0151 t\u00fck\u00f6rf\u00far\u00f3g\u00e9p"
+
+        with mkdtemp(prefix = "testSerializedFragments") as tmpdirpath:
+            factory = CCDB_Factory()
+            root = factory.addDevice("root", "root")
+            for i in range(3):
+                device = root.addDevice("type", "device{}".format(i))
+                device.setProperty("P", "value{}".format(i))
+                device.setProperty("Description", "A long description that does not fit into one line of YAML:{} {}".format(accents, i))
+
+            def read(dump, fname):
+                with zipfile.ZipFile(dump) as z:
+                    return z.read(os.path.join("ccdb", fname)).decode("utf-8")
+
+            def check(dump):
+                # The concatenated fragments are the same as the serialization of the whole model
+                device_json = read(dump, ccdb_dump.CC.DEVICE_JSON)
+                self.assertEqual(device_json, json.dumps(json.loads(device_json, object_pairs_hook = OrderedDict), indent = 4))
+
+                device_yaml = read(dump, ccdb_dump.CC.DEVICE_YAML)
+                self.assertEqual(device_yaml, yaml.dump(yaml.load(device_yaml, Loader = OrderedLoader), sort_keys = False, Dumper = ccdb_dump.CC._yaml_dumper()))
+
+                devices = json.loads(device_json)["devices"]
+                self.assertEqual(ast.literal_eval(read(dump, ccdb_dump.CC.DEVICE_DICT)), devices)
+                self.assertEqual(yaml.safe_load(device_yaml)["devices"], devices)
+
+                return devices
+
+            devices = check(factory.save("first", tmpdirpath))
+            self.assertEqual(sorted(devices.keys()), [ "device0", "device1", "device2", "root" ])
+
+            # Modified devices are serialized again
+            root.addDevice("type", "device3")
+            factory._devices["device1"].setProperty("P", "changed")
+            devices = check(factory.save("second", tmpdirpath))
+            self.assertIn("device3", devices["root"]["controls"])
+            self.assertIn({ "name": "P", "value": "changed", "dataType": "String" }, [ dict((k, p[k]) for k in ("name", "value", "dataType")) for p in devices["device1"]["properties"] ])
+            self.assertEqual(json.loads(read(factory.save("second", tmpdirpath), ccdb_dump.CC.DEVICE_RECORD.format(list(factory._devices.keys()).index("device1")))), devices["device1"])
+
+            # Subtrees
+            self.assertEqual(list(json.loads(factory.to_json(root = factory._devices["device1"]))["devices"].keys()), [ "device1" ])
+            self.assertEqual(list(yaml.safe_load(factory.to_yaml(root = factory._devices["device1"]))["devices"].keys()), [ "device1" ])
+
+            # Only the requested formats
+            dump = factory.save("records", tmpdirpath, formats = ("yaml", ), libyaml = True)
+            with zipfile.ZipFile(dump) as z:
+                names = z.namelist()
+            self.assertNotIn(os.path.join("ccdb", ccdb_dump.CC.DEVICE_DICT), names)
+            self.assertNotIn(os.path.join("ccdb", ccdb_dump.CC.DEVICE_JSON), names)
+            self.assertEqual(yaml.safe_load(read(dump, ccdb_dump.CC.DEVICE_YAML))["devices"], devices)
+            self.assertEqual(json.loads(ccdb_dump.CCDB_Dump.load(dump).to_json())["devices"], devices)
+
+
     def testEmptyDir(self):
         with mkdtemp(prefix = "testEmptyDir") as tmpdirpath:
             self._unzip(str(self.EMPTY_ZIP), tmpdirpath)
@@ -506,6 +834,7 @@ class TestCCDBDump(unittest.TestCase):
             self._unzip(str(self.MULTI_DEVICE_ZIP), tmpdirpath)
             cc_obj = ccdb_dump.CCDB_Dump.load(tmpdirpath)
             self._testMultiDevice(cc_obj)
+            self._testNativeStrings(cc_obj)
 
 
     def testArtifactDir(self):
@@ -523,6 +852,245 @@ class TestCCDBDump(unittest.TestCase):
 
 
 
+class TestCCDBFactory(unittest.TestCase):
+    def testPrefetchArtifacts(self):
+        with mkdtemp(prefix = "testPrefetchArtifacts") as tmpdirpath:
+            factory = CCDB_Factory()
+            for i in range(4):
+                artifact = os.path.join(tmpdirpath, "artifact{}.txt".format(i))
+                with open(artifact, "w") as af:
+                    print(i, file = af)
+                factory.addArtifact("type", os.path.basename(artifact), artifact)
+
+            device1 = factory.addDevice("type", "device1")
+            device2 = factory.addDevice("type", "device2")
+            device2.addArtifact("device.txt", artifact)
+            artifacts = device1.artifacts() + device2.artifacts()
+
+            # Per device type artifacts are downloaded only once
+            self.assertEqual(factory.prefetchArtifacts(artifacts), 5)
+            for a in artifacts:
+                self.assertTrue(os.path.exists(a.saveas()))
+
+            # Already downloaded artifacts are not downloaded again
+            self.assertEqual(factory.prefetchArtifacts(artifacts), 0)
+
+            dArtifact = device2.downloadArtifact("txt", custom_filter = lambda a: a.filename() == "device.txt")
+            self.assertTrue(filecmp.cmp(dArtifact.saved_as(), artifact, shallow = 0))
+
+            self.assertEqual(device1.findArtifact("txt", custom_filter = lambda a: a.filename() == "device.txt"), None)
+
+
+    def testBacktrack(self):
+        (factory, root) = fixtures.synthetic_tree(300, props = 4)
+        devices = root.buildControlsList(include_self = True)
+        for device in devices:
+            for prop in [ "P{}".format(i) for i in range(4) ] + [ "no-such-property" ]:
+                try:
+                    expected = fixtures.bfs_backtrack(device, prop)
+                except ccdb.CC.Exception:
+                    with self.assertRaises(ccdb.CC.Exception):
+                        device.backtrack(prop)
+                    continue
+
+                self.assertEqual(device.backtrack(prop), expected, (device.name(), prop))
+
+
+    def testControlsList(self):
+        dump = fixtures.synthetic_dump(fixtures.synthetic_slots(300, props = 1))
+        for name in dump.getAllDeviceNames()[:20]:
+            device = dump.device(name)
+            self.assertEqual(device.buildControlsList(), fixtures.set_controls_list(device))
+            self.assertEqual(device.buildControlsList(include_self = True), [ device ] + fixtures.set_controls_list(device))
+            # The memoized list is not handed out
+            del device.buildControlsList()[:]
+            self.assertEqual(device.buildControlsList(), fixtures.set_controls_list(device))
+
+
+    def testControlsListChanges(self):
+        factory = CCDB_Factory()
+        root = factory.addPLC("root")
+        dev2 = root.addDevice("type2", "dev2")
+        dev1 = root.addDevice("type1", "dev1")
+        self.assertEqual(root.buildControlsList(), [ dev1, dev2 ])
+
+        dev3 = dev2.addDevice("type1", "dev3")
+        self.assertEqual(root.buildControlsList(), [ dev1, dev3, dev2 ])
+        self.assertTrue(dev3.isInControlledTree())
+
+        # Loops include the root device
+        dev3.setControls(root)
+        self.assertEqual(root.buildControlsList(), [ root, dev1, dev3, dev2 ])
+
+
+    def testDeviceViews(self):
+        factory = CCDB_Factory()
+        root = factory.addPLC("root")
+        dev1 = root.addDevice("type", "dev1")
+        self.assertFalse(hasattr(root, "__dict__"))
+
+        # Converted views are kept
+        self.assertIs(root.controls(), root.controls())
+        self.assertIs(root.properties(), root.properties())
+        self.assertIs(dev1.controlledBy(), dev1.controlledBy())
+        self.assertEqual(root.controls(), [ dev1 ])
+
+        # Modifications are reflected
+        dev2 = root.addDevice("type", "dev2")
+        self.assertEqual(root.controls(), [ dev1, dev2 ])
+        root.setProperty("PLCF#prop", "value")
+        self.assertEqual(root.properties()["PLCF#prop"], "value")
+        self.assertEqual(root.propertiesDict()["prop"], "value")
+
+        # Property dictionary without prefixed properties is not copied
+        dev1.setProperty("prop", "value")
+        self.assertIs(dev1.propertiesDict(), dev1.properties())
+
+
+    def testBacktrackLoop(self):
+        factory = CCDB_Factory()
+        root = factory.addPLC("root")
+        dev1 = root.addDevice("type", "dev1")
+        dev2 = dev1.addDevice("type", "dev2")
+        dev2.setControls(dev1)
+        dev2.setProperty("prop", "dev2")
+        root.setProperty("rootprop", "root")
+        root.buildControlsList()
+
+        self.assertEqual(dev1.backtrack("prop"), "dev2")
+        self.assertEqual(dev2.backtrack("rootprop"), "root")
+        with self.assertRaises(ccdb.CC.Exception):
+            dev2.backtrack("no-such-property")
+
+
+
+class FakeCCDB(ccdb.CCDB):
+    """
+    A CCDB that serves the slots of a CCDB_Factory and records the requested slots
+    """
+    class NotFound(object):
+        status_code = 404
+
+
+    def __init__(self, factory):
+        super(FakeCCDB, self).__init__(http_cache = False)
+        self._slots    = dict((name, device._slot) for (name, device) in factory._devices.items())
+        self.requested = []
+
+
+    def _get(self, url):
+        return FakeCCDB.NotFound()
+
+
+    def _get_slot(self, deviceName):
+        self.requested.append(deviceName)
+        try:
+            return self._slots[deviceName]
+        except KeyError:
+            raise ccdb.CC.NoSuchDeviceException(deviceName)
+
+
+
+class TestLazyCCDB(unittest.TestCase):
+    def setUp(self):
+        factory = CCDB_Factory()
+        root = factory.addDevice("root", "root")
+        root.addDevice("foo", "foo1_level1").addDevice("bar", "bar1_level2")
+        root.addDevice("bar", "bar1_level1")
+        root.addDevice("foo", "foo2_level1")
+        self.ccdb = FakeCCDB(factory)
+
+
+    def testPlaceholders(self):
+        root = self.ccdb.device("root")
+        self.assertEqual(self.ccdb.requested, ["root"])
+
+        controls = root.controls()
+        self.assertEqual(sorted(map(lambda d: d.name(), controls)), ["bar1_level1", "foo1_level1", "foo2_level1"])
+        # Names are known without downloading
+        self.assertEqual(self.ccdb.requested, ["root"])
+
+        # The first access downloads every pending device
+        self.assertEqual(controls[0].deviceType(), "foo")
+        self.assertEqual(sorted(self.ccdb.requested), ["bar1_level1", "foo1_level1", "foo2_level1", "root"])
+
+        self.assertEqual(list(map(lambda d: d.name(), root.buildControlsList())), ["bar1_level1", "bar1_level2", "foo1_level1", "foo2_level1"])
+        self.assertEqual(len(self.ccdb.requested), 5)
+
+        # Controlled-by relations are resolved from the already known devices
+        self.assertEqual(self.ccdb.device("bar1_level2").controlledBy(True)[0].name(), "foo1_level1")
+        self.assertEqual(len(self.ccdb.requested), 5)
+
+
+    def testNoSuchDevice(self):
+        with self.assertRaises(ccdb.CC.NoSuchDeviceException):
+            self.ccdb.device("no_such_device")
+
+        device = self.ccdb.device("root")
+        device._slot["controls"].append("no_such_device")
+        controls = device.controls()
+        with self.assertRaises(ccdb.CC.NoSuchDeviceException):
+            list(map(lambda d: d.deviceType(), controls))
+
+
+
+class CCDBServerTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.MULTI_DEVICE_ZIP = MultiDeviceDB()
+        cls.ARTIFACT_ZIP     = ArtifactDB()
+
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.MULTI_DEVICE_ZIP.clear()
+        cls.ARTIFACT_ZIP.clear()
+
+
+    def _testMultiDevice(self, ccdb_class):
+        with CCDBServer(str(self.MULTI_DEVICE_ZIP)) as server:
+            cc_obj = ccdb_class(server.url(), http_cache = False)
+            self.assertEqual(sorted(cc_obj.getAllDeviceNames()), sorted(["root"] + MultiDeviceDB.controls_list))
+
+            root = cc_obj.device("root")
+            # The whole controls tree is downloaded with one request
+            requests = server.requests
+            self.assertEqual(list(map(lambda d: d.name(), root.buildControlsList())), MultiDeviceDB.controls_list)
+            self.assertEqual(server.requests, requests)
+
+            with self.assertRaises(ccdb.CC.DownloadException):
+                cc_obj.device("no_such_device")
+
+            return cc_obj
+
+
+    def _testArtifact(self, ccdb_class):
+        with CCDBServer(str(self.ARTIFACT_ZIP)) as server:
+            cc_obj = ccdb_class(server.url(), http_cache = False)
+            device = cc_obj.device("device")
+            artifacts = device.artifacts()
+            self.assertEqual(cc_obj.prefetchArtifacts(artifacts), len(self.ARTIFACT_ZIP.artifacts))
+
+            dArtifact = device.downloadArtifact(ArtifactDB.pyext)
+            self.assertTrue(filecmp.cmp(dArtifact.saved_as(), self.ARTIFACT_ZIP.artifact_py, shallow = 0))
+
+            dArtifact = device.downloadArtifact(ArtifactDB.txtext, device_tag = ArtifactDB.tag)
+            self.assertTrue(filecmp.cmp(dArtifact.saved_as(), self.ARTIFACT_ZIP.test_artifact_txt, shallow = 0))
+
+            return cc_obj
+
+
+
+class TestCCDBServer(CCDBServerTestCase):
+    def testMultiDevice(self):
+        self._testMultiDevice(ccdb.CCDB)
+
+
+    def testArtifact(self):
+        self._testArtifact(ccdb.CCDB)
+
+
+
 class TestCCDB(unittest.TestCase):
     def setUp(self):
         self.ccdb = ccdb.CCDB.open()
@@ -0,0 +1,121 @@
+from __future__ import absolute_import
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import ccdb
+from ccdb_factory import CCDB_Factory
+from ccdb_mirror import CCDBMirror, MirroredCCDB
+from ccdb_server import CCDBServer
+
+
+
+class TestCCDBMirror(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix = "test_ccdb_mirror")
+        self.mirror = os.path.join(self.tmpdir, "mirror")
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+
+    def _dump(self, name, value):
+        artifact = os.path.join(self.tmpdir, "artifact.txt")
+        with open(artifact, "w") as f:
+            print(value, file = f)
+
+        factory = CCDB_Factory()
+        root = factory.addDevice("root", "root")
+        plc  = root.addDevice("plc", "plc")
+        for i in range(3):
+            device = plc.addDevice("type", "device{}".format(i))
+            device.setProperty("P", value if i == 0 else "original")
+        factory._devices["device1"].addArtifact("artifact.txt", artifact)
+        factory.addDevice("other", "other")
+
+        return factory.save(name, self.tmpdir)
+
+
+    def _sync(self, server, deviceName = None):
+        return CCDBMirror(self.mirror, server.url()).sync(ccdb.CCDB(server.url(), http_cache = False), deviceName)
+
+
+    def testSync(self):
+        with CCDBServer(self._dump("v1", "original")) as server:
+            self.assertEqual(self._sync(server, "root"), (5, 1, 0))
+            # Nothing changed
+            self.assertEqual(self._sync(server, "root"), (0, 0, 0))
+
+            mirror = CCDBMirror(self.mirror, server.url())
+            self.assertEqual(mirror.slot("device0")["name"], "device0")
+            # plcfactory cannot handle Python2 unicode strings
+            self.assertIsInstance(mirror.slot("device0")["name"], str)
+            self.assertIsNone(mirror.slot("other"))
+            self.assertIsNone(mirror.names())
+
+            with self.assertRaises(ccdb.CC.Exception):
+                CCDBMirror(self.mirror, "https://ccdb.example.com")
+
+            # Every device
+            self.assertEqual(self._sync(server), (1, 0, 0))
+            self.assertEqual(sorted(CCDBMirror(self.mirror).names()), [ "device0", "device1", "device2", "other", "plc", "root" ])
+
+        with CCDBServer(self._dump("v2", "changed")) as server:
+            # The new server has a different URL
+            os.unlink(os.path.join(self.mirror, CCDBMirror.INDEX))
+            self._sync(server)
+            self.assertEqual(self._sync(server), (0, 0, 0))
+
+        with CCDBServer(self._dump("v3", "changed again")) as server:
+            mirror = CCDBMirror(self.mirror)
+            mirror._index["url"] = server.url()
+            mirror._save_index()
+            self.assertEqual(self._sync(server), (1, 1, 0))
+
+            # Only the referenced blobs are kept
+            mirror = CCDBMirror(self.mirror)
+            self.assertEqual(len(list(mirror._blobs.digests())), 6 + 1)
+
+
+    def testMirroredCCDB(self):
+        with CCDBServer(self._dump("v1", "original")) as server:
+            self._sync(server, "root")
+
+            cc_obj   = MirroredCCDB(server.url(), mirror = self.mirror, http_cache = False)
+            requests = server.requests
+            root = cc_obj.device("root")
+            self.assertEqual([ d.name() for d in root.buildControlsList() ], [ "plc", "device0", "device1", "device2" ])
+            self.assertEqual(cc_obj.device("device0").properties()["P"], "original")
+
+            artifact = cc_obj.device("device1").downloadArtifact("txt")
+            with artifact.open() as f:
+                self.assertEqual(f.read(), "original\n")
+            self.assertEqual(server.requests, requests)
+
+            # Not in the mirror
+            self.assertEqual(cc_obj.device("other").deviceType(), "other")
+            self.assertEqual(server.requests, requests + 1)
+            self.assertEqual((cc_obj.mirror().hits, cc_obj.mirror().misses), (6, 1))
+
+            cc_obj.getAllDeviceNames()
+            self.assertEqual(server.requests, requests + 2)
+
+
+    def testTool(self):
+        with CCDBServer(self._dump("v1", "original")) as server:
+            ccdb.main([ "--ccdb", server.url(), "--no-http-cache", "--no-artifact-store", "mirror", "--mirror", self.mirror ])
+
+            cc_obj = ccdb.CC.open(server.url(), ccdb_mirror = self.mirror, http_cache = False)
+            self.assertIsInstance(cc_obj, MirroredCCDB)
+            requests = server.requests
+            self.assertEqual(sorted(cc_obj.getAllDeviceNames()), [ "device0", "device1", "device2", "other", "plc", "root" ])
+            self.assertEqual(server.requests, requests)
+
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+from __future__ import absolute_import
+from __future__ import print_function
+
+import json
+import os
+import tempfile
+import unittest
+
+import requests
+
+from ccdb_transport import TransportPolicy
+
+
+
+class FakeSession(object):
+    """
+    Returns (or raises) the elements of 'results' one after the other
+    """
+    def __init__(self, results):
+        self.results = list(results)
+        self.kwargs  = []
+
+
+    def get(self, url, **kwargs):
+        self.kwargs.append(kwargs)
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+
+        r = requests.models.Response()
+        r.status_code = result
+        return r
+
+
+
+class TestTransportPolicy(unittest.TestCase):
+    url = "https://ccdb.test/rest/slots/foo"
+
+    def setUp(self):
+        self.policy = TransportPolicy(retries = 2, backoff = 1)
+        self.delays = []
+        self.policy._sleep = self.delays.append
+
+
+    def testTimeout(self):
+        session = FakeSession([ 200 ])
+        self.policy.get(session, self.url)
+        self.assertEqual(session.kwargs[0]["timeout"], TransportPolicy.TIMEOUT)
+
+        session = FakeSession([ 200 ])
+        self.policy.get(session, self.url, timeout = 1)
+        self.assertEqual(session.kwargs[0]["timeout"], 1)
+
+
+    def testRetry(self):
+        session = FakeSession([ 502, requests.exceptions.ConnectionError(), 200 ])
+        self.assertEqual(self.policy.get(session, self.url).status_code, 200)
+        self.assertEqual(len(self.delays), 2)
+        # Full jitter
+        self.assertTrue(0 <= self.delays[0] <= 1)
+        self.assertTrue(0 <= self.delays[1] <= 2)
+
+
+    def testNoRetry(self):
+        for status in (200, 401, 404):
+            session = FakeSession([ status ])
+            self.assertEqual(self.policy.get(session, self.url).status_code, status)
+        self.assertEqual(self.delays, [])
+
+
+    def testGiveUp(self):
+        session = FakeSession([ 503, 503, 503 ])
+        self.assertEqual(self.policy.get(session, self.url).status_code, 503)
+
+        session = FakeSession([ requests.exceptions.Timeout() ] * 3)
+        with self.assertRaises(requests.exceptions.Timeout):
+            self.policy.get(session, self.url)
+
+
+    def testEndpoint(self):
+        for (url, endpoint) in [ (self.url, "https://ccdb.test/rest/slots/*"),
+                                 ("https://ccdb.test/rest/slots/Sys-Sub:Dev-01/controls/?transitive=True", "https://ccdb.test/rest/slots/*/controls/"),
+                                 ("https://ccdb.test/rest/slots/foo/download/foo.def", "https://ccdb.test/rest/slots/*/download/*"),
+                                 ("https://ccdb.test/rest/deviceTypes/TYPE/download/a/b.txt", "https://ccdb.test/rest/deviceTypes/*/download/*"),
+                                 ("https://ccdb.test/rest/slotNames", "https://ccdb.test/rest/slotNames"),
+                                 ("https://user@gitlab.test/group/project/raw/v1.0/foo.def", "https://gitlab.test/*") ]:
+            self.assertEqual(TransportPolicy.endpoint(url), endpoint)
+
+
+    def testLatencies(self):
+        self.policy.latency_log = os.devnull
+        self.policy.record(self.url, 0.02)
+        self.policy.record(self.url.replace("foo", "baz"), 100)
+        self.policy.record(self.url + "/download/bar.txt", 0.001)
+
+        (fd, fname) = tempfile.mkstemp(suffix = ".json")
+        os.close(fd)
+        try:
+            self.policy.save_latencies(fname)
+            with open(fname) as f:
+                latencies = json.load(f)
+        finally:
+            os.unlink(fname)
+
+        self.assertEqual(latencies["buckets"], list(TransportPolicy.BUCKETS))
+        (foo, bar) = latencies["urls"]
+        self.assertEqual(foo["url"], "https://ccdb.test/rest/slots/*")
+        self.assertEqual(foo["count"], 2)
+        self.assertEqual(foo["max"], 100)
+        self.assertEqual(foo["histogram"], { "<=0.025": 1, ">60": 1 })
+        self.assertEqual(bar["histogram"], { "<=0.01": 1 })
+        self.assertEqual(bar["url"], "https://ccdb.test/rest/slots/*/download/*")
+
+
+    def testNoLatencyLog(self):
+        # Latencies are collected only if they are saved
+        self.policy.get(FakeSession([ 200 ]), self.url)
+        self.assertEqual(self.policy.latencies(), [])
+
+        self.policy.latency_log = os.devnull
+        self.policy.get(FakeSession([ 502, 200 ]), self.url)
+        (lat, ) = self.policy.latencies()
+        self.assertEqual(lat["count"], 2)
+
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import io
+import json
+import unittest
+
+from json_stream import JSONStream
+
+
+
+class TestJSONStream(unittest.TestCase):
+    DOCUMENT = { "url"     : "https://ccdb.esss.lu.se",
+                 "version" : "1.0",
+                 "devices" : { "dev1": { "name": "dev1", "properties": [ { "name": "p", "value": "[1, 2]" } ], "number": 12345 },
+                               "dev2": { "name": "dev2", "controls": [ "dev1" ], "description": "\\u00e1rv\\u00edzt\\u0171r\\u0151 }{" },
+                               "dev3": None },
+                 "other"   : [ 1, 2.5, True ] }
+
+    def _items(self, text, key = "devices", chunk_size = JSONStream.CHUNK_SIZE):
+        # JSONStream reads text; json.dumps() returns bytes on Python 2
+        if isinstance(text, bytes):
+            text = text.decode("utf-8")
+        return list(JSONStream(io.StringIO(text), chunk_size).items(key))
+
+
+    def testItems(self):
+        expected = list(self.DOCUMENT["devices"].items())
+        for indent in (None, 4):
+            text = json.dumps(self.DOCUMENT, indent = indent)
+            # Every value has to be decoded across chunk boundaries
+            for chunk_size in (1, 2, 3, 7, 64, JSONStream.CHUNK_SIZE):
+                self.assertEqual(self._items(text, chunk_size = chunk_size), expected, (indent, chunk_size))
+
+
+    def testNumberAtChunkBoundary(self):
+        self.assertEqual(self._items('{"devices": {"a": 12345}}', chunk_size = 20), [ ("a", 12345) ])
+
+
+    def testEmpty(self):
+        self.assertEqual(self._items('{"devices": {}}'), [])
+        self.assertEqual(self._items('{"devices": { } }', chunk_size = 1), [])
+
+
+    def testErrors(self):
+        with self.assertRaises(KeyError):
+            self._items('{}')
+
+        with self.assertRaises(KeyError):
+            self._items('{"url": "foo"}')
+
+        with self.assertRaises(ValueError):
+            self._items('{"devices": {"a": 1')
+
+        with self.assertRaises(ValueError):
+            self._items('{"devices": {"a": 1 "b": 2}}')
+
+        with self.assertRaises(ValueError):
+            self._items('')
+
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+from __future__ import absolute_import
+from __future__ import print_function
+
+import random
+import unittest
+
+import levenshtein
+
+
+
+class TestLevenshtein(unittest.TestCase):
+    @staticmethod
+    def _random_pairs(alphabet, max_len, count):
+        rnd = random.Random(0)
+        for _ in range(count):
+            yield ("".join(rnd.choice(alphabet) for _ in range(rnd.randint(0, max_len))),
+                   "".join(rnd.choice(alphabet) for _ in range(rnd.randint(0, max_len))))
+
+
+    def testKnown(self):
+        self.assertEqual(levenshtein.distance("", ""), 0)
+        self.assertEqual(levenshtein.distance("", "abc"), 3)
+        self.assertEqual(levenshtein.distance("abc", ""), 3)
+        self.assertEqual(levenshtein.distance("kitten", "sitting"), 3)
+        self.assertEqual(levenshtein.distance("LEBT-010:Vac-VGP-001", "LEBT-010:Vac-VGP-001"), 0)
+        self.assertEqual(levenshtein.distance("LEBT-010:Vac-VGP-001", "LEBT-01:Vac-VPG-001"), 3)
+
+
+    def testAgainstDP(self):
+        for (s, t) in self._random_pairs("ab:-", 12, 5000):
+            self.assertEqual(levenshtein.distance(s, t), levenshtein._distance_dp(s, t), (s, t))
+
+
+    def testLongStrings(self):
+        # Longer than a machine word
+        for (s, t) in self._random_pairs("abcdefgh", 150, 20):
+            self.assertEqual(levenshtein.distance(s, t), levenshtein._distance_dp(s, t), (s, t))
+
+
+    def testMaxDistance(self):
+        for (s, t) in self._random_pairs("abc", 10, 3000):
+            d = levenshtein._distance_dp(s, t)
+            for max_distance in range(0, 6):
+                self.assertEqual(levenshtein.distance(s, t, max_distance), min(d, max_distance + 1), (s, t, max_distance))
+
+
+    def testDistances(self):
+        candidates = [ "LEBT-010:Vac-VGP-001", "LEBT-010:Vac-VGC-001", "MEBT-010:Vac-VGP-001", "", "LEBT" ]
+        query      = "LEBT-010:Vac-VGP-01"
+
+        self.assertEqual(levenshtein.distances(query, candidates), [ levenshtein._distance_dp(query, c) for c in candidates ])
+        self.assertEqual(levenshtein.distances(query, candidates, 2), [ min(levenshtein._distance_dp(query, c), 3) for c in candidates ])
+        self.assertEqual(levenshtein.distances(query, []), [])
+
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+from __future__ import absolute_import
+from __future__ import print_function
+
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+import fixtures
+from name_index import NameIndex
+
+
+
+class TestNameIndex(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.names = fixtures.synthetic_names(500)
+        cls.index = NameIndex(cls.names)
+
+
+    def _compare(self, index, queries):
+        for q in queries:
+            for X in (1, 10):
+                self.assertEqual(index.similar(q, X), fixtures.linear_similar(self.names, q, X), q)
+
+
+    def testSimilar(self):
+        rnd = random.Random(0)
+        queries = [ fixtures.mistype(rnd.choice(self.names), rnd) for _ in range(10) ]
+        # Mistyped System-Subsystem
+        queries += [ "LEBZ-010:Vac-VGP-001", "", ":", "lebt-010:vac-vgp-001", self.names[0] ]
+
+        self._compare(self.index, queries)
+
+        # Without the bag distance bound
+        scan_limit = NameIndex.SCAN_LIMIT
+        try:
+            NameIndex.SCAN_LIMIT = len(self.names)
+            self._compare(self.index, queries)
+        finally:
+            NameIndex.SCAN_LIMIT = scan_limit
+
+
+    def testEmpty(self):
+        self.assertEqual(NameIndex([]).similar("foo"), (False, []))
+        self.assertEqual(NameIndex(["foo"]).similar(""), (False, ["foo"]))
+
+
+    def testLoad(self):
+        fake_home = tempfile.mkdtemp()
+        home = os.environ.get("HOME")
+        os.environ["HOME"] = fake_home
+        try:
+            index = NameIndex.load("https://ccdb.test", lambda: self.names)
+            self.assertEqual(len(index), len(self.names))
+
+            # Loaded from the cache
+            index = NameIndex.load("https://ccdb.test", lambda: [])
+            self.assertEqual(len(index), len(self.names))
+
+            # Expired
+            index = NameIndex.load("https://ccdb.test", lambda: [], ttl = -1)
+            self.assertEqual(len(index), 0)
+        finally:
+            if home is None:
+                del os.environ["HOME"]
+            else:
+                os.environ["HOME"] = home
+            shutil.rmtree(fake_home)
+
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -15,6 +15,10 @@ class FakeDevice(object):
         return "FakeDeviceType"
 
 
+    def url(self):
+        return "FakeURL"
+
+
     def propertiesDict(self):
         return { "infinity"  : "infinity",
                  "lonG"      : "lonG", "lonGer": "lonGer", "lengthy": "lonG",
@@ -46,6 +50,12 @@ class ReservedPropertiesDevice(FakeDevice):
 
 
 
+class SimpleDevice(FakeDevice):
+    def propertiesDict(self):
+        return { "offset" : "10", "size" : "offset + 2", "endianness" : "BigEndian" }
+
+
+
 class TestPLCF(unittest.TestCase):
     def setUp(self):
         plcf_glob.root_installation_slot = "root_slot"
@@ -281,6 +291,23 @@ class TestPLCF(unittest.TestCase):
         self.assertEqual(res, [expected])
 
 
+    def testIterCounters(self):
+        lines    = [ "#COUNTER Counter1 = [PLCF#Counter1 + 10];", "[PLCF#Counter1] Counter1 [PLCF#'Counter1']", "[PLCF#x [PLCF#Counter1 * 2]]" ]
+        counters = plcf.PLCF.initializeCounters()
+        output   = plcf.PLCF.iterCounters(lines, counters)
+
+        # The lines are evaluated one by one
+        self.assertEqual(next(output), "#COUNTER Counter1 = 10;")
+        self.assertEqual(counters["Counter1"], 10)
+        self.assertEqual(list(output), [ "10 10 10", "x 20" ])
+        self.assertEqual(plcf.PLCF.evalCounters(lines), ([ "#COUNTER Counter1 = 10;", "10 10 10", "x 20" ], counters))
+
+        self.assertEqual(plcf.PLCF.findMatchingParenthesis("[a[b]c]d]", "[]"), 6)
+        with self.assertRaises(plcf.PLCFSyntaxError):
+            plcf.PLCF.findMatchingParenthesis("[a[b]c", "[]")
+        self.assertFalse(plcf.PLCF.matchingParentheses("(a))("))
+
+
     def testBacktrackInPLCF(self):
         expr = "^(EPICSToPLCDataBlockStartOffset)"
         line = "[PLCF#{}]".format(expr)
@@ -436,6 +463,74 @@ class TestPLCF(unittest.TestCase):
 
 
 
+    def testCachedExpressions(self):
+        expressions = [ "short + 1", "shorter + 1", "lengthy lonGer", "A", "template short", "short template", "forty-two * 2",
+                        "^(EPICSToPLCDataBlockStartOffset) + Counter1", "'BE' if '^(EPICSToPLCDataBlockStartOffset)' == '42' else 'LE'",
+                        "INSTALLATION_SLOT", "ext.strip(' lonG ')", "TEMPLATE" ]
+        self.cplcf.register_template("foo")
+        for expression in expressions:
+            # The same result as the textual substitution
+            self.assertEqual(self.cplcf._evaluateExpression(expression), self.cplcf._substituteAndEvaluate(expression), expression)
+
+        # Parsed only once
+        simple = plcf.PLCF(SimpleDevice())
+        self.assertEqual(simple._expand("size * ^(EPICSToPLCDataBlockStartOffset)"), "10 + 2 * 42")
+        self.assertEqual(simple._evaluateExpression("(size + 1) * 2"), "26")
+        self.assertEqual(simple._evaluateExpression("'BE' if 'endianness' == 'BigEndian' else 'LE'"), "BE")
+        self.assertIn("(size + 1) * 2", plcf.PLCF._segments)
+        self.assertIn("offset + 2", plcf.PLCF._segments)
+        self.assertEqual(plcf.PLCF._compile("^(a) + b"), [ (plcf.PLCF.BACKTRACK, "a"), (plcf.PLCF.LITERAL, " + "), (plcf.PLCF.WORD, "b") ])
+        self.assertIs(plcf.PLCF._compile("^(a) + b"), plcf.PLCF._compile("^(a) + b"))
+        self.assertIsNone(plcf.PLCF._compile("^(a)^(b)"))
+
+        # Self referencing and multi word properties are substituted textually
+        self.assertIsNone(self.cplcf._expand("short"))
+        self.assertIsNone(self.cplcf._expand("template shorter"))
+        self.assertIsNone(self.cplcf._expand("forty-two"))
+        self.assertEqual(simple._expand("size + Counter1"), "10 + 2 + Counter1")
+        self.assertEqual(self.process("[PLCF#short template]"), "short beast-template")
+
+
+    def testCompiledTemplate(self):
+        lines    = [ "no expression\n", "offset = [PLCF#offset], size = [PLCF#size]\n", "[PLCF#size + Counter1]\n", "[PLCF#endianness]" ]
+        compiled = plcf.PLCF.compileLines(lines)
+        self.assertEqual(compiled[0], lines[0])
+        self.assertEqual(compiled[1], ((("offset = ", "offset"), (", size = ", "size")), "\n", None))
+
+        # The same result as processing the lines; for every device
+        simple = plcf.PLCF(SimpleDevice())
+        self.assertEqual(simple.processCompiled(compiled), simple.process(lines))
+        self.assertEqual(simple.processCompiled(compiled), [ lines[0], "offset = 10, size = 12\n", "[PLCF#10 + 2 + Counter1]\n", "BigEndian" ])
+        self.assertEqual(self.cplcf.processCompiled(compiled), self.cplcf.process(lines))
+
+        # Syntax errors are raised when processed, after the preceding expressions are evaluated
+        compiled = plcf.PLCF.compileLines([ "[PLCF#offset] [PLCF#(offset]" ])
+        with self.assertRaises(plcf.PLCFSyntaxError):
+            simple.processCompiled(compiled)
+        with self.assertRaises(plcf.PLCFEvalException):
+            simple.processCompiled(plcf.PLCF.compileLines([ "[PLCF#ext.no_such_function()] [PLCF#(offset]" ]))
+
+
+    def testPropertyMatcher(self):
+        matcher = plcf.PropertyMatcher([ "PLC-EPICS-COMMS: MBPort", "EPICS", "MBPort", "Port", "rt" ])
+        self.assertEqual(sorted(matcher.matches("PLC-EPICS-COMMS: MBPort + Port")),
+                         [ (0, 0), (4, 1), (17, 2), (19, 3), (21, 4), (26, 3), (28, 4) ])
+        self.assertEqual(list(matcher.matches("PLC-EPICS-COMMS: MBPor")), [ (4, 1) ])
+        self.assertTrue(matcher.occurs_in("MBPort"))
+        self.assertFalse(matcher.occurs_in("MBPor"))
+
+        # The longest property that is a word
+        self.assertEqual(self.cplcf._next_property("forty-two + lonGer"), "forty-two")
+        self.assertEqual(self.cplcf._next_property("xforty-two + lonGer"), "lonGer")
+        self.assertEqual(self.cplcf._next_property("lonGerx + lonG"), "lonG")
+        self.assertIsNone(self.cplcf._next_property("lonGerx"))
+        with self.assertRaises(plcf.PLCFException):
+            self.cplcf._next_property("TEMPLATEx + lonG")
+        self.cplcf.register_template("foo")
+        self.assertEqual(self.cplcf._next_property("TEMPLATEx + lonG"), "lonG")
+
+
+
 
 if __name__ == "__main__":
     unittest.main()
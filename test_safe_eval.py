@@ -0,0 +1,96 @@
+from __future__ import absolute_import
+from __future__ import print_function
+
+import unittest
+
+import plcf_ext
+from safe_eval import SafeEvaluator, UnsupportedExpression
+
+
+
+class TestSafeEvaluator(unittest.TestCase):
+    def testCompile(self):
+        evaluator = SafeEvaluator({ "ext": plcf_ext })
+        for expression in [ "1 + 2 * 3", "(42 + 1) * 2 + 4", "7 // 2", "2 ** 10 % 1000", "-5 < 0 <= 1", "'a' + 'b' * 2", "not 1 or 'x'",
+                            "1 and 0", "'BE' if 'BigEndian' == 'BigEndian' else 'LE'", "'a' in 'abc'", "None", "True",
+                            "[1, (2, 3)]", "{ 'a': 1 }", "{ 1, 2 }" ]:
+            self.assertEqual(evaluator.compile(expression)(None), eval(expression), expression)
+        self.assertEqual(evaluator.compile("ext.strip(' c ') + ext.dash_means_empty('-')")(None), "c")
+        self.assertEqual(evaluator.compile("ext.to_filename(' a ')")(None), plcf_ext.to_filename(' a '))
+
+        # Names are errors only if evaluated
+        self.assertEqual(evaluator.compile("1 if True else Counter1")(None), 1)
+        with self.assertRaises(NameError):
+            evaluator.compile("Counter1 + 1")(None)
+
+        with self.assertRaises(SyntaxError):
+            evaluator.compile("SYS-SUB:DEV")
+
+        for expression in [ "()[0]", "'{}'.format(1)", "[1, 2][0]", "ext._private()", "ext.strip(*'a')", "lambda: 0", "[ x for x in 'ab' ]" ]:
+            with self.assertRaises(UnsupportedExpression):
+                evaluator.compile(expression)
+
+        # Only the known names can be called
+        with self.assertRaises(UnsupportedExpression):
+            SafeEvaluator(dict()).compile("ext.strip(' ')")
+        with self.assertRaises(UnsupportedExpression):
+            evaluator.compile("int('3')")
+
+
+    def testNames(self):
+        calls     = []
+        def func(*args, **kwargs):
+            calls.append((args, kwargs))
+            return len(calls)
+
+        evaluator = SafeEvaluator()
+        compiled  = evaluator.compile("func(1, x, key = [ x ]) + x")
+        self.assertEqual(compiled({ "func": func, "x": 2 }), 3)
+        self.assertEqual(compiled({ "func": func, "x": 3 }), 5)
+        self.assertEqual(calls, [ ((1, 2), { "key": [ 2 ] }), ((1, 3), { "key": [ 3 ] }) ])
+
+        with self.assertRaises(NameError):
+            compiled({ "func": func })
+
+        # Containers are not shared between evaluations
+        compiled = evaluator.compile("[ x ]")
+        self.assertIsNot(compiled({ "x": 1 }), compiled({ "x": 1 }))
+
+
+    def testDivision(self):
+        self.assertEqual(SafeEvaluator(true_division = True).compile("7 / 2")(None), 3.5)
+        self.assertEqual(SafeEvaluator(true_division = True).evaluator("7 / 2 if x else 0")({ "x": 1 }), 3.5)
+        self.assertEqual(SafeEvaluator().compile("7 / 2")(None), eval("7 / 2", dict()))
+
+
+    def testEvaluator(self):
+        evaluator = SafeEvaluator({ "ext": plcf_ext })
+
+        # Compiled only once
+        constant = evaluator.evaluator("(42 + 1) * 2")
+        self.assertEqual(constant(None), 86)
+        self.assertIs(evaluator.evaluator("(42 + 1) * 2"), constant)
+
+        # Not an expression
+        self.assertIsNone(evaluator.evaluator("SYS-SUB:DEV"))
+        self.assertIsNone(evaluator.evaluator("Counter1 + 1"))
+
+        # Evaluated with eval()
+        self.assertEqual(evaluator.evaluator("'{}'.format(1)")(None), "1")
+        self.assertEqual(evaluator.evaluator("int('3') + 1")(None), 4)
+        with self.assertRaises(NameError):
+            evaluator.evaluator("[ x for x in foo ]")(None)
+
+        # Exceptions other than NameError are raised when evaluated
+        division = evaluator.evaluator("1 // 0")
+        for _ in range(2):
+            with self.assertRaises(ZeroDivisionError):
+                division(None)
+
+        # Mutable results are not shared
+        self.assertIsNot(evaluator.evaluator("[ 1 ]")(None), evaluator.evaluator("[ 1 ]")(None))
+
+
+
+if __name__ == "__main__":
+    unittest.main()